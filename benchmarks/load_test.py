@@ -0,0 +1,549 @@
+"""
+load_test.py
+
+Simulates concurrent users of the dashboard against a running server and reports how throughput,
+latency and memory develop with the number of users.
+
+Every simulated user opens the dashboard (the callbacks the browser fires on page load), then
+repeatedly waits a random think time and changes one control of the selection (pollutant, region,
+time span, station types, data type, AQI standard or aggregation) to a random option. Like the
+browser, it then posts one request to /_dash-update-component for every callback depending on that
+control, concurrently and with the current values of all other inputs. The callbacks, their inputs
+and the options of the controls are read from /_dash-dependencies and /_dash-layout, so the requests
+are the ones the real page sends. Updates of outputs are not fed back into the inputs, so chained
+callbacks (e.g. a new value of the comparison dropdown) are not followed.
+
+The users run as asyncio tasks with a minimal HTTP/1.1 client, so no package besides the
+dashboard's is needed and a single process can drive many users. The test runs in stages of
+increasing numbers of users; per stage it reports the throughput, latency percentiles (overall and
+per callback), error rate and, sampled over time, the resident memory (RSS) of the server. The
+report is written as JSON with the settings and environment, and can be compared with an earlier
+report with --baseline.
+
+Without --url a local server is started on synthetic data (or the spreadsheet given with --data)
+and stopped afterwards. Note that this is Flask's development server; to test a production setup,
+start it separately and pass --url and --pid (the pid is needed to sample the server's RSS, which is
+read from /proc and is only available on Linux).
+
+Usage:
+    python load_test.py [--users N ...] [--duration S] [--think-time S] [--rows N] [--output PATH]
+    python load_test.py --url http://127.0.0.1:8002 --pid 1234 [--baseline PATH] ...
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+from urllib.parse import urlsplit
+from urllib.request import urlopen
+
+import numpy as np
+
+SCRIPT_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'scripts'))
+
+# Controls a user changes, with how a random value is drawn from their options
+SELECTION_CONTROLS = {
+    'pollutant-dropdown': 'one',
+    'continent-dropdown': 'one',
+    'from-to': 'range',
+    'station-type-checklist': 'some',
+    'data-type-radio': 'one',
+    'aqi-standard-dropdown': 'one',
+    'aggregation-dropdown': 'one'
+}
+
+# Connections a user keeps open at most, as many as a browser opens per host
+CONNECTIONS_PER_USER = 6
+
+# Percentiles of the latency reported
+PERCENTILES = [50, 90, 95, 99]
+
+
+class HTTPConnection:
+    """
+    A minimal asyncio HTTP/1.1 client connection, reconnecting when the server closes it.
+    """
+
+    def __init__(self, host, port, timeout):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self._reader = None
+        self._writer = None
+
+    async def request(self, method, path, body=b''):
+        """
+        Sends a request and returns the status code and body of the response.
+        """
+        return await asyncio.wait_for(self._request(method, path, body), self.timeout)
+
+    async def _request(self, method, path, body):
+        if self._writer is None:
+            self._reader, self._writer = await asyncio.open_connection(self.host, self.port)
+        head = (f'{method} {path} HTTP/1.1\r\nHost: {self.host}:{self.port}\r\n'
+                f'Content-Type: application/json\r\nContent-Length: {len(body)}\r\n\r\n')
+        self._writer.write(head.encode('ascii') + body)
+        await self._writer.drain()
+
+        status_line = await self._reader.readline()
+        if not status_line:
+            raise ConnectionError('Connection closed by the server')
+        version, status = status_line.split()[:2]
+        headers = {}
+        while True:
+            line = await self._reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        if headers.get('transfer-encoding', '').lower() == 'chunked':
+            parts = []
+            while True:
+                size = int((await self._reader.readline()).split(b';')[0], 16)
+                if size == 0:
+                    await self._reader.readline()
+                    break
+                parts.append(await self._reader.readexactly(size))
+                await self._reader.readline()
+            content = b''.join(parts)
+        elif 'content-length' in headers:
+            content = await self._reader.readexactly(int(headers['content-length']))
+        else:
+            content = await self._reader.read()
+            headers['connection'] = 'close'
+
+        keep_alive = version == b'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+        if not keep_alive:
+            self.close()
+        return int(status), content
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+        self._reader = self._writer = None
+
+
+class DashboardClient:
+    """
+    Reads the callbacks and controls of the dashboard and builds the requests the browser sends.
+
+    Attributes:
+        callbacks: The server side callbacks as dictionaries from /_dash-dependencies, with their name
+                   (the first output) and parsed outputs.
+        props: The initial value of every property of every component, keyed by (id, property).
+        choices: The values a user can choose for every control in SELECTION_CONTROLS.
+    """
+
+    def __init__(self, dependencies, layout):
+        self.callbacks = []
+        for callback in dependencies:
+            # Clientside and pattern-matching callbacks are not sent to the server like this
+            if callback.get('clientside_function') or '{' in callback['output']:
+                continue
+            output = callback['output']
+            parts = output[2:-2].split('...') if output.startswith('..') else [output]
+            callback = dict(callback, outputs=[dict(zip(['id', 'property'], part.rsplit('.', 1))) for part in parts])
+            callback['name'] = parts[0]
+            self.callbacks.append(callback)
+
+        self.props = {}
+        self._collect_props(layout)
+        self.choices = {}
+        for component_id, kind in SELECTION_CONTROLS.items():
+            if kind == 'range':
+                marks = self.props.get((component_id, 'marks')) or {}
+                values = sorted(int(float(mark)) for mark in marks)
+            else:
+                options = self.props.get((component_id, 'options')) or []
+                values = [option['value'] if isinstance(option, dict) else option for option in options]
+            if values:
+                self.choices[component_id] = values
+
+    def _collect_props(self, component):
+        """
+        Walks the layout tree and records the properties of every component with an id.
+        """
+        if isinstance(component, list):
+            for child in component:
+                self._collect_props(child)
+        elif isinstance(component, dict):
+            props = component.get('props', {})
+            if 'id' in props and isinstance(props['id'], str):
+                for name, value in props.items():
+                    if name != 'children' or not isinstance(value, (dict, list)):
+                        self.props[(props['id'], name)] = value
+            self._collect_props(props.get('children'))
+
+    def random_value(self, rng, component_id):
+        """
+        Draws a random value for a control.
+        """
+        values = self.choices[component_id]
+        kind = SELECTION_CONTROLS[component_id]
+        if kind == 'range':
+            return sorted(rng.sample(values, 2)) if len(values) > 1 else [values[0], values[0]]
+        if kind == 'some':
+            return rng.sample(values, rng.randint(1, min(3, len(values))))
+        return rng.choice(values)
+
+    def payload(self, callback, values, changed):
+        """
+        Builds the body of the request of a callback.
+
+        Args:
+            callback (dict): The callback.
+            values (dict): The current value of every property, keyed by (id, property).
+            changed (list): The '<id>.<property>' inputs that triggered the callback.
+
+        Returns:
+            bytes: The JSON body.
+        """
+        def with_values(dependencies):
+            return [dict(dependency, value=values.get((dependency['id'], dependency['property'])))
+                    for dependency in dependencies]
+        outputs = callback['outputs'] if len(callback['outputs']) > 1 else callback['outputs'][0]
+        return json.dumps({'output': callback['output'], 'outputs': outputs,
+                           'inputs': with_values(callback['inputs']), 'state': with_values(callback.get('state', [])),
+                           'changedPropIds': changed}).encode('utf-8')
+
+    def triggered_by(self, component_id, prop='value'):
+        """
+        Returns the callbacks with the property of a component among their inputs.
+        """
+        return [callback for callback in self.callbacks
+                if any(i['id'] == component_id and i['property'] == prop for i in callback['inputs'])]
+
+    def initial_callbacks(self):
+        """
+        Returns the callbacks the browser fires when the page is loaded.
+        """
+        return [callback for callback in self.callbacks if not callback.get('prevent_initial_call')]
+
+
+def read_rss_mb(pid):
+    """
+    Returns the resident memory of a process in MB, None if it cannot be read (e.g. not on Linux).
+    """
+    if pid is None:
+        return None
+    try:
+        with open(f'/proc/{pid}/status') as status:
+            for line in status:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        return None
+    return None
+
+
+def latency_summary(latencies):
+    """
+    Returns the count, mean, percentiles and maximum of latencies in ms.
+    """
+    if not len(latencies):
+        return {'count': 0}
+    latencies = np.asarray(latencies) * 1e3
+    summary = {'count': int(len(latencies)), 'mean_ms': round(float(latencies.mean()), 2)}
+    for percentile, value in zip(PERCENTILES, np.percentile(latencies, PERCENTILES)):
+        summary[f'p{percentile}_ms'] = round(float(value), 2)
+    summary['max_ms'] = round(float(latencies.max()), 2)
+    return summary
+
+
+class LoadTest:
+    """
+    Runs the stages of a load test and collects the results.
+
+    Attributes:
+        client: The DashboardClient describing the requests.
+        host, port: The address of the server.
+        pid: The process id of the server, None if its memory is not sampled.
+        settings: The parsed command line arguments.
+    """
+
+    def __init__(self, client, host, port, pid, settings):
+        self.client = client
+        self.host = host
+        self.port = port
+        self.pid = pid
+        self.settings = settings
+
+    async def _send(self, pool, record, callback, values, changed):
+        """
+        Posts one callback request on a free connection of the user and records its latency.
+        """
+        connection = await pool.get()
+        body = self.client.payload(callback, values, changed)
+        start = time.perf_counter()
+        try:
+            status, _ = await connection.request('POST', '/_dash-update-component', body)
+            error = None if status < 400 else f'HTTP {status}'
+        except (OSError, asyncio.TimeoutError, ValueError, asyncio.IncompleteReadError) as e:
+            connection.close()
+            error = type(e).__name__
+        end = time.perf_counter()
+        pool.put_nowait(connection)
+        record(end, callback['name'], end - start, error)
+
+    async def _user(self, seed, deadline, record, actions):
+        """
+        Simulates one user until the deadline: the page load, then changes of random controls.
+        """
+        rng = random.Random(seed)
+        pool = asyncio.Queue()
+        for _ in range(CONNECTIONS_PER_USER):
+            pool.put_nowait(HTTPConnection(self.host, self.port, self.settings.timeout))
+        values = dict(self.client.props)
+        try:
+            # Page load: every callback without prevent_initial_call, triggered by its inputs
+            await asyncio.gather(*[
+                self._send(pool, record, callback, values, [f"{i['id']}.{i['property']}" for i in callback['inputs']])
+                for callback in self.client.initial_callbacks()])
+            controls = list(self.client.choices)
+            while time.perf_counter() < deadline:
+                if self.settings.think_time > 0:
+                    await asyncio.sleep(min(rng.expovariate(1 / self.settings.think_time),
+                                            max(deadline - time.perf_counter(), 0)))
+                    if time.perf_counter() >= deadline:
+                        break
+                control = rng.choice(controls)
+                values[(control, 'value')] = self.client.random_value(rng, control)
+                await asyncio.gather(*[self._send(pool, record, callback, dict(values), [f'{control}.value'])
+                                       for callback in self.client.triggered_by(control)])
+                actions.append(time.perf_counter())
+        finally:
+            while not pool.empty():
+                pool.get_nowait().close()
+
+    async def run_stage(self, users):
+        """
+        Runs one stage with a number of concurrent users and returns its results.
+        """
+        settings = self.settings
+        requests, actions, samples = [], [], []
+        start = time.perf_counter()
+        deadline = start + settings.duration
+
+        def record(end, name, latency, error):
+            requests.append((end - start, name, latency, error))
+
+        async def sample():
+            while True:
+                samples.append((time.perf_counter() - start, read_rss_mb(self.pid)))
+                await asyncio.sleep(settings.sample_interval)
+
+        sampler = asyncio.create_task(sample())
+        await asyncio.gather(*[self._user(settings.seed * 100_003 + users * 1009 + i, deadline, record, actions)
+                               for i in range(users)])
+        elapsed = time.perf_counter() - start
+        sampler.cancel()
+        samples.append((elapsed, read_rss_mb(self.pid)))
+
+        latencies = [latency for _, _, latency, error in requests if error is None]
+        errors = [error for _, _, _, error in requests if error is not None]
+        per_callback = {}
+        for name in sorted({name for _, name, _, _ in requests}):
+            per_callback[name] = latency_summary([latency for _, n, latency, error in requests
+                                                  if n == name and error is None])
+            per_callback[name]['errors'] = sum(1 for _, n, _, error in requests if n == name and error is not None)
+
+        # Completed requests, errors and p95 per sampling interval, with the RSS at its end
+        timeline = []
+        for i, (t, rss) in enumerate(samples[1:], start=1):
+            window = [(latency, error) for end, _, latency, error in requests if samples[i - 1][0] <= end < t]
+            ok = [latency for latency, error in window if error is None]
+            timeline.append({'t_s': round(t, 2), 'requests': len(window),
+                             'errors': sum(1 for _, error in window if error is not None),
+                             'p95_ms': round(float(np.percentile(ok, 95)) * 1e3, 2) if ok else None,
+                             'rss_mb': round(rss, 1) if rss is not None else None})
+
+        rss_values = [rss for _, rss in samples if rss is not None]
+        return {
+            'users': users,
+            'elapsed_s': round(elapsed, 2),
+            'requests': len(requests),
+            'actions': len(actions),
+            'throughput_rps': round(len(requests) / elapsed, 2),
+            'actions_per_s': round(len(actions) / elapsed, 2),
+            'errors': len(errors),
+            'error_rate': round(len(errors) / len(requests), 4) if requests else 0.0,
+            'error_types': {error: errors.count(error) for error in sorted(set(errors))},
+            'latency': latency_summary(latencies),
+            'callbacks': per_callback,
+            'rss_mb': {'start': rss_values[0], 'max': max(rss_values), 'end': rss_values[-1]} if rss_values else None,
+            'timeline': timeline
+        }
+
+
+def fetch_json(url, timeout=60):
+    """
+    Returns the JSON document at a URL.
+    """
+    with urlopen(url, timeout=timeout) as response:
+        return json.loads(response.read())
+
+
+def run_server(port, rows, data_path, backend):
+    """
+    Serves the dashboard on synthetic data (or a spreadsheet) with Flask's threaded development
+    server and HTTP/1.1 keep-alive. Runs until the process is stopped.
+    """
+    from werkzeug.serving import WSGIRequestHandler
+    from dash import Dash
+    import dash_bootstrap_components as dbc
+    from synthetic_data import generate_air_quality_data
+    from data_manager import AirQualityData
+    from layout_manager import AirQualityLayout
+    from callback_manager import AirQualityCallbacks
+
+    if data_path:
+        data = AirQualityData(data_path, backend=backend)
+    else:
+        data = AirQualityData.from_dataframe(generate_air_quality_data(rows), backend=backend)
+    app = Dash(__name__, assets_folder=os.path.join(SCRIPT_PATH, 'assets'),
+               external_stylesheets=[dbc.themes.BOOTSTRAP])
+    AirQualityLayout(app, data)
+    AirQualityCallbacks(app, data)
+    WSGIRequestHandler.protocol_version = 'HTTP/1.1'
+    app.run(host='127.0.0.1', port=port, debug=False, threaded=True)
+
+
+def start_server(args):
+    """
+    Starts a local server in a subprocess and waits until it answers. Returns the process.
+    """
+    command = [sys.executable, os.path.abspath(__file__), '--serve', '--port', str(args.port),
+               '--rows', str(args.rows), '--backend', args.backend]
+    if args.data:
+        command += ['--data', args.data]
+    process = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    deadline = time.time() + args.startup_timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"The server exited: {process.stderr.read().decode(errors='replace')[-2000:]}")
+        try:
+            fetch_json(f'http://127.0.0.1:{args.port}/_dash-layout', timeout=5)
+            return process
+        except OSError:
+            time.sleep(0.5)
+    process.terminate()
+    raise RuntimeError(f'The server did not answer within {args.startup_timeout} s')
+
+
+def git_commit():
+    """
+    Returns the commit of the working tree, None outside of a git repository.
+    """
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_stage(stage):
+    """
+    Prints the summary line of a stage.
+    """
+    latency = stage['latency']
+    rss = f"{stage['rss_mb']['max']:.0f} MB" if stage['rss_mb'] else 'n/a'
+    print(f"  {stage['users']:>4} users  {stage['throughput_rps']:8.1f} req/s  "
+          f"p50 {latency.get('p50_ms', float('nan')):8.1f} ms  p95 {latency.get('p95_ms', float('nan')):8.1f} ms  "
+          f"p99 {latency.get('p99_ms', float('nan')):8.1f} ms  errors {stage['error_rate']:6.2%}  max RSS {rss}")
+
+
+def print_comparison(report, baseline):
+    """
+    Prints the change of throughput and p95 latency against a baseline report, per number of users.
+    """
+    stages = {stage['users']: stage for stage in baseline['stages']}
+    print(f"\nCompared with {baseline['environment'].get('commit') or 'the baseline'}:")
+    compared = 0
+    for stage in report['stages']:
+        before = stages.get(stage['users'])
+        if before is None or not before['requests'] or not stage['requests']:
+            continue
+        compared += 1
+        throughput = stage['throughput_rps'] / before['throughput_rps'] - 1
+        p95 = stage['latency']['p95_ms'] / before['latency']['p95_ms'] - 1
+        print(f"  {stage['users']:>4} users  throughput {throughput:+7.1%}  p95 {p95:+7.1%}  "
+              f"errors {before['error_rate']:6.2%} -> {stage['error_rate']:6.2%}")
+    if not compared:
+        print('  no stage with the same number of users')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test the dashboard with simulated concurrent users.')
+    parser.add_argument('--url', default=None, help='URL of a running dashboard (default: start a local server).')
+    parser.add_argument('--pid', type=int, default=None, help='Process id of the server at --url, to sample its RSS.')
+    parser.add_argument('--users', type=int, nargs='+', default=[1, 2, 4, 8, 16],
+                        help='Numbers of concurrent users, one stage each.')
+    parser.add_argument('--duration', type=float, default=30, help='Duration of every stage in seconds.')
+    parser.add_argument('--think-time', type=float, default=1.0,
+                        help='Mean time in seconds a user waits between changes (exponential), 0 for none.')
+    parser.add_argument('--timeout', type=float, default=60, help='Timeout of a request in seconds.')
+    parser.add_argument('--sample-interval', type=float, default=1.0, help='Interval of the timeline in seconds.')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the random selections.')
+    parser.add_argument('--output', default=None, help='Where to write the JSON report.')
+    parser.add_argument('--baseline', default=None, help='A previous JSON report to compare with.')
+    parser.add_argument('--rows', type=int, default=40000, help='Number of generated rows of the local server.')
+    parser.add_argument('--data', default=None, help='Spreadsheet served by the local server instead of generated data.')
+    parser.add_argument('--backend', default='pandas', help="Query backend of the local server ('pandas' or 'duckdb').")
+    parser.add_argument('--port', type=int, default=8050, help='Port of the local server.')
+    parser.add_argument('--startup-timeout', type=float, default=300, help='Seconds to wait for the local server.')
+    parser.add_argument('--serve', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        run_server(args.port, args.rows, args.data, args.backend)
+        return
+
+    process = None
+    if args.url is None:
+        start = time.perf_counter()
+        process = start_server(args)
+        args.url, args.pid = f'http://127.0.0.1:{args.port}', process.pid
+        print(f"local server on {args.url} ({args.data or f'{args.rows} generated rows'}), "
+              f"started in {time.perf_counter() - start:.1f} s")
+
+    try:
+        url = urlsplit(args.url)
+        base = args.url.rstrip('/')
+        client = DashboardClient(fetch_json(f'{base}/_dash-dependencies'), fetch_json(f'{base}/_dash-layout'))
+        load_test = LoadTest(client, url.hostname, url.port or 80, args.pid, args)
+        print(f"{len(client.callbacks)} callbacks, stages of {args.duration:.0f} s, think time {args.think_time} s")
+
+        stages = []
+        for users in args.users:
+            stage = asyncio.run(load_test.run_stage(users))
+            print_stage(stage)
+            stages.append(stage)
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+
+    settings = {key: value for key, value in vars(args).items() if key not in ('serve', 'output', 'baseline', 'pid')}
+    report = {
+        'settings': settings,
+        'environment': {'commit': git_commit(), 'python': platform.python_version(), 'platform': platform.platform(),
+                        'cpu_count': os.cpu_count(), 'time': time.strftime('%Y-%m-%dT%H:%M:%S%z')},
+        'stages': stages
+    }
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=2)
+        print(f"report written to {args.output}")
+    if args.baseline:
+        with open(args.baseline) as file:
+            print_comparison(report, json.load(file))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+"""
+overlay_benchmark.py
+
+Measures how much the statistics overlays (standard error band, year-over-year change and trend)
+add to the update callback of the main plot for the Europe view.
+
+Usage:
+    python overlay_benchmark.py [--rows N] [--repeat N]
+"""
+
+import argparse
+import time
+
+import numpy as np
+from dash import Dash
+
+from synthetic_data import generate_air_quality_data
+from data_manager import AirQualityData
+from callback_manager import AirQualityCallbacks
+from series_statistics import series_statistics
+
+OVERLAYS = ['standard_error', 'yoy_change', 'trend']
+
+
+def time_call(function, repeat, *args):
+    """
+    Returns the median wall time of a function over `repeat` calls, after one warm up call.
+    """
+    function(*args)
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(*args)
+        timings.append(time.perf_counter() - start)
+    return float(np.median(timings))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the statistics overlays of the main plot.')
+    parser.add_argument('--rows', type=int, default=40000, help='Number of generated rows.')
+    parser.add_argument('--repeat', type=int, default=10, help='Number of timed calls per variant.')
+    args = parser.parse_args()
+
+    data = AirQualityData.from_dataframe(generate_air_quality_data(args.rows))
+    callbacks = AirQualityCallbacks(Dash(__name__), data)
+    selection = ('pm25_concentration', '4_Eur', [2013, 2022], ['all'], 'Concentration', 'us_epa', 'mean')
+
+    without = time_call(callbacks.update_graph, args.repeat, *selection, [])
+    with_overlays = time_call(callbacks.update_graph, args.repeat, *selection, OVERLAYS)
+    europe = data.filter_data([2013, 2022], ['all'], '4_Eur')
+    kernel = time_call(series_statistics, args.repeat, europe, 'country_name', 'pm25_concentration')
+
+    print(f"rows: {len(data.df)}, Europe rows: {len(europe)}, countries: {europe['country_name'].nunique()}")
+    print(f"update_graph without overlays: {without * 1e3:8.1f} ms")
+    print(f"update_graph with overlays:    {with_overlays * 1e3:8.1f} ms ({(with_overlays / without - 1) * 100:+.1f} %)")
+    print(f"statistics kernel alone:       {kernel * 1e3:8.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
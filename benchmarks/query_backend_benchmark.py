@@ -0,0 +1,97 @@
+"""
+query_backend_benchmark.py
+
+Compares the query backends (see scripts/query_backend.py) on the queries the update callback of
+the main plot runs for one selection: the time series per region or country, the standard error
+moments, the city ranking and the station heatmap.
+
+The DuckDB backends require the duckdb package (pip install duckdb).
+
+Usage:
+    python query_backend_benchmark.py [--rows N] [--repeat N] [--parquet PATH] [--backends NAME ...]
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from synthetic_data import generate_air_quality_data
+from data_manager import AirQualityData
+from query_backend import DuckDBBackend, PandasBackend
+
+# (label, selected_year, selected_station_types, selected_continent, group column of the time series)
+SELECTIONS = [
+    ('World, all stations', [2013, 2022], ['all'], '', 'who_region'),
+    ('Europe, urban and traffic', [2015, 2020], ['Urban', 'Traffic'], '4_Eur', 'country_name'),
+]
+
+
+def callback_queries(backend, selected_year, selected_station_types, selected_continent, group_column,
+                     value='pm25_concentration', mode='mean'):
+    """
+    Runs the queries of one update of the main plot and returns the number of rows returned.
+    """
+    selection = (selected_year, selected_station_types, selected_continent)
+    results = [
+        backend.aggregate(*selection, [group_column, 'year'], value, mode),
+        backend.moments(*selection, [group_column, 'year'], value),
+        backend.aggregate(*selection, ['city'], value, mode),
+        backend.aggregate(*selection, ['latitude', 'longitude'], value),
+    ]
+    return sum(len(result) for result in results)
+
+
+def time_queries(backend, repeat, selected_year, selected_station_types, selected_continent, group_column, mode):
+    """
+    Returns the median wall time of the queries of one update over `repeat` updates, after one warm up.
+    The first year alternates between updates, so that no backend answers from the previous selection.
+    """
+    timings = []
+    for i in range(repeat + 1):
+        year = [selected_year[0] + i % 2, selected_year[1]]
+        start = time.perf_counter()
+        callback_queries(backend, year, selected_station_types, selected_continent, group_column, mode=mode)
+        timings.append(time.perf_counter() - start)
+    return float(np.median(timings[1:]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the pandas and DuckDB query backends.')
+    parser.add_argument('--rows', type=int, default=10_000_000, help='Number of generated rows.')
+    parser.add_argument('--repeat', type=int, default=5, help='Number of timed calls per query set.')
+    parser.add_argument('--parquet', default=None, help='Where to write the Parquet file (default: a temporary file).')
+    parser.add_argument('--backends', nargs='+', choices=['pandas', 'duckdb-memory', 'duckdb-parquet'],
+                        default=['pandas', 'duckdb-memory', 'duckdb-parquet'],
+                        help='Backends to compare. duckdb-memory holds a second copy of the data in memory.')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    data = AirQualityData.from_dataframe(generate_air_quality_data(args.rows))
+    print(f"rows: {len(data.df)}, generated and processed in {time.perf_counter() - start:.1f} s")
+
+    parquet_path = args.parquet or os.path.join(tempfile.mkdtemp(), 'air_quality.parquet')
+    backends = {'pandas': lambda: PandasBackend(data),
+                'duckdb-memory': lambda: DuckDBBackend.from_dataframe(data.df),
+                'duckdb-parquet': lambda: DuckDBBackend.from_dataframe(data.df, parquet_path)}
+
+    for name in args.backends:
+        create = backends[name]
+        start = time.perf_counter()
+        backend = create()
+        print(f"\n{name}: set up in {time.perf_counter() - start:.2f} s")
+        for label, *selection in SELECTIONS:
+            for mode in ['mean', 'median']:
+                rows = callback_queries(backend, *selection, mode=mode)
+                timing = time_queries(backend, args.repeat, *selection, mode)
+                print(f"  {label:<28} {mode:<7} {timing * 1e3:9.1f} ms ({rows} aggregated rows)")
+        del backend
+
+    if not args.parquet and os.path.exists(parquet_path):
+        os.remove(parquet_path)
+
+
+if __name__ == '__main__':
+    main()
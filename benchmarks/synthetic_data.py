@@ -0,0 +1,99 @@
+"""
+synthetic_data.py
+
+Generates air quality data in the layout of the WHO ambient air quality database, so that the
+benchmarks can run without the (large, separately downloaded) spreadsheet and at any size.
+"""
+
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+SCRIPT_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'scripts'))
+if SCRIPT_PATH not in sys.path:
+    sys.path.append(SCRIPT_PATH)
+
+# Number of countries per WHO region, roughly as in the real database
+COUNTRIES_PER_REGION = {
+    '1_Afr': 20,
+    '2_Amr': 20,
+    '3_Sear': 10,
+    '4_Eur': 45,
+    '5_Emr': 15,
+    '6_Wpr': 20,
+    '7_NonMS': 3
+}
+
+STATION_TYPES = ['Urban', 'Rural', 'Suburban', 'Urban Traffic', 'Background', 'Industrial', 'Traffic',
+                 'Residential And Commercial Area', 'Urban Traffic/Residential And Commercial Area', None]
+
+
+def _categorical(codes, labels):
+    """
+    Builds a categorical column from integer codes into labels, with the categories sorted like
+    the categoricals created from text columns when the data is processed.
+    """
+    labels = np.asarray(labels)
+    order = np.argsort(labels)
+    rank = np.empty_like(order)
+    rank[order] = np.arange(len(order))
+    return pd.Categorical.from_codes(rank[codes], labels[order])
+
+
+def generate_air_quality_data(n_rows=40000, years=(2010, 2022), stations_per_city=3, seed=0):
+    """
+    Generates a DataFrame with the columns of the WHO spreadsheet.
+
+    Args:
+        n_rows (int): Approximate number of rows (station-years).
+        years (tuple): First and last year.
+        stations_per_city (int): Average number of stations per city.
+        seed (int): Seed of the random generator.
+
+    Returns:
+        DataFrame: The generated data.
+    """
+    rng = np.random.default_rng(seed)
+    regions = np.repeat(list(COUNTRIES_PER_REGION), list(COUNTRIES_PER_REGION.values()))
+    n_countries = len(regions)
+    country_level = rng.gamma(2.0, 8.0, n_countries)
+    country_lat = rng.uniform(-50, 65, n_countries)
+    country_lon = rng.uniform(-170, 170, n_countries)
+
+    n_years = years[1] - years[0] + 1
+    n_stations = max(n_rows // n_years, 1)
+    n_cities = max(n_stations // stations_per_city, 1)
+    city_country = rng.integers(0, n_countries, n_cities)
+    station_city = rng.integers(0, n_cities, n_stations)
+    station_country = city_country[station_city]
+    station_lat = np.clip(country_lat[station_country] + rng.normal(0, 2, n_stations), -89, 89)
+    station_lon = np.clip(country_lon[station_country] + rng.normal(0, 2, n_stations), -179, 179)
+    station_type = np.array(STATION_TYPES, dtype=object)[rng.integers(0, len(STATION_TYPES), n_stations)]
+
+    # Every station reports every year with a slowly drifting level
+    station = np.repeat(np.arange(n_stations), n_years)
+    year = np.tile(np.arange(years[0], years[1] + 1), n_stations)
+    country = station_country[station]
+    drift = 1 + rng.normal(0, 0.02, n_countries)[country] * (year - years[0])
+    level = country_level[country] * drift * rng.lognormal(0, 0.3, len(station))
+
+    # Text columns are built as categoricals from codes, so that millions of rows fit in memory
+    countries = np.arange(n_countries).astype(str)
+    df = pd.DataFrame({
+        'who_region': _categorical(np.searchsorted(list(COUNTRIES_PER_REGION), regions)[country], list(COUNTRIES_PER_REGION)),
+        'iso3': _categorical(country, np.char.add('C', np.char.zfill(countries, 2))),
+        'country_name': _categorical(country, np.char.add('Country ', countries)),
+        'city': _categorical(station_city[station], np.char.add('City ', np.arange(n_cities).astype(str))),
+        'year': year.astype(float),
+        'version': 'V6.1',
+        'pm10_concentration': level * 1.8,
+        'pm25_concentration': level,
+        'no2_concentration': np.where(rng.random(len(station)) < 0.3, np.nan, level * 1.2),
+        'type_of_stations': pd.Categorical(station_type)[station],
+        'population': rng.integers(10_000, 5_000_000, n_cities)[station_city[station]].astype(float),
+        'latitude': station_lat[station],
+        'longitude': station_lon[station],
+    })
+    return df
@@ -0,0 +1,123 @@
+"""
+aggregation.py
+
+Aggregation modes for the pollutant time series and rankings. All modes are vectorized groupby
+reductions over the categorical group columns prepared when the data is loaded, so switching the
+mode does not add per group Python loops to the callbacks.
+"""
+
+import numpy as np
+import pandas as pd
+
+# Available aggregation modes and their labels in the dashboard
+AGGREGATION_MODES = {
+    'mean': 'Mean',
+    'station_weighted': 'Station-weighted mean',
+    'population_weighted': 'Population-weighted mean',
+    'median': 'Median',
+    'percentile': 'Median with 25th-75th percentile band'
+}
+
+# Lower and upper quantile of the band drawn in 'percentile' mode
+PERCENTILE_BAND = (0.25, 0.75)
+
+# Columns holding the row weights of the weighted modes that do not depend on the selection
+WEIGHT_COLUMNS = {
+    'population_weighted': 'population'
+}
+
+# Columns of the period a row belongs to, the first one present is used: 'period' for the finer
+# rollups of timestamped data (see temporal_rollups.py), 'year' otherwise
+PERIOD_COLUMNS = ['period', 'year']
+
+
+def period_column(columns):
+    """
+    Returns the column of the period a row belongs to, see PERIOD_COLUMNS.
+
+    Args:
+        columns (iterable): The columns of the data.
+
+    Returns:
+        str: 'period' or 'year'.
+    """
+    return next(column for column in PERIOD_COLUMNS if column in columns)
+
+
+def station_weights(df, value):
+    """
+    Computes the row weights of the station-weighted mode over the rows of a selection.
+
+    A city with many stations contributes one row per station and year, so its readings would swamp
+    cities with a single station. The station weight is the inverse number of rows of the same city
+    and period that have a value, which lets every city count once per period. It depends on the
+    selected station types and on the pollutant, so it is computed per query.
+
+    Args:
+        df (DataFrame): The (filtered) air quality data with a 'city' column.
+        value (str): The column aggregated.
+
+    Returns:
+        np.ndarray: The weight of every row, 0 where the value is missing.
+    """
+    present = df[value].notna()
+    period = period_column(df.columns)
+    counts = present.groupby([df['city'], df[period]], observed=True, dropna=False).transform('sum').to_numpy(dtype=float)
+    return np.divide(1.0, counts, out=np.zeros(len(df)), where=present.to_numpy())
+
+
+def available_modes(df):
+    """
+    Returns the aggregation modes that can be computed for the data.
+
+    Args:
+        df (DataFrame): The air quality data.
+
+    Returns:
+        list: Keys of AGGREGATION_MODES, without 'population_weighted' if the data has no population.
+    """
+    return [mode for mode in AGGREGATION_MODES
+            if mode not in WEIGHT_COLUMNS or WEIGHT_COLUMNS[mode] in df.columns]
+
+
+def aggregate(df, by, value, mode='mean'):
+    """
+    Aggregates a value column per group.
+
+    Args:
+        df (DataFrame): The (filtered) air quality data.
+        by (list): The columns to group by, e.g. ['who_region', 'year'].
+        value (str): The column to aggregate.
+        mode (str): One of the keys of AGGREGATION_MODES.
+
+    Returns:
+        DataFrame: Indexed by the group columns with the aggregate in column `value`. In 'percentile'
+                   mode the columns 'lower' and 'upper' hold the bounds of the percentile band.
+    """
+    if mode not in AGGREGATION_MODES:
+        raise ValueError(f"Unsupported aggregation mode '{mode}'")
+    grouped = df.groupby(by, observed=True)[value]
+
+    if mode == 'mean':
+        return grouped.mean().to_frame(value)
+    if mode == 'median':
+        return grouped.median().to_frame(value)
+    if mode == 'percentile':
+        lower, upper = PERCENTILE_BAND
+        # Reindexed, as an empty selection has no quantile columns to unstack
+        quantiles = grouped.quantile([lower, 0.5, upper]).unstack().reindex(columns=[lower, 0.5, upper])
+        quantiles.columns = ['lower', value, 'upper']
+        return quantiles[[value, 'lower', 'upper']]
+
+    # Weighted mean: sum(w * x) / sum(w), ignoring the weight of missing values
+    values = df[value].to_numpy(dtype=float)
+    if mode == 'station_weighted':
+        weights = station_weights(df, value)
+    else:
+        weight_column = WEIGHT_COLUMNS[mode]
+        if weight_column not in df.columns:
+            raise ValueError(f"Aggregation mode '{mode}' requires a '{weight_column}' column")
+        weights = np.where(np.isnan(values), 0.0, df[weight_column].to_numpy(dtype=float))
+    sums = pd.DataFrame({'weighted': np.nan_to_num(values) * weights, 'weight': weights}, index=df.index)
+    sums = sums.groupby([df[column] for column in by], observed=True).sum()
+    return (sums['weighted'] / sums['weight'].replace(0.0, np.nan)).to_frame(value)
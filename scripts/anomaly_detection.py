@@ -0,0 +1,204 @@
+"""
+anomaly_detection.py
+
+Batch detection of sharp year-over-year changes and of WHO guideline exceedances for every city
+and pollutant. The yearly means of all cities are laid out as one (city, year) matrix per
+pollutant, and the changes, their robust z-scores and the exceedances are computed with NumPy over
+the whole matrix at once. Large inputs can be split by city over a process pool, which the
+command line run uses by default. The result is a precomputed table that the dashboard only filters.
+
+The robust z-score of a change compares it with the other changes of the same series, using the
+median and the median absolute deviation (MAD) instead of mean and standard deviation, so that the
+jumps searched for do not mask themselves (Iglewicz and Hoaglin). Scores of at least
+ANOMALY_THRESHOLD in absolute value are flagged as anomalies.
+
+Usage:
+    python anomaly_detection.py DATA_PATH [--output anomalies.csv] [--workers N]
+"""
+
+import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from aqi_standards import get_standard
+
+# Pollutant columns analysed
+POLLUTANTS = ['pm25_concentration', 'pm10_concentration', 'no2_concentration']
+
+# Columns identifying a city (a city name alone is not unique across countries)
+CITY_KEYS = ['who_region', 'country_name', 'city']
+
+# Absolute robust z-score from which a change is flagged as anomaly (Iglewicz and Hoaglin)
+ANOMALY_THRESHOLD = 3.5
+
+# Minimum number of year-over-year changes a series needs for its changes to be scored
+MIN_CHANGES = 4
+
+# Scale making the MAD of normally distributed values comparable to their standard deviation
+MAD_SCALE = 0.6745
+
+# Number of rows from which the detection is split over a process pool
+PARALLEL_MIN_ROWS = 2_000_000
+
+
+def robust_z_scores(matrix, min_changes=MIN_CHANGES):
+    """
+    Computes the year-over-year changes of every series (row) of a matrix and their robust z-scores
+    within the series.
+
+    Args:
+        matrix (np.ndarray): The yearly values, shape (series, consecutive years), NaN for missing years.
+        min_changes (int): The minimum number of changes of a series to be scored.
+
+    Returns:
+        tuple: The changes and the z-scores, both of the shape of the matrix; the first year and
+               changes next to a missing year are NaN, as are the scores of series with too few
+               changes or without spread (MAD of 0).
+    """
+    changes = np.full(matrix.shape, np.nan)
+    changes[:, 1:] = np.diff(matrix, axis=1)
+    scores = np.full(matrix.shape, np.nan)
+    if not matrix.size:
+        return changes, scores
+
+    valid = (~np.isnan(changes)).sum(axis=1) >= min_changes
+    if valid.any():
+        with np.errstate(invalid='ignore', divide='ignore'):
+            median = np.nanmedian(changes[valid], axis=1, keepdims=True)
+            mad = np.nanmedian(np.abs(changes[valid] - median), axis=1, keepdims=True)
+            scores[valid] = np.where(mad > 0, MAD_SCALE * (changes[valid] - median) / mad, np.nan)
+    return changes, scores
+
+
+def _detect(df, pollutants, guidelines):
+    """
+    Computes the anomaly table of the cities in a DataFrame, see detect_anomalies().
+    """
+    keys = CITY_KEYS + ['year']
+    values = df[pollutants]
+    grouped = values.groupby([df[key] for key in keys], observed=True)
+    means = grouped.mean()
+    records = values.notna().groupby([df[key] for key in keys], observed=True).sum()
+    exceeding = pd.DataFrame({pollutant: values[pollutant] > guidelines[pollutant] for pollutant in pollutants})
+    exceeding = exceeding.groupby([df[key] for key in keys], observed=True).sum()
+
+    tables = []
+    for pollutant in pollutants:
+        # One row per city, one column per consecutive year, so that changes only span adjacent years
+        matrix = means[pollutant].unstack('year')
+        if matrix.empty:
+            continue
+        years = pd.Index(np.arange(int(matrix.columns.min()), int(matrix.columns.max()) + 1, dtype=float), name='year')
+        matrix = matrix.reindex(columns=years)
+        changes, scores = robust_z_scores(matrix.to_numpy(dtype=float))
+
+        table = pd.DataFrame({
+            'value': matrix.stack(future_stack=True),
+            'yoy_change': pd.DataFrame(changes, index=matrix.index, columns=years).stack(future_stack=True),
+            'robust_z': pd.DataFrame(scores, index=matrix.index, columns=years).stack(future_stack=True)
+        }).dropna(subset=['value'])
+        table['records'] = records[pollutant].reindex(table.index).to_numpy()
+        table['records_above_guideline'] = exceeding[pollutant].reindex(table.index).to_numpy()
+        table['guideline_ratio'] = table['value'] / guidelines[pollutant]
+        table.insert(0, 'pollutant', pollutant)
+        tables.append(table.reset_index())
+    return tables
+
+
+def detect_anomalies(df, pollutants=None, workers=None, parallel_min_rows=PARALLEL_MIN_ROWS):
+    """
+    Computes the anomaly and exceedance table of every city and pollutant.
+
+    Args:
+        df (DataFrame): The air quality data with the columns of CITY_KEYS, 'year' and the pollutants.
+        pollutants (list): The pollutant columns, defaults to POLLUTANTS.
+        workers (int): The number of processes for large inputs, defaults to the number of CPUs. Pass 1
+                       where a process pool must not be started, e.g. within a request of the dashboard.
+        parallel_min_rows (int): The number of rows from which the work is split over processes.
+
+    Returns:
+        DataFrame: One row per city, pollutant and year with a value: the columns of CITY_KEYS,
+                   'pollutant', 'year', the mean 'value', 'yoy_change' to the previous year,
+                   'robust_z' of the change, the number of 'records' with a value (rows of the data,
+                   e.g. one per station and year), 'records_above_guideline' and 'guideline_ratio'
+                   (the mean relative to the WHO 2021 guideline).
+    """
+    guidelines = get_standard('who_2021').guidelines
+    pollutants = [pollutant for pollutant in (pollutants or POLLUTANTS)
+                  if pollutant in df.columns and pollutant.split('_')[0] in guidelines]
+    guidelines = {pollutant: guidelines[pollutant.split('_')[0]] for pollutant in pollutants}
+    df = df[CITY_KEYS + ['year'] + pollutants]
+
+    workers = workers or os.cpu_count() or 1
+    if workers > 1 and len(df) >= parallel_min_rows:
+        # Whole cities per chunk, so that every series is scored within one process
+        codes = df['city'].cat.codes.to_numpy() if isinstance(df['city'].dtype, pd.CategoricalDtype) \
+            else pd.factorize(df['city'])[0]
+        chunk = np.maximum(codes, 0) % workers
+        chunks = [df[chunk == i] for i in range(workers)]
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            tables = [table for result in pool.map(_detect, chunks, [pollutants] * workers, [guidelines] * workers)
+                      for table in result]
+    else:
+        tables = _detect(df, pollutants, guidelines)
+
+    columns = CITY_KEYS + ['pollutant', 'year', 'value', 'yoy_change', 'robust_z', 'records',
+                           'records_above_guideline', 'guideline_ratio']
+    if not tables:
+        return pd.DataFrame(columns=columns)
+    table = pd.concat(tables, ignore_index=True)[columns]
+    table['pollutant'] = table['pollutant'].astype('category')
+    table[['records', 'records_above_guideline']] = table[['records', 'records_above_guideline']].astype(np.int32)
+    return table
+
+
+def top_anomalies(table, pollutant, selected_year, selected_continent='', n=10, threshold=ANOMALY_THRESHOLD):
+    """
+    Returns the strongest year-over-year anomalies of a pollutant in a selection, strongest first.
+
+    Args:
+        table (DataFrame): The result of detect_anomalies().
+        pollutant (str): The pollutant column.
+        selected_year (list): The range of years selected, the year of the change must lie within.
+        selected_continent (str): The region code selected, '' for the whole world.
+        n (int): The maximum number of anomalies returned.
+        threshold (float): The minimum absolute robust z-score.
+
+    Returns:
+        DataFrame: The rows of the anomalies.
+    """
+    mask = (table['pollutant'] == pollutant).to_numpy() & (table['robust_z'].abs() >= threshold).to_numpy()
+    if selected_year[0] != 'all':
+        mask &= (table['year'] >= int(selected_year[0])).to_numpy()
+    if selected_year[1] != 'all':
+        mask &= (table['year'] <= int(selected_year[1])).to_numpy()
+    if selected_continent:
+        mask &= (table['who_region'] == selected_continent).to_numpy()
+    selected = table[mask]
+    return selected.loc[selected['robust_z'].abs().sort_values(ascending=False).index[:n]]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Detect year-over-year anomalies and WHO guideline exceedances.')
+    parser.add_argument('data_path', help='The WHO spreadsheet (or another supported data file).')
+    parser.add_argument('--sheet', default='Update 2024 (V6.1)', help='The sheet of the spreadsheet.')
+    parser.add_argument('--output', default='anomalies.csv', help='Where to write the table (CSV or Parquet).')
+    parser.add_argument('--workers', type=int, default=None, help='Number of processes (default: number of CPUs).')
+    args = parser.parse_args()
+
+    from data_manager import AirQualityData
+    df, _, _ = AirQualityData.load_data(args.data_path, args.sheet)
+    table = detect_anomalies(df, workers=args.workers)
+    if args.output.endswith('.parquet'):
+        table.to_parquet(args.output, index=False)
+    else:
+        table.to_csv(args.output, index=False)
+    flagged = (table['robust_z'].abs() >= ANOMALY_THRESHOLD).sum()
+    print(f"{len(table)} city-years, {flagged} anomalies, written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
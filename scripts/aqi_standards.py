@@ -0,0 +1,246 @@
+"""
+aqi_standards.py
+
+Registry of air quality index standards (US EPA AQI, EU CAQI, India NAQI, WHO 2021 guidelines).
+The breakpoints and categories are defined in data/aqi_standards.json and compiled once into
+NumPy lookup arrays, so that index values, categories, colors and map gradients are computed
+consistently and vectorized over whole columns. The category of every index value is stored once
+as a small int8 column next to it (see category_column), so that colors and category counts are
+looked up instead of recomputed.
+"""
+
+import json
+from functools import lru_cache
+from pathlib import Path
+
+import numpy as np
+
+STANDARDS_PATH = Path(__file__).resolve().parent / "data" / "aqi_standards.json"
+
+# Standard used for the 'pm25_aqi', 'pm10_aqi' and 'no2_aqi' columns
+DEFAULT_STANDARD = 'us_epa'
+
+POLLUTANTS = ['pm25', 'pm10', 'no2']
+
+
+class AQIStandard:
+    """
+    An air quality index standard compiled into NumPy lookup arrays.
+
+    Attributes:
+        key (str): The key of the standard in the registry (e.g. 'us_epa').
+        name (str): The display name of the standard.
+        index_name (str): The short name of the index (e.g. 'AQI').
+        max_index (float): The index value concentrations above the highest breakpoint are capped at.
+        breakpoints (dict): Per pollutant a tuple of arrays (low_conc, high_conc, low_index, high_index).
+        category_bounds (np.ndarray): Lower index bound of every category, ascending.
+        category_upper (list): Upper index bound of every category, None if open ended.
+        labels (np.ndarray): Label of every category.
+        colors (np.ndarray): Color of every category.
+        guidelines (dict): Optional guideline concentration per pollutant.
+
+    Methods:
+        compute(pollutant, concentrations):
+            Calculates the index values for an array of concentrations.
+        categorize(index_values):
+            Returns the category code of every index value.
+        gradient():
+            Returns a color gradient for heatmaps matching the categories.
+        legend_entries():
+            Returns (range, label, color) tuples for map and plot legends.
+    """
+
+    def __init__(self, key, definition):
+        """
+        Compiles a standard from its definition in the standards file.
+
+        Args:
+            key (str): The key of the standard in the registry.
+            definition (dict): The definition of the standard as read from the standards file.
+        """
+        self.key = key
+        self.name = definition['name']
+        self.index_name = definition['index_name']
+        self.max_index = float(definition['max_index'])
+        self.guidelines = definition.get('guidelines', {})
+
+        self.breakpoints = {}
+        for pollutant, rows in definition['breakpoints'].items():
+            table = np.array(rows, dtype=float)
+            if np.any(np.diff(table[:, 0]) <= 0):
+                raise ValueError(f"Breakpoints of {pollutant} in {key} have to be ascending")
+            self.breakpoints[pollutant] = tuple(table[:, i] for i in range(4))
+
+        categories = definition['categories']
+        self.category_bounds = np.array([category['from'] for category in categories], dtype=float)
+        self.category_upper = [category['to'] for category in categories]
+        self.labels = np.array([category['label'] for category in categories])
+        self.colors = np.array([category['color'] for category in categories])
+
+    def compute(self, pollutant, concentrations):
+        """
+        Calculates the index values by linear interpolation between the breakpoints.
+        Negative concentrations count as 0, concentrations above the highest breakpoint
+        are capped at max_index and missing concentrations stay NaN.
+
+        Args:
+            pollutant (str): The pollutant type, either 'no2', 'pm25', or 'pm10'.
+            concentrations (array-like): The concentrations.
+
+        Returns:
+            np.ndarray: Rounded index values as floats, NaN where the concentration is missing.
+        """
+        if pollutant not in self.breakpoints:
+            raise ValueError("Unsupported pollutant type")
+        low_conc, high_conc, low_index, high_index = self.breakpoints[pollutant]
+
+        conc = np.maximum(np.asarray(concentrations, dtype=float), 0)
+        # Breakpoint segment each concentration falls into
+        segment = np.clip(np.searchsorted(low_conc, conc, side='right') - 1, 0, len(low_conc) - 1)
+        with np.errstate(invalid='ignore'):
+            index = low_index[segment] + (conc - low_conc[segment]) * (high_index[segment] - low_index[segment]) \
+                / (high_conc[segment] - low_conc[segment])
+            # Concentrations in the gap between two segments keep the upper index of the lower segment
+            index = np.minimum(index, high_index[segment])
+            index = np.where(conc > high_conc[-1], self.max_index, index)
+        return np.round(index)
+
+    def categorize(self, index_values):
+        """
+        Assigns every index value to its category.
+
+        Args:
+            index_values (array-like): The index values.
+
+        Returns:
+            np.ndarray: int8 category codes (positions in labels and colors), -1 for missing values.
+        """
+        values = np.asarray(index_values, dtype=float)
+        codes = np.digitize(values, self.category_bounds[1:]).astype(np.int8)
+        codes[np.isnan(values)] = -1
+        return codes
+
+    def gradient(self):
+        """
+        Returns the color gradient for a heatmap, with a color stop at the start of every category.
+
+        Returns:
+            dict: Mapping of relative position (0 to 1) to color.
+        """
+        return {float(min(bound / self.max_index, 1.0)): str(color)
+                for bound, color in zip(self.category_bounds, self.colors)}
+
+    def legend_entries(self):
+        """
+        Returns the entries for a legend of the categories.
+
+        Returns:
+            list: Tuples of (index range text, label, color) per category.
+        """
+        entries = []
+        for bound, upper, label, color in zip(self.category_bounds, self.category_upper, self.labels, self.colors):
+            text = f"{bound:g}-{upper:g}" if upper is not None else f">{bound:g}"
+            entries.append((text, str(label), str(color)))
+        return entries
+
+
+@lru_cache(maxsize=None)
+def load_standards(path=STANDARDS_PATH):
+    """
+    Loads and compiles all standards from the standards file. The result is cached,
+    so the file is only read and compiled once per process.
+
+    Args:
+        path (str or Path): Path to the standards file.
+
+    Returns:
+        dict: Mapping of standard key to AQIStandard.
+    """
+    with open(path, 'r') as f:
+        definitions = json.load(f)
+    return {key: AQIStandard(key, definition) for key, definition in definitions.items()}
+
+
+def get_standard(key=DEFAULT_STANDARD):
+    """
+    Returns a compiled standard from the registry.
+
+    Args:
+        key (str): The key of the standard (e.g. 'us_epa', 'eu_caqi', 'in_naqi', 'who_2021').
+
+    Returns:
+        AQIStandard: The compiled standard.
+    """
+    standards = load_standards()
+    if key not in standards:
+        raise ValueError(f"Unknown AQI standard '{key}', choose one of {list(standards)}")
+    return standards[key]
+
+
+def aqi_column(pollutant, standard=DEFAULT_STANDARD):
+    """
+    Returns the name of the data column holding the index values of a pollutant.
+
+    Args:
+        pollutant (str): The pollutant, either as type ('pm25') or column ('pm25_concentration').
+        standard (str): The key of the standard.
+
+    Returns:
+        str: 'pm25_aqi' for the default standard, otherwise e.g. 'pm25_aqi_eu_caqi'.
+    """
+    pollutant = pollutant.replace('_concentration', '').replace('_aqi', '')
+    if standard == DEFAULT_STANDARD:
+        return f"{pollutant}_aqi"
+    return f"{pollutant}_aqi_{standard}"
+
+
+def category_column(pollutant, standard=DEFAULT_STANDARD):
+    """
+    Returns the name of the data column holding the category codes of a pollutant's index values.
+
+    Args:
+        pollutant (str): The pollutant, either as type ('pm25') or column ('pm25_concentration').
+        standard (str): The key of the standard.
+
+    Returns:
+        str: 'pm25_aqi_category' for the default standard, otherwise e.g. 'pm25_aqi_eu_caqi_category'.
+    """
+    return f"{aqi_column(pollutant, standard)}_category"
+
+
+def compute_all_standards(df, pollutants=POLLUTANTS):
+    """
+    Calculates the index values of all pollutants for all registered standards in one batched pass.
+
+    Args:
+        df (DataFrame): Data with a '<pollutant>_concentration' column per pollutant.
+        pollutants (list): The pollutant types to compute.
+
+    Returns:
+        dict: Mapping of column name (see aqi_column) to array of index values.
+    """
+    columns = {}
+    for pollutant in pollutants:
+        concentrations = df[f"{pollutant}_concentration"].to_numpy(dtype=float)
+        for key, standard in load_standards().items():
+            columns[aqi_column(pollutant, key)] = standard.compute(pollutant, concentrations)
+    return columns
+
+
+def compute_all_categories(df, pollutants=POLLUTANTS):
+    """
+    Assigns the index values of all pollutants and registered standards to their categories.
+
+    Args:
+        df (DataFrame): Data with the index columns of compute_all_standards().
+        pollutants (list): The pollutant types to categorize.
+
+    Returns:
+        dict: Mapping of column name (see category_column) to array of int8 category codes, -1 where
+              the index value is missing.
+    """
+    columns = {}
+    for pollutant in pollutants:
+        for key, standard in load_standards().items():
+            columns[category_column(pollutant, key)] = standard.categorize(df[aqi_column(pollutant, key)].to_numpy())
+    return columns
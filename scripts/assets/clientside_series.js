@@ -0,0 +1,236 @@
+/*
+ * clientside_series.js
+ *
+ * Draws the main plot in the browser from the pre-aggregated payload of clientside_series.py
+ * (client side mode, CLIENTSIDE_SERIES in main.py). The cells of the payload are filtered by time
+ * span and station types and summed into one line per group, with the same overlays as the server
+ * (standard error band, year-over-year change, linear trend), so the time span slider and the
+ * station type checklist do not wait for the server.
+ */
+
+(function (root) {
+    'use strict';
+
+    // Two sided p-value below which a trend is marked as significant (series_statistics.SIGNIFICANCE_LEVEL)
+    var SIGNIFICANCE_LEVEL = 0.05;
+
+    function decodeArrays(arrays) {
+        // Decodes the base64 typed arrays once per payload
+        var decoded = {};
+        Object.keys(arrays).forEach(function (name) {
+            var binary = atob(arrays[name].data);
+            var bytes = new Uint8Array(binary.length);
+            for (var i = 0; i < binary.length; i++) {
+                bytes[i] = binary.charCodeAt(i);
+            }
+            decoded[name] = new root[arrays[name].type](bytes.buffer);
+        });
+        return decoded;
+    }
+
+    var cache = {payload: null, arrays: null};
+
+    function payloadArrays(payload) {
+        if (cache.payload !== payload) {
+            cache = {payload: payload, arrays: decodeArrays(payload.arrays)};
+        }
+        return cache.arrays;
+    }
+
+    function tTestPValue(t, dof) {
+        // Two sided p-value of Student's t distribution, as series_statistics.t_test_p_value
+        if (isNaN(t) || dof < 1) {
+            return NaN;
+        }
+        var theta = Math.atan(Math.abs(t) / Math.sqrt(dof));
+        var cos2 = Math.pow(Math.cos(theta), 2);
+        var odd = dof % 2 === 1;
+        var nTerms = odd ? (dof - 3) / 2 : (dof - 2) / 2;
+        var series = 1, term = 1;
+        for (var j = 1; j <= nTerms; j++) {
+            term *= (odd ? (2 * j) / (2 * j + 1) : (2 * j - 1) / (2 * j)) * cos2;
+            series += term;
+        }
+        var inside = odd
+            ? 2 / Math.PI * (theta + (dof > 1 ? Math.sin(theta) * Math.cos(theta) * series : 0))
+            : Math.sin(theta) * series;
+        return Math.min(Math.max(1 - inside, 0), 1);
+    }
+
+    function trend(x, y) {
+        // Least squares line through the points, as series_statistics.trend_statistics
+        var n = x.length;
+        if (n < 2) {
+            return null;
+        }
+        var xMean = 0, yMean = 0, i;
+        for (i = 0; i < n; i++) {
+            xMean += x[i] / n;
+            yMean += y[i] / n;
+        }
+        var sxx = 0, sxy = 0;
+        for (i = 0; i < n; i++) {
+            sxx += (x[i] - xMean) * (x[i] - xMean);
+            sxy += (x[i] - xMean) * (y[i] - yMean);
+        }
+        var slope = sxy / sxx;
+        var intercept = yMean - slope * xMean;
+        var pValue = NaN;
+        var dof = n - 2;
+        if (dof >= 1) {
+            var residuals = 0;
+            for (i = 0; i < n; i++) {
+                residuals += Math.pow((y[i] - yMean) - slope * (x[i] - xMean), 2);
+            }
+            var slopeSe = Math.sqrt(residuals / dof / sxx);
+            // A perfect fit has no residual error: any slope is significant, a flat line is not
+            pValue = slopeSe === 0 ? (slope !== 0 ? 0 : 1) : tTestPValue(slope / slopeSe, dof);
+        }
+        return {slope: slope, intercept: intercept, pValue: pValue};
+    }
+
+    function signed(value) {
+        return (value >= 0 ? '+' : '') + value.toFixed(2);
+    }
+
+    function seriesFigure(payload, selectedYear, selectedStationTypes, selectedOverlays) {
+        if (!payload) {
+            return root.dash_clientside.no_update;
+        }
+        var layout = payload.layout;
+        if (!selectedStationTypes || selectedStationTypes.length === 0) {
+            return {
+                data: [],
+                layout: {
+                    template: layout.template,
+                    title: {text: 'No station type selected'},
+                    xaxis: {visible: false},
+                    yaxis: {visible: false},
+                    annotations: [{
+                        text: 'No station type selected - please select a station type to view data.',
+                        xref: 'paper', yref: 'paper', showarrow: false, font: {size: 16}
+                    }],
+                    showlegend: true
+                }
+            };
+        }
+
+        var arrays = payloadArrays(payload);
+        var overlays = selectedOverlays || [];
+        var weighted = payload.aggregation !== 'mean';
+
+        // Bits of the selected station types, every cell for 'all'
+        var everyType = selectedStationTypes.indexOf('all') >= 0;
+        var bits = 0;
+        selectedStationTypes.forEach(function (key) {
+            var bit = payload.station_types.indexOf(key);
+            if (bit >= 0) {
+                bits = (bits | (1 << bit)) >>> 0;
+            }
+        });
+
+        // Sum the cells of the selection into (group, year) matrices
+        var firstYear = Number(selectedYear[0]), lastYear = Number(selectedYear[1]);
+        var nYears = lastYear - firstYear + 1;
+        var nGroups = payload.groups.length;
+        var size = nGroups * nYears;
+        var count = new Float64Array(size), sum = new Float64Array(size), sumSquares = new Float64Array(size);
+        var weightedSum = new Float64Array(size), weight = new Float64Array(size);
+        for (var i = 0; i < payload.cells; i++) {
+            var year = arrays.year[i];
+            if (year < firstYear || year > lastYear || (!everyType && ((arrays.mask[i] & bits) >>> 0) === 0)) {
+                continue;
+            }
+            var cell = arrays.group[i] * nYears + (year - firstYear);
+            count[cell] += arrays.count[i];
+            sum[cell] += arrays.sum[i];
+            sumSquares[cell] += arrays.sum_squares[i];
+            if (weighted) {
+                weightedSum[cell] += arrays.weighted_sum[i];
+                weight[cell] += arrays.weight[i];
+            }
+        }
+
+        // As on the server, the overlays add no trace per line: the error bars of all lines form one
+        // trace, as do all trends (segments separated by gaps), and the yearly change is hover data
+        var traces = [];
+        var errorX = [], errorY = [], errorSize = [];
+        var trendX = [], trendY = [], trendText = [];
+        var drawn = 0;
+        for (var group = 0; group < nGroups; group++) {
+            var x = [], y = [], errors = [], changes = [];
+            var values = new Float64Array(nYears).fill(NaN);
+            for (var k = 0; k < nYears; k++) {
+                var c = group * nYears + k;
+                var n = count[c];
+                if (n === 0 || (weighted && weight[c] === 0)) {
+                    continue;
+                }
+                values[k] = weighted ? weightedSum[c] / weight[c] : sum[c] / n;
+                x.push(firstYear + k);
+                y.push(values[k]);
+                var variance = n > 1 ? Math.max(sumSquares[c] - sum[c] * sum[c] / n, 0) / (n - 1) : NaN;
+                errors.push(n > 1 ? Math.sqrt(variance / n) : 0);
+                changes.push(k > 0 ? values[k] - values[k - 1] : NaN);
+            }
+            // Groups without any value in the selection get no line
+            if (x.length === 0) {
+                continue;
+            }
+            var color = payload.colors[drawn % payload.colors.length];
+            var name = payload.names[group];
+            var label = name;
+            drawn += 1;
+
+            if (overlays.indexOf('standard_error') >= 0) {
+                errorX = errorX.concat(x);
+                errorY = errorY.concat(y);
+                errorSize = errorSize.concat(errors);
+            }
+            if (overlays.indexOf('trend') >= 0) {
+                var fit = trend(x, y);
+                if (fit !== null) {
+                    var ends = [x[0], x[x.length - 1]];
+                    var marker = fit.pValue < SIGNIFICANCE_LEVEL ? '*' : '';
+                    label = name + ' (trend ' + signed(fit.slope) + '/yr, p=' + fit.pValue.toFixed(2) + ')' + marker;
+                    trendX.push(ends[0], ends[1], null);
+                    trendY.push(fit.intercept + fit.slope * ends[0], fit.intercept + fit.slope * ends[1], null);
+                    trendText.push(label, label, null);
+                }
+            }
+            var line = {
+                type: 'scatter', x: x, y: y, mode: 'lines', name: label, legendgroup: name,
+                line: {color: color, width: 0.5}
+            };
+            if (overlays.indexOf('yoy_change') >= 0) {
+                line.customdata = changes;
+                line.hovertemplate = '%{y:.2f} (%{customdata:+.2f} vs. previous year)';
+            }
+            traces.push(line);
+        }
+        if (errorX.length > 0) {
+            // Error bars of one standard error around every point
+            traces.push({
+                type: 'scatter', x: errorX, y: errorY, mode: 'markers', marker: {size: 0, color: 'grey'},
+                error_y: {type: 'data', array: errorSize, color: 'grey', thickness: 0.5, width: 0},
+                name: 'Standard error', hoverinfo: 'skip'
+            });
+        }
+        if (trendX.length > 0) {
+            traces.push({
+                type: 'scatter', x: trendX, y: trendY, mode: 'lines', name: 'Linear trends (* p < 0.05)',
+                line: {color: 'grey', width: 1, dash: 'dash'}, hovertext: trendText, hoverinfo: 'text'
+            });
+        }
+        return {data: traces, layout: layout};
+    }
+
+    root.dash_clientside = Object.assign({}, root.dash_clientside, {
+        inspectair: {seriesFigure: seriesFigure}
+    });
+
+    // Exported for tests run with Node
+    if (typeof module !== 'undefined') {
+        module.exports = {seriesFigure: seriesFigure, tTestPValue: tTestPValue};
+    }
+})(typeof window !== 'undefined' ? window : globalThis);
@@ -1,8 +1,22 @@
+from urllib.parse import urlencode
+import numpy as np
+import pandas as pd
 import plotly.graph_objects as go
-from dash import Input, Output, html, get_asset_url
-import re
+from dash import ClientsideFunction, Input, Output, State, ctx, html, get_asset_url, no_update
+import dash_bootstrap_components as dbc
 from ranking_plots import get_rank_10, create_ranking_plot
-from map import Map
+from map import Map, STATION_CLUSTERS_URL, STATION_MAP_MAX_ZOOM
+from aqi_standards import aqi_column, category_column
+from aggregation import AGGREGATION_MODES
+from series_statistics import series_statistics
+from choropleth import WORLD_GEOJSON_URL, create_choropleth, load_world_geometry
+from data_manager import DatasetRegistry
+from temporal_rollups import RESOLUTION_LABELS, decimal_years
+from export import EXPORT_URL, export_file, export_url, parse_export_request
+from anomaly_detection import ANOMALY_THRESHOLD, top_anomalies
+from category_distribution import category_distribution, create_distribution_figure
+from clientside_series import CLIENTSIDE_MODES, series_payload
+from comparison import COMPARISON_LEVELS, MAX_COMPARED, compare_groups, create_comparison_figure
 
 class AirQualityCallbacks:
     """
@@ -10,62 +24,412 @@ class AirQualityCallbacks:
 
     Attributes:
         app: The Dash application instance.
-        data: The air quality data used in the dashboard (excel file input). 
+        data: The air quality data used in the dashboard (excel file input), the default dataset.
+        datasets: The DatasetRegistry the callbacks take the selected dataset from.
+        clientside_series: Whether the main plot is drawn in the browser from a pre-aggregated payload
+                           (see clientside_series.py) instead of by the update callback.
 
     Methods:
-        generate_folium_map(filtered_data, selected_pollutant):
-            Generates a Folium map with heatmap data.
+        generate_folium_map(filtered_data, selected_pollutant, selected_standard='us_epa', data=None, selected_dataset=None):
+            Generates a Folium map with heatmap data and a layer of the station clusters.
+        station_locator_figure(data):
+            Creates the clickable map of all stations used to look up the nearest stations.
+        series_labels(data, value, selected_continent, selected_aggregation='mean'):
+            Returns the grouping, names, colors and titles of the series of the main plot.
+        series_figure(data, selected_pollutant, selected_continent, selected_year, selected_station_types, ...):
+            Draws the time series of the main plot.
+        series_payload(data, selected_pollutant, selected_continent, selected_aggregation='mean'):
+            Builds the pre-aggregated payload the browser draws the main plot from in client side mode.
+        register_cluster_route():
+            Serves the station clusters of the datasets to the map.
+        register_geometry_route():
+            Serves the simplified country outlines used by the choropleth.
+        register_export_route():
+            Serves the exports of the current selection as CSV, Parquet or Excel files.
         set_callbacks():
             Sets up the Dash callbacks to handle user interactions and update the dashboard.
     """
 
-    def __init__(self, app, data):
+    def __init__(self, app, data, datasets=None, clientside_series=False):
         """
         Initializes the AirQualityCallbacks with the given Dash app and data.
 
         Args:
             app: The Dash application instance.
             data: The air quality data.
+            datasets: The DatasetRegistry of the selectable datasets. Defaults to only `data`.
+            clientside_series: Whether the main plot is drawn in the browser.
         """
 
         self.app = app
         self.data = data
+        self.clientside_series = clientside_series
+        if datasets is None:
+            datasets = DatasetRegistry()
+            datasets.add(data)
+        self.datasets = datasets
+        self.register_cluster_route()
+        self.register_geometry_route()
+        self.register_export_route()
         self.set_callbacks()
 
-    def generate_folium_map(self, filtered_data, selected_pollutant):
+    def generate_folium_map(self, filtered_data, selected_pollutant, selected_standard='us_epa', data=None,
+                            selected_dataset=None):
         """
-        Generates a Folium map with heatmap data.
+        Generates a Folium map with heatmap data and a layer of the station clusters.
 
         Args:
             filtered_data (DataFrame): The filtered data containing latitude, longitude, and pollutant values.
             selected_pollutant (str): The selected pollutant to be visualized on the map.
+            selected_standard (str): The AQI standard defining the colors of the heatmap.
+            data (AirQualityData): The dataset whose stations are clustered. Defaults to the default dataset.
+            selected_dataset (str): The key of `data` in the registry, None for the default dataset.
 
         Returns:
             str: The HTML content of the generated Folium map.
         """
+        data = data or self.data
 
-        world_map = Map()
+        world_map = Map(max_zoom=STATION_MAP_MAX_ZOOM)
         heatmap_data = filtered_data[['latitude', 'longitude', selected_pollutant]].dropna().values.tolist()
-        world_map.add_heatmap(heatmap_data)
-        world_map.save('map.html')
-        return open('map.html', 'r').read()
+        world_map.add_heatmap(heatmap_data, standard=data.aqi_standards[selected_standard])
+        # All stations as clusters precomputed per zoom level, hidden until enabled in the layer control.
+        # The clusters are fetched from the cluster route then, instead of being sent with every map.
+        parameters = {'dataset': selected_dataset or self.datasets.default_key, 'version': data.station_clusters_version}
+        clusters_url = f'{STATION_CLUSTERS_URL}?{urlencode(parameters)}'
+        world_map.add_precomputed_clusters(clusters_url, layer_name='Stations', show=False)
+        return world_map.render()
+
+    def station_locator_figure(self, data):
+        """
+        Creates a map with one point per station. Clicking a station looks up its nearest stations.
+
+        Args:
+            data (AirQualityData): The dataset whose stations are shown.
+
+        Returns:
+            go.Figure: The station map.
+        """
+        fig = go.Figure(go.Scattergeo(
+            lat=data.stations['latitude'].round(3),
+            lon=data.stations['longitude'].round(3),
+            text=data.stations['city'].astype(str),
+            mode='markers',
+            marker=dict(size=3, color='#1f77b4'),
+            hoverinfo='text'
+        ))
+        fig.update_layout(
+            title='Click a station to list its nearest stations',
+            geo=dict(showcountries=True, projection_type='natural earth'),
+            margin=dict(l=0, r=0, t=40, b=0),
+            height=400
+        )
+        return fig
+
+    def series_labels(self, data, value, selected_continent, selected_aggregation='mean'):
+        """
+        Returns how the series of the main plot are grouped and labelled: per region for the world,
+        per country for a region.
+
+        Args:
+            data (AirQualityData): The dataset.
+            value (str): The column drawn, e.g. 'pm25_concentration' or an AQI column.
+            selected_continent (str): The region code selected, '' for the whole world.
+            selected_aggregation (str): The aggregation mode (see aggregation.py).
+
+        Returns:
+            dict: The 'group_column' of the series, the display 'names' of the groups, the line 'colors',
+                  the 'title', 'legend_title' and 'yaxis_title' of the plot.
+        """
+        # For world data - data segmented into continents, otherwise into countries of the selected continent
+        if selected_continent == '':
+            labels = {
+                'group_column': 'who_region',
+                'names': data.continent_dict,
+                'colors': ['brown', 'red', 'purple', 'pink', 'green', 'black', 'blue'],
+                'title': data.legend[value] + ' Across Different Continents',
+                'legend_title': 'Region'
+            }
+        else:
+            labels = {
+                'group_column': 'country_name',
+                'names': {},
+                'colors': ['brown', 'red', 'purple', 'pink', 'green', 'black', 'blue', 'orange', 'grey'],
+                'title': (data.legend[value] + ' Concentration Across Different Countries in '
+                          + data.continent_dict[selected_continent]),
+                'legend_title': 'Country'
+            }
+        labels['yaxis_title'] = data.legend[value]
+        if selected_aggregation != 'mean':
+            labels['yaxis_title'] += f' ({AGGREGATION_MODES[selected_aggregation].lower()})'
+        return labels
+
+    def series_figure(self, data, selected_pollutant, selected_continent, selected_year, selected_station_types,
+                      selected_aggregation='mean', selected_overlays=None):
+        """
+        Draws the time series of the main plot: one line per region, or per country of a region.
+
+        Args:
+            data (AirQualityData): The dataset.
+            selected_pollutant (str): The column drawn, e.g. 'pm25_concentration' or an AQI column.
+            selected_continent (str): The region code selected, '' for the whole world.
+            selected_year (list): The range of years selected.
+            selected_station_types (list): The types of stations selected.
+            selected_aggregation (str): The aggregation mode (see aggregation.py).
+            selected_overlays (list): The statistics overlays selected ('standard_error', 'yoy_change', 'trend').
+
+        Returns:
+            go.Figure: The figure.
+        """
+        selection = (selected_year, selected_station_types, selected_continent)
+        labels = self.series_labels(data, selected_pollutant, selected_continent, selected_aggregation)
+        group_column = labels['group_column']
+
+        # Timestamped data is drawn from the coarsest rollup that still fills the chart
+        resolution = data.series_resolution(selected_year)
+        time_column = 'year' if resolution == 'year' else 'period'
+        series_query = data.series_query(resolution)
+
+        # Aggregate all groups and periods at once and draw one line per group
+        fig = go.Figure()
+        aggregated = series_query.aggregate(*selection, [group_column, time_column], selected_pollutant,
+                                            selected_aggregation)
+        lines = aggregated[selected_pollutant].unstack(time_column)
+        if selected_continent != '':
+            # Countries without any value of the pollutant get no line
+            lines = lines.dropna(how='all')
+
+        # Standard error, year-over-year change and trend of every line in one batched pass
+        selected_overlays = selected_overlays or []
+        statistics = None
+        if selected_overlays:
+            moments = series_query.moments(*selection, [group_column, time_column], selected_pollutant)
+            statistics = series_statistics(None, group_column, selected_pollutant, line=lines, moments=moments,
+                                           time_column=time_column)
+            # Aligned with the lines once, so that every line only takes a row of the arrays
+            errors, changes = [statistics[key].reindex(index=lines.index, columns=lines.columns).to_numpy()
+                               for key in ['standard_error', 'yoy_change']]
+            trends = statistics['trend'].reindex(lines.index)
+        present = lines.notna().to_numpy()
+
+        # The overlays add no trace per line, as every trace costs more than the statistics themselves:
+        # the error bars of all lines form one trace, as do all trends (segments separated by gaps),
+        # and the yearly change is hover data of the line
+        error_x, error_y, error_size = [], [], []
+        trend_x, trend_y, trend_text = [], [], []
+        for i, group in enumerate(lines.index):
+            line = lines.loc[group].dropna()
+            color = labels['colors'][i % len(labels['colors'])]
+            name = labels['names'].get(group, group)
+            label = name
+            if selected_aggregation == 'percentile':
+                # Shaded band between the lower and upper percentile
+                band = aggregated.xs(group, level=group_column).loc[line.index]
+                fig.add_trace(go.Scatter(x=line.index, y=band['upper'], mode='lines', line=dict(width=0),
+                                         legendgroup=name, showlegend=False, hoverinfo='skip'))
+                fig.add_trace(go.Scatter(x=line.index, y=band['lower'], mode='lines', line=dict(width=0),
+                                         fill='tonexty', fillcolor=color, opacity=0.2, legendgroup=name,
+                                         showlegend=False, hoverinfo='skip'))
+            overlays = {}
+            if 'standard_error' in selected_overlays:
+                error_x.append(line.index)
+                error_y.append(line.to_numpy())
+                error_size.append(np.nan_to_num(errors[i, present[i]]))
+            if 'yoy_change' in selected_overlays:
+                overlays['customdata'] = changes[i, present[i]]
+                overlays['hovertemplate'] = '%{y:.2f} (%{customdata:+.2f} vs. previous year)'
+            if 'trend' in selected_overlays:
+                trend = trends.iloc[i]
+                if not np.isnan(trend['slope']):
+                    marker = '*' if trend['significant'] else ''
+                    label = f"{name} (trend {trend['slope']:+.2f}/yr, p={trend['p_value']:.2f}){marker}"
+                    ends = [line.index[0], line.index[-1]]
+                    # Trends of rollups are fitted over fractional years
+                    x = np.array(ends) if resolution == 'year' else decimal_years(ends)
+                    trend_x += ends + [None]
+                    trend_y += list(trend['intercept'] + trend['slope'] * x) + [None]
+                    trend_text += [label] * 2 + [None]
+            fig.add_trace(go.Scatter(
+                x=line.index,
+                y=line.values,
+                mode='lines',
+                name=label,
+                legendgroup=name,
+                line=dict(color=color, width=0.5),
+                **overlays
+            ))
+        if error_x:
+            # Error bars of one standard error around every point
+            fig.add_trace(go.Scatter(
+                x=np.concatenate(error_x),
+                y=np.concatenate(error_y),
+                mode='markers',
+                marker=dict(size=0, color='grey'),
+                error_y=dict(type='data', array=np.concatenate(error_size), color='grey', thickness=0.5, width=0),
+                name='Standard error',
+                hoverinfo='skip'
+            ))
+        if trend_x:
+            fig.add_trace(go.Scatter(
+                x=trend_x,
+                y=trend_y,
+                mode='lines',
+                name='Linear trends (* p < 0.05)',
+                line=dict(color='grey', width=1, dash='dash'),
+                hovertext=trend_text,
+                hoverinfo='text'
+            ))
+
+        fig.update_layout(
+            title=labels['title'],
+            xaxis_title='Year' if resolution == 'year' else f'Date ({RESOLUTION_LABELS[resolution].lower()} means)',
+            yaxis_title=labels['yaxis_title'],
+            legend_title=labels['legend_title'],
+            template='plotly_white',
+            showlegend=True
+        )
+        return fig
+
+
+    def series_payload(self, data, selected_pollutant, selected_continent, selected_aggregation='mean'):
+        """
+        Builds the pre-aggregated payload the browser draws the main plot from in client side mode:
+        the cells of clientside_series.series_payload() with the names, colors and layout of the plot.
+
+        Args:
+            data (AirQualityData): The dataset.
+            selected_pollutant (str): The column drawn, e.g. 'pm25_concentration' or an AQI column.
+            selected_continent (str): The region code selected, '' for the whole world.
+            selected_aggregation (str): The aggregation mode, 'mean' if it cannot be computed in the browser.
+
+        Returns:
+            dict: The payload.
+        """
+        if selected_aggregation not in CLIENTSIDE_MODES:
+            selected_aggregation = 'mean'
+        labels = self.series_labels(data, selected_pollutant, selected_continent, selected_aggregation)
+        station_type_keys = [key for key in data.station_type if key != 'all']
+        payload = series_payload(data.df, selected_pollutant, labels['group_column'], station_type_keys,
+                                 selected_continent, selected_aggregation)
+        payload['names'] = [labels['names'].get(group, group) for group in payload['groups']]
+        payload['colors'] = labels['colors']
+        fig = go.Figure()
+        fig.update_layout(
+            title=labels['title'],
+            xaxis_title='Year',
+            yaxis_title=labels['yaxis_title'],
+            legend_title=labels['legend_title'],
+            template='plotly_white',
+            showlegend=True
+        )
+        payload['layout'] = fig.to_plotly_json()['layout']
+        return payload
+
+    def register_cluster_route(self):
+        """
+        Serves the station clusters of a dataset to the map. Their URL contains a checksum of the
+        clusters, so that the browser can cache them and only fetches them once per dataset.
+        """
+        from flask import Response, abort, request
+
+        def station_clusters():
+            try:
+                data = self.datasets.get(request.args.get('dataset'))
+            except KeyError as error:
+                abort(404, description=str(error))
+            return Response(data.station_clusters, mimetype='application/json',
+                            headers={'Cache-Control': 'public, max-age=86400'})
+
+        self.app.server.add_url_rule(STATION_CLUSTERS_URL, 'station_clusters', station_clusters)
+
+    def register_geometry_route(self):
+        """
+        Serves the simplified country outlines for the choropleth. The outlines are simplified once
+        at start up and cached by the browser, so choropleth updates only carry the values per country.
+        """
+        from flask import Response
+        geometry = load_world_geometry()
+
+        def world_geometry():
+            return Response(geometry, mimetype='application/geo+json',
+                            headers={'Cache-Control': 'public, max-age=86400'})
+
+        self.app.server.add_url_rule(WORLD_GEOJSON_URL, 'world_geometry', world_geometry)
+
+    def register_export_route(self):
+        """
+        Serves the exports of the current selection (see export.py). The response is streamed, so
+        CSV and Parquet files are sent while they are written instead of being built in memory first.
+        """
+        from flask import Response, abort, request, stream_with_context
+
+        def export():
+            try:
+                parameters = parse_export_request(request.args)
+                data = self.datasets.get(parameters['selected_dataset'])
+                filename, mimetype, chunks = export_file(data, **parameters)
+            except KeyError as error:
+                abort(404, description=str(error))
+            except ValueError as error:
+                abort(400, description=str(error))
+            return Response(stream_with_context(chunks), mimetype=mimetype,
+                            headers={'Content-Disposition': f'attachment; filename="{filename}"'})
+
+        self.app.server.add_url_rule(EXPORT_URL, 'export', export)
 
     def set_callbacks(self):
         """
         Sets up the Dash callbacks to handle user interactions and update the dashboard.
         """
         @self.app.callback(
-            Output('indicator-graphic', 'figure'),
-            Output('bar-graph-matplotlib', 'src'),
-            Output('bar-graph-matplotlib_bottom', 'src'),
-            Output('folium-map', 'srcDoc'),
-            Input('pollutant-dropdown', 'value'),
-            Input('continent-dropdown', 'value'),
-            Input('from-to', 'value'),
-            Input('station-type-checklist', 'value'),
-            Input('data-type-radio', 'value')
+            Output('from-to', 'min'),
+            Output('from-to', 'max'),
+            Output('from-to', 'marks'),
+            Output('from-to', 'value'),
+            Output('aggregation-dropdown', 'options'),
+            Output('aggregation-dropdown', 'value'),
+            Output('station-locator', 'figure'),
+            Input('dataset-dropdown', 'value'),
+            State('from-to', 'value'),
+            State('aggregation-dropdown', 'value')
         )
-        def update_graph(selected_pollutant, selected_continent, selected_year, selected_station_types, selected_data_type):
+        def select_dataset(selected_dataset, selected_year, selected_aggregation):
+            """
+            Adapts the time span, the aggregation modes and the station map to the selected dataset,
+            loading the dataset on first use.
+
+            Args:
+                selected_dataset (str): The key of the dataset selected from the dropdown.
+                selected_year (list): The range of years selected.
+                selected_aggregation (str): The aggregation mode selected.
+
+            Returns:
+                tuple: The bounds, marks and value of the time span slider, the options and value of the
+                       aggregation dropdown and the station map.
+            """
+            data = self.datasets.get(selected_dataset)
+            first_year, last_year = data.year_range
+            marks = {i: str(i) for i in range(first_year, last_year + 1)}
+
+            # Keep the selection where the dataset covers it, fall back to the full span otherwise
+            year = [max(int(selected_year[0]), first_year), min(int(selected_year[1]), last_year)]
+            if year[0] > year[1]:
+                year = [first_year, last_year]
+            # The median modes need the rows and are not offered when the main plot is drawn in the browser
+            options = [option for option in data.aggregation_options
+                       if not self.clientside_series or option['value'] in CLIENTSIDE_MODES]
+            modes = [option['value'] for option in options]
+            aggregation = selected_aggregation if selected_aggregation in modes else 'mean'
+
+            return (first_year, last_year, marks,
+                    year if year != list(selected_year) else no_update,
+                    options,
+                    aggregation if aggregation != selected_aggregation else no_update,
+                    self.station_locator_figure(data))
+
+        def update_graph(selected_pollutant, selected_continent, selected_year, selected_station_types, selected_data_type,
+                         selected_standard='us_epa', selected_aggregation='mean', selected_overlays=None,
+                         selected_map_mode='heatmap', selected_dataset=None, draw_series=True):
             """
             Updates the graphs and map based on the user input.
 
@@ -75,6 +439,12 @@ class AirQualityCallbacks:
                 selected_year (list): The range of years selected.
                 selected_station_types (list): The types of stations selected from the checklist.
                 selected_data_type (str): The data type selected (concentration or AQI).
+                selected_standard (str): The AQI standard selected from the dropdown.
+                selected_aggregation (str): The aggregation mode selected from the dropdown (see aggregation.py).
+                selected_overlays (list): The statistics overlays selected ('standard_error', 'yoy_change', 'trend').
+                selected_map_mode (str): The map shown, 'heatmap' (Folium) or 'choropleth' (drawn by update_choropleth).
+                selected_dataset (str): The key of the dataset selected, None for the default dataset.
+                draw_series (bool): Whether to draw the main plot, False when it is drawn in the browser.
 
             Returns:
                 tuple: A tuple containing the updated figure for the main plot, the top ranking bar graph,
@@ -82,8 +452,6 @@ class AirQualityCallbacks:
             """
             selected_from_year = selected_year[0]
             selected_to_year = selected_year[1]
-            colors = ['brown', 'red', 'purple', 'pink', 'green', 'black', 'blue']
-            filtered_df = self.data.df.copy()
 
             if not selected_station_types:
                 fig = go.Figure()
@@ -121,131 +489,502 @@ class AirQualityCallbacks:
                 '''
                 return fig, None, None, no_data_html
 
-            # Filter data based on selected station types
-            if selected_station_types.count('all') == 0:
-                filtered_df = filtered_df.dropna(subset=['type_of_stations'])
-                pattern = '|'.join(r'\b{}\b'.format(re.escape(word)) for word in selected_station_types)
-                filtered_df = filtered_df[filtered_df['type_of_stations'].str.contains(pattern, na=False)]
-
             # Adjust selected pollutant based on data type
             if str(selected_data_type) == 'AQI':
-                selected_pollutant = selected_pollutant.replace("concentration", "aqi")
-                pollutant_legend_title = self.data.legend[selected_pollutant].replace("Concentration", "AQI")
-            else:
-                pollutant_legend_title = self.data.legend[selected_pollutant]
-
-            # Filter data based on selected year range
-            if selected_from_year != 'all':
-                filtered_df = filtered_df[filtered_df['year'] >= int(selected_from_year)]
-            if selected_to_year != 'all':
-                filtered_df = filtered_df[filtered_df['year'] <= int(selected_to_year)]
-
-            fig = go.Figure()
-
-            # For world data - data segmented into continents and plotted
-            if selected_continent == '':
-                regions = filtered_df['who_region'].unique()
-                for region in regions:
-                    regional_data = filtered_df[filtered_df['who_region'] == region]
-                    df_pollutant_mean_year = regional_data.pivot_table(index='year', values=selected_pollutant, aggfunc='mean')
-                    fig.add_trace(go.Scatter(
-                        x=df_pollutant_mean_year.index,
-                        y=df_pollutant_mean_year[selected_pollutant],
-                        mode='lines',
-                        name=self.data.continent_dict[region],
-                        line=dict(color=colors[regions.tolist().index(region) % len(colors)], width=0.5)
-                    ))
+                selected_pollutant = aqi_column(selected_pollutant, selected_standard)
 
-                fig.update_layout(
-                    title=self.data.legend[selected_pollutant] + ' Across Different Continents',
-                    xaxis_title='Year',
-                    yaxis_title=self.data.legend[selected_pollutant],
-                    legend_title='Region',
-                    template='plotly_white',
-                    showlegend=True
-                )
+            # The selection of station types, year range and region, answered by the query backend of the dataset
+            data = self.datasets.get(selected_dataset)
+            selection = (selected_year, selected_station_types, selected_continent)
+
+            fig = no_update
+            if draw_series:
+                fig = self.series_figure(data, selected_pollutant, selected_continent, selected_year,
+                                         selected_station_types, selected_aggregation, selected_overlays)
+
+            # Generate top and bottom ranking plots
+            ranking_mode = 'median' if selected_aggregation == 'percentile' else selected_aggregation
+            city_aggregates = data.query.aggregate(*selection, ['city'], selected_pollutant, ranking_mode)
+            top_ranked_10, bottom_ranked_10, color_top, color_bottom = get_rank_10(df=None,
+                                                                                   selected_pollutant=selected_pollutant,
+                                                                                   selected_data_type=selected_data_type,
+                                                                                   selected_standard=selected_standard,
+                                                                                   selected_aggregation=selected_aggregation,
+                                                                                   city_aggregates=city_aggregates)
+            ranking_note = f'({AGGREGATION_MODES[selected_aggregation].lower()} across timeframe is shown; low value is better)'
+
+            fig_bar_top_10 = create_ranking_plot(
+                selected_data_type=selected_data_type,
+                y=top_ranked_10[selected_pollutant].index,
+                x=top_ranked_10[selected_pollutant].values,
+                ranking_type='top',
+                title=(f'Top 10 most polluted cities in {data.continent_dict[selected_continent]} ({selected_from_year}-{selected_to_year})\n'
+                       + ranking_note),
+                xlabel=f'{data.legend[selected_pollutant]}',
+                color=color_top,
+                text=top_ranked_10[selected_pollutant].values,
+                standard=data.aqi_standards[selected_standard])
 
-                # Generate top and bottom ranking plots
-                top_ranked_10, bottom_ranked_10, color_top, color_bottom = get_rank_10(df=filtered_df,
-                                                                                       selected_pollutant=selected_pollutant,
-                                                                                       selected_data_type=selected_data_type)
-                fig_bar_top_10 = create_ranking_plot(
-                    selected_data_type=selected_data_type,
-                    y=top_ranked_10[selected_pollutant].index,
-                    x=top_ranked_10[selected_pollutant].values,
-                    ranking_type='top',
-                    title=(f'Top 10 most polluted cities in {self.data.continent_dict[selected_continent]} ({selected_from_year}-{selected_to_year})\n'
-                           '(average values across timeframe are shown; low value is better)'),
-                    xlabel=f'{self.data.legend[selected_pollutant]}',
-                    color=color_top,
-                    text=top_ranked_10[selected_pollutant].values)
-
-                fig_bar_bottom_10 = create_ranking_plot(
-                    selected_data_type=selected_data_type,
-                    y=bottom_ranked_10[selected_pollutant].index,
-                    x=bottom_ranked_10[selected_pollutant].values,
-                    ranking_type='bottom',
-                    title=(f'Top 10 least polluted cities in {self.data.continent_dict[selected_continent]} ({selected_from_year}-{selected_to_year})\n'
-                           '(average values across timeframe are shown; low value is better)'),
-                    xlabel=f'{self.data.legend[selected_pollutant]}',
-                    color=color_bottom,
-                    text=bottom_ranked_10[selected_pollutant].values)
-
-                return fig, fig_bar_top_10, fig_bar_bottom_10, self.generate_folium_map(filtered_df, selected_pollutant)
-
-            else:
-                # Filter data based on selected continent, segment data into countries from selected continents and plotted
-                filtered_df = filtered_df[filtered_df['who_region'] == selected_continent]
-                filtered_df = filtered_df.dropna(subset=[selected_pollutant])
-                
-                countries = filtered_df['country_name'].unique()
-                colors = ['brown', 'red', 'purple', 'pink', 'green', 'black', 'blue', 'orange', 'grey']
-                for country in countries:
-                    country_data = filtered_df[filtered_df['country_name'] == country]
-                    if not country_data.empty:
-                        df_pollutant_mean_year = country_data.pivot_table(index='year', values=selected_pollutant, aggfunc='mean')
-                        fig.add_trace(go.Scatter(
-                            x=df_pollutant_mean_year.index,
-                            y=df_pollutant_mean_year[selected_pollutant],
-                            mode='lines',
-                            name=country,
-                            line=dict(color=colors[countries.tolist().index(country) % len(colors)], width=0.5) 
-                        ))
+            fig_bar_bottom_10 = create_ranking_plot(
+                selected_data_type=selected_data_type,
+                y=bottom_ranked_10[selected_pollutant].index,
+                x=bottom_ranked_10[selected_pollutant].values,
+                ranking_type='bottom',
+                title=(f'Top 10 least polluted cities in {data.continent_dict[selected_continent]} ({selected_from_year}-{selected_to_year})\n'
+                       + ranking_note),
+                xlabel=f'{data.legend[selected_pollutant]}',
+                color=color_bottom,
+                text=bottom_ranked_10[selected_pollutant].values,
+                standard=data.aqi_standards[selected_standard])
 
+            # The heatmap is hidden in choropleth mode, so it is not rendered
+            if selected_map_mode == 'choropleth':
+                return fig, fig_bar_top_10, fig_bar_bottom_10, no_update
+            # One heatmap point per station: the mean over the selected years
+            station_values = data.query.aggregate(*selection, ['latitude', 'longitude'], selected_pollutant).reset_index()
+            return fig, fig_bar_top_10, fig_bar_bottom_10, self.generate_folium_map(station_values, selected_pollutant, selected_standard, data, selected_dataset)
+
+        graph_inputs = [
+            Input('pollutant-dropdown', 'value'),
+            Input('continent-dropdown', 'value'),
+            Input('from-to', 'value'),
+            Input('station-type-checklist', 'value'),
+            Input('data-type-radio', 'value'),
+            Input('aqi-standard-dropdown', 'value'),
+            Input('aggregation-dropdown', 'value'),
+            Input('overlay-checklist', 'value'),
+            Input('map-mode-radio', 'value'),
+            Input('dataset-dropdown', 'value')
+        ]
+        ranking_outputs = [
+            Output('bar-graph-matplotlib', 'src'),
+            Output('bar-graph-matplotlib_bottom', 'src'),
+            Output('folium-map', 'srcDoc')
+        ]
+        if not self.clientside_series:
+            self.app.callback(Output('indicator-graphic', 'figure'), *ranking_outputs, *graph_inputs)(update_graph)
+        else:
+            def update_rankings(selected_pollutant, selected_continent, selected_year, selected_station_types,
+                                selected_data_type, selected_standard, selected_aggregation, selected_map_mode,
+                                selected_dataset=None):
+                """
+                Updates the ranking plots and the map while the main plot is drawn in the browser.
+
+                Returns:
+                    tuple: The top and bottom ranking bar graphs and the HTML for the Folium map.
+                """
+                return update_graph(selected_pollutant, selected_continent, selected_year, selected_station_types,
+                                    selected_data_type, selected_standard, selected_aggregation, None,
+                                    selected_map_mode, selected_dataset, draw_series=False)[1:]
+            self.app.callback(*ranking_outputs, *[i for i in graph_inputs if i.component_id != 'overlay-checklist'])(
+                update_rankings)
+
+            @self.app.callback(
+                Output('series-payload', 'data'),
+                Input('pollutant-dropdown', 'value'),
+                Input('continent-dropdown', 'value'),
+                Input('data-type-radio', 'value'),
+                Input('aqi-standard-dropdown', 'value'),
+                Input('aggregation-dropdown', 'value'),
+                Input('dataset-dropdown', 'value')
+            )
+            def update_series_payload(selected_pollutant, selected_continent, selected_data_type, selected_standard,
+                                      selected_aggregation, selected_dataset=None):
+                """
+                Sends the pre-aggregated payload of the main plot, only when the pollutant, region, data
+                type, standard, aggregation mode or dataset changes. Time span and station types are
+                filtered in the browser.
+
+                Returns:
+                    dict: The payload, see series_payload().
+                """
+                if str(selected_data_type) == 'AQI':
+                    selected_pollutant = aqi_column(selected_pollutant, selected_standard)
+                return self.series_payload(self.datasets.get(selected_dataset), selected_pollutant, selected_continent,
+                                           selected_aggregation)
+
+            self.app.clientside_callback(
+                ClientsideFunction(namespace='inspectair', function_name='seriesFigure'),
+                Output('indicator-graphic', 'figure'),
+                Input('series-payload', 'data'),
+                Input('from-to', 'value'),
+                Input('station-type-checklist', 'value'),
+                Input('overlay-checklist', 'value')
+            )
+            self.update_rankings = update_rankings
+            self.update_series_payload = update_series_payload
+
+        @self.app.callback(
+            Output('choropleth-map', 'figure'),
+            Output('heatmap-container', 'style'),
+            Output('choropleth-container', 'style'),
+            Input('map-mode-radio', 'value'),
+            Input('pollutant-dropdown', 'value'),
+            Input('continent-dropdown', 'value'),
+            Input('from-to', 'value'),
+            Input('station-type-checklist', 'value'),
+            Input('data-type-radio', 'value'),
+            Input('aqi-standard-dropdown', 'value'),
+            Input('aggregation-dropdown', 'value'),
+            Input('dataset-dropdown', 'value')
+        )
+        def update_choropleth(selected_map_mode, selected_pollutant, selected_continent, selected_year,
+                              selected_station_types, selected_data_type, selected_standard, selected_aggregation,
+                              selected_dataset=None):
+            """
+            Updates the country choropleth and shows either the choropleth or the heatmap.
+
+            Args:
+                selected_map_mode (str): The map shown, 'heatmap' or 'choropleth'.
+                selected_pollutant (str): The pollutant selected from the dropdown.
+                selected_continent (str): The continent selected from the dropdown.
+                selected_year (list): The range of years selected.
+                selected_station_types (list): The types of stations selected from the checklist.
+                selected_data_type (str): The data type selected (concentration or AQI).
+                selected_standard (str): The AQI standard selected from the dropdown.
+                selected_aggregation (str): The aggregation mode selected from the dropdown.
+                selected_dataset (str): The key of the dataset selected, None for the default dataset.
+
+            Returns:
+                tuple: The choropleth figure and the styles of the heatmap and choropleth containers.
+            """
+            if selected_map_mode != 'choropleth':
+                return no_update, {'display': 'block'}, {'display': 'none'}
+            if not selected_station_types:
+                return go.Figure(), {'display': 'none'}, {'display': 'block'}
+
+            data = self.datasets.get(selected_dataset)
+            standard = None
+            if str(selected_data_type) == 'AQI':
+                selected_pollutant = aqi_column(selected_pollutant, selected_standard)
+                standard = data.aqi_standards[selected_standard]
+            values = data.country_aggregates(selected_pollutant, selected_year, selected_station_types,
+                                                  selected_continent, selected_aggregation)
+            fig = create_choropleth(
+                iso3=list(values.index.astype(str)),
+                values=values.to_numpy(),
+                title=(f'{data.legend[selected_pollutant]} per country in {data.continent_dict[selected_continent]} '
+                       f'({selected_year[0]}-{selected_year[1]}, {AGGREGATION_MODES[selected_aggregation].lower()})'),
+                colorbar_title=data.legend[selected_pollutant],
+                standard=standard,
+                region_view=selected_continent != '')
+            return fig, {'display': 'none'}, {'display': 'block'}
+
+        @self.app.callback(
+            Output('compare-dropdown', 'options'),
+            Input('compare-dropdown', 'search_value'),
+            Input('compare-dropdown', 'value'),
+            Input('compare-level-radio', 'value'),
+            Input('dataset-dropdown', 'value')
+        )
+        def update_compare_options(search_value, selected_groups, selected_level, selected_dataset=None):
+            """
+            Lists the cities or countries matching the text typed into the comparison dropdown.
+
+            Args:
+                search_value (str): The text typed into the dropdown.
+                selected_groups (list): The cities or countries already compared, always listed.
+                selected_level (str): The column compared (see comparison.COMPARISON_LEVELS).
+                selected_dataset (str): The key of the dataset selected, None for the default dataset.
+
+            Returns:
+                list: The options of the dropdown, at most 50 matches besides the compared groups.
+            """
+            data = self.datasets.get(selected_dataset)
+            categories = data.group_index(selected_level).categories.astype(str)
+            matches = []
+            if search_value:
+                matches = list(categories[categories.str.contains(search_value, case=False, regex=False)][:50])
+            labels = list(dict.fromkeys(list(selected_groups or []) + matches))
+            return [{'label': label, 'value': label} for label in labels]
+
+        @self.app.callback(
+            Output('compare-dropdown', 'value'),
+            Input('compare-level-radio', 'value'),
+            Input('compare-top-button', 'n_clicks'),
+            Input('dataset-dropdown', 'value'),
+            State('pollutant-dropdown', 'value'),
+            State('continent-dropdown', 'value'),
+            State('from-to', 'value'),
+            State('station-type-checklist', 'value'),
+            State('data-type-radio', 'value'),
+            State('aqi-standard-dropdown', 'value'),
+            State('aggregation-dropdown', 'value'),
+            prevent_initial_call=True
+        )
+        def select_compared(selected_level, n_clicks, selected_dataset, selected_pollutant, selected_continent,
+                            selected_year, selected_station_types, selected_data_type, selected_standard,
+                            selected_aggregation):
+            """
+            Fills the comparison with the most polluted cities or countries of the current ranking, or
+            clears it when the compared column or the dataset changes.
+
+            Args:
+                selected_level (str): The column compared (see comparison.COMPARISON_LEVELS).
+                n_clicks (int): Number of clicks on the 'Compare most polluted' button.
+                selected_dataset (str): The key of the dataset selected, None for the default dataset.
+                selected_pollutant, selected_continent, selected_year, selected_station_types, selected_data_type,
+                selected_standard, selected_aggregation: The selection of the ranking plots.
+
+            Returns:
+                list: The compared cities or countries.
+            """
+            if ctx.triggered_id != 'compare-top-button' or not selected_station_types:
+                return []
+            data = self.datasets.get(selected_dataset)
+            if str(selected_data_type) == 'AQI':
+                selected_pollutant = aqi_column(selected_pollutant, selected_standard)
+            ranking = data.group_ranking(selected_level, selected_pollutant, selected_year, selected_station_types,
+                                         selected_continent, selected_aggregation)
+            return [str(label) for label in ranking.sort_values(ascending=False).index[:MAX_COMPARED]]
+
+        @self.app.callback(
+            Output('comparison-graph', 'figure'),
+            Input('compare-dropdown', 'value'),
+            Input('compare-level-radio', 'value'),
+            Input('pollutant-dropdown', 'value'),
+            Input('from-to', 'value'),
+            Input('station-type-checklist', 'value'),
+            Input('data-type-radio', 'value'),
+            Input('aqi-standard-dropdown', 'value'),
+            Input('aggregation-dropdown', 'value'),
+            Input('dataset-dropdown', 'value')
+        )
+        def update_comparison(selected_groups, selected_level, selected_pollutant, selected_year,
+                              selected_station_types, selected_data_type, selected_standard, selected_aggregation,
+                              selected_dataset=None):
+            """
+            Draws the time series, AQI category distribution and ranking position of the compared
+            cities or countries.
+
+            Args:
+                selected_groups (list): The compared cities or countries.
+                selected_level (str): The column compared (see comparison.COMPARISON_LEVELS).
+                selected_pollutant (str): The pollutant selected from the dropdown.
+                selected_year (list): The range of years selected.
+                selected_station_types (list): The types of stations selected from the checklist.
+                selected_data_type (str): The data type selected (concentration or AQI).
+                selected_standard (str): The AQI standard selected from the dropdown.
+                selected_aggregation (str): The aggregation mode selected from the dropdown.
+                selected_dataset (str): The key of the dataset selected, None for the default dataset.
+
+            Returns:
+                go.Figure: The comparison figure.
+            """
+            if not selected_groups or not selected_station_types:
+                fig = go.Figure()
                 fig.update_layout(
-                    title=self.data.legend[selected_pollutant] + ' Concentration Across Different Countries in ' + self.data.continent_dict[selected_continent],
-                    xaxis_title='Year',
-                    yaxis_title=self.data.legend[selected_pollutant],
-                    legend_title='Country',
-                    template='plotly_white',
-                    showlegend=True
+                    title=f'Select up to {MAX_COMPARED} {COMPARISON_LEVELS[selected_level].lower()} names to compare',
+                    xaxis={"visible": False},
+                    yaxis={"visible": False},
+                    template='plotly_white'
                 )
+                return fig
+
+            data = self.datasets.get(selected_dataset)
+            comparison = compare_groups(data, selected_level, selected_groups, selected_pollutant, selected_year,
+                                        selected_station_types, selected_data_type, selected_standard,
+                                        selected_aggregation)
+            value = selected_pollutant
+            if str(selected_data_type) == 'AQI':
+                value = aqi_column(selected_pollutant, selected_standard)
+            yaxis_title = data.legend[value]
+            if selected_aggregation != 'mean':
+                yaxis_title += f' ({AGGREGATION_MODES[selected_aggregation].lower()})'
+            return create_comparison_figure(
+                comparison,
+                data.aqi_standards[selected_standard],
+                title=(f'{COMPARISON_LEVELS[selected_level]} comparison ({selected_year[0]}-{selected_year[1]}, '
+                       f'worldwide rank in the legend)'),
+                yaxis_title=yaxis_title)
+
+        @self.app.callback(
+            Output('distribution-graph', 'figure'),
+            Input('pollutant-dropdown', 'value'),
+            Input('continent-dropdown', 'value'),
+            Input('from-to', 'value'),
+            Input('aqi-standard-dropdown', 'value'),
+            Input('dataset-dropdown', 'value')
+        )
+        def update_distribution(selected_pollutant, selected_continent, selected_year, selected_standard='us_epa',
+                                selected_dataset=None):
+            """
+            Draws the share of station-years per AQI category of the selected pollutant and region per year.
+            The counts are only summed from the category histograms computed when the data was loaded.
+
+            Args:
+                selected_pollutant (str): The pollutant selected from the dropdown.
+                selected_continent (str): The continent selected from the dropdown.
+                selected_year (list): The range of years selected.
+                selected_standard (str): The key of the AQI standard selected.
+                selected_dataset (str): The key of the dataset selected, None for the default dataset.
+
+            Returns:
+                Figure: The stacked bar chart.
+            """
+            data = self.datasets.get(selected_dataset)
+            standard = data.aqi_standards[selected_standard]
+            distribution = category_distribution(data.category_histograms,
+                                                 category_column(selected_pollutant, selected_standard),
+                                                 selected_year, selected_continent)
+            pollutant_name = data.pollutant_type[selected_pollutant].replace(' Concentration', '')
+            title = (f'{standard.index_name} categories of {pollutant_name} in '
+                     f'{data.continent_dict[selected_continent]} ({selected_year[0]}-{selected_year[1]}, '
+                     f'all station types)')
+            return create_distribution_figure(distribution, standard, title)
+
+        @self.app.callback(
+            Output('anomaly-table', 'children'),
+            Input('pollutant-dropdown', 'value'),
+            Input('continent-dropdown', 'value'),
+            Input('from-to', 'value'),
+            Input('dataset-dropdown', 'value')
+        )
+        def update_anomalies(selected_pollutant, selected_continent, selected_year, selected_dataset=None):
+            """
+            Lists the strongest year-over-year jumps of the selected pollutant in the selected region and
+            time span, with the WHO guideline exceedances of the cities. The anomalies are only filtered
+            from the table computed when the data was loaded.
+
+            Args:
+                selected_pollutant (str): The pollutant selected from the dropdown.
+                selected_continent (str): The continent selected from the dropdown.
+                selected_year (list): The range of years selected.
+                selected_dataset (str): The key of the dataset selected, None for the default dataset.
+
+            Returns:
+                Component: A summary line and a table of the anomalies.
+            """
+            data = self.datasets.get(selected_dataset)
+            anomalies = top_anomalies(data.anomalies, selected_pollutant, selected_year, selected_continent)
+            summary = (f'Strongest year-over-year changes of {data.legend[selected_pollutant]} in '
+                       f'{data.continent_dict[selected_continent]} ({selected_year[0]}-{selected_year[1]}) with a '
+                       f'robust z-score of at least {ANOMALY_THRESHOLD} within the series of the city, all station types.')
+            if anomalies.empty:
+                return html.Div([html.Div(summary), html.Div('No anomalies in the selection.')])
+
+            table = pd.DataFrame({
+                'City': anomalies['city'].astype(str),
+                'Country': anomalies['country_name'].astype(str),
+                'Year': anomalies['year'].astype(int),
+                'Mean': anomalies['value'].round(1),
+                'Change': anomalies['yoy_change'].round(1),
+                'Robust z': anomalies['robust_z'].round(1),
+                'Records above WHO guideline': (anomalies['records_above_guideline'].astype(str) + ' of '
+                                                + anomalies['records'].astype(str)),
+                'Mean / WHO guideline': anomalies['guideline_ratio'].round(1)
+            })
+            return html.Div([html.Div(summary, style={'margin-bottom': '5px'}),
+                             dbc.Table.from_dataframe(table, striped=True, bordered=True, hover=True, size='sm')])
+
+        @self.app.callback(
+            Output('export-link', 'href'),
+            Input('pollutant-dropdown', 'value'),
+            Input('continent-dropdown', 'value'),
+            Input('from-to', 'value'),
+            Input('station-type-checklist', 'value'),
+            Input('data-type-radio', 'value'),
+            Input('aqi-standard-dropdown', 'value'),
+            Input('aggregation-dropdown', 'value'),
+            Input('export-table-dropdown', 'value'),
+            Input('export-format-radio', 'value'),
+            Input('export-compression-checklist', 'value'),
+            Input('dataset-dropdown', 'value')
+        )
+        def update_export_link(selected_pollutant, selected_continent, selected_year, selected_station_types,
+                               selected_data_type, selected_standard, selected_aggregation, selected_table,
+                               selected_format, selected_compression, selected_dataset=None):
+            """
+            Points the download link at the export of the current selection.
+
+            Args:
+                selected_pollutant (str): The pollutant selected from the dropdown.
+                selected_continent (str): The continent selected from the dropdown.
+                selected_year (list): The range of years selected.
+                selected_station_types (list): The types of stations selected from the checklist.
+                selected_data_type (str): The data type selected (concentration or AQI).
+                selected_standard (str): The AQI standard selected from the dropdown.
+                selected_aggregation (str): The aggregation mode selected from the dropdown.
+                selected_table (str): The table to export (see export.EXPORT_TABLES).
+                selected_format (str): The file format (see export.EXPORT_FORMATS).
+                selected_compression (list): ['gzip'] to compress the file.
+                selected_dataset (str): The key of the dataset selected, None for the default dataset.
+
+            Returns:
+                str: The URL of the export, None if no station type is selected.
+            """
+            if not selected_station_types:
+                return None
+            return export_url(selected_pollutant, selected_continent, selected_year, selected_station_types,
+                              selected_data_type, selected_standard, selected_aggregation, selected_table,
+                              selected_format, 'gzip' if selected_compression else '', selected_dataset)
+
+        @self.app.callback(
+            Output('nearest-latitude', 'value'),
+            Output('nearest-longitude', 'value'),
+            Input('station-locator', 'clickData')
+        )
+        def select_station(click_data):
+            """
+            Copies the coordinate of the station clicked on the station map into the coordinate inputs.
+
+            Args:
+                click_data (dict): The click event of the station map.
+
+            Returns:
+                tuple: Latitude and longitude of the clicked station.
+            """
+            if not click_data:
+                return no_update, no_update
+            point = click_data['points'][0]
+            return point['lat'], point['lon']
+
+        @self.app.callback(
+            Output('nearest-stations-table', 'children'),
+            Input('nearest-latitude', 'value'),
+            Input('nearest-longitude', 'value'),
+            Input('nearest-count', 'value'),
+            Input('nearest-radius', 'value'),
+            Input('aqi-standard-dropdown', 'value'),
+            Input('dataset-dropdown', 'value')
+        )
+        def update_nearest_stations(latitude, longitude, count, radius_km, selected_standard, selected_dataset=None):
+            """
+            Lists the latest readings and AQI of the stations nearest to a coordinate.
+
+            Args:
+                latitude (float): Latitude of the coordinate.
+                longitude (float): Longitude of the coordinate.
+                count (int): Number of stations to list.
+                radius_km (float): Optional search radius in km.
+                selected_standard (str): The AQI standard selected from the dropdown.
+                selected_dataset (str): The key of the dataset selected, None for the default dataset.
+
+            Returns:
+                Component: A table of the nearest stations.
+            """
+            if latitude is None or longitude is None:
+                return html.Div('Enter a latitude and longitude or click a station on the map.')
+            data = self.datasets.get(selected_dataset)
+            stations = data.nearest_stations(latitude, longitude, k=int(count or 5), radius_km=radius_km)
+            if stations.empty:
+                return html.Div('No station within the selected radius.')
+
+            index_name = data.aqi_standards[selected_standard].index_name
+            table = stations[['city', 'country_name', 'distance_km', 'year']].copy()
+            table.columns = ['City', 'Country', 'Distance (km)', 'Year']
+            table['Distance (km)'] = table['Distance (km)'].round(1)
+            table['Year'] = table['Year'].astype(int)
+            for pollutant, label in [('pm25', 'PM2.5'), ('pm10', 'PM10'), ('no2', 'NO2')]:
+                table[label] = stations[f'{pollutant}_concentration'].round(1)
+                table[f'{label} {index_name}'] = stations[aqi_column(pollutant, selected_standard)]
+            return dbc.Table.from_dataframe(table, striped=True, bordered=True, hover=True, size='sm')
 
-                # Generate top and bottom ranking plots
-                top_ranked_10, bottom_ranked_10, color_top, color_bottom = get_rank_10(df=filtered_df,
-                                                                                       selected_pollutant=selected_pollutant,
-                                                                                       selected_data_type=selected_data_type)
-
-                fig_bar_top_10 = create_ranking_plot(
-                    selected_data_type=selected_data_type,
-                    y=top_ranked_10[selected_pollutant].index,
-                    x=top_ranked_10[selected_pollutant].values,
-                    ranking_type='top',
-                    title=(f'Top 10 most polluted cities in {self.data.continent_dict[selected_continent]} ({selected_from_year}-{selected_to_year})\n'
-                           '(average values across timeframe are shown; low value is better)'),
-                    xlabel=f'{self.data.legend[selected_pollutant]}',
-                    color=color_top,
-                    text=top_ranked_10[selected_pollutant].values)
-
-                fig_bar_bottom_10 = create_ranking_plot(
-                    selected_data_type=selected_data_type,
-                    y=bottom_ranked_10[selected_pollutant].index,
-                    x=bottom_ranked_10[selected_pollutant].values,
-                    ranking_type='bottom',
-                    title=(f'Top 10 least polluted cities in {self.data.continent_dict[selected_continent]} ({selected_from_year}-{selected_to_year})\n'
-                           '(average values across timeframe are shown; low value is better)'),
-                    xlabel=f'{self.data.legend[selected_pollutant]}',
-                    color=color_bottom,
-                    text=bottom_ranked_10[selected_pollutant].values)
-
-                return fig, fig_bar_top_10, fig_bar_bottom_10, self.generate_folium_map(filtered_df, selected_pollutant)
+        # Keep a reference to the undecorated callbacks so they can be timed outside of a request
+        self.update_graph = update_graph
+        self.update_nearest_stations = update_nearest_stations
+        self.update_choropleth = update_choropleth
+        self.select_dataset = select_dataset
+        self.update_comparison = update_comparison
+        self.update_distribution = update_distribution
+        self.update_anomalies = update_anomalies
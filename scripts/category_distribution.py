@@ -0,0 +1,126 @@
+"""
+category_distribution.py
+
+Distribution of the station-years over the AQI categories. The stored int8 category columns (see
+aqi_standards.category_column) are counted once when the data is loaded into a compact histogram
+per region, country and year for every pollutant and standard, with one bincount per category
+column. The distribution chart only sums the rows of these histograms that fall into the
+selection, however many stations there are.
+"""
+
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+
+from aqi_standards import POLLUTANTS, category_column, load_standards
+
+# Group columns of the precomputed histograms
+HISTOGRAM_KEYS = ['who_region', 'country_name', 'year']
+
+
+def category_histograms(df, pollutants=POLLUTANTS, keys=HISTOGRAM_KEYS):
+    """
+    Counts the station-years per AQI category for every group of the key columns, every pollutant
+    and every registered standard.
+
+    Args:
+        df (DataFrame): The air quality data with the category columns of aqi_standards.compute_all_categories().
+        pollutants (list): The pollutant types counted.
+        keys (list): The group columns.
+
+    Returns:
+        DataFrame: The int32 counts indexed by the category 'column' and the key columns, one column per
+                   category code; groups without any value of a category column are left out.
+    """
+    n_categories = max(len(standard.labels) for standard in load_standards().values())
+    grouped = df.groupby(keys, observed=True, sort=True)
+    group_ids = grouped.ngroup().to_numpy()
+    groups = pd.MultiIndex.from_frame(grouped.size().reset_index()[keys])
+
+    histograms = []
+    for pollutant in pollutants:
+        for key in load_standards():
+            column = category_column(pollutant, key)
+            codes = df[column].to_numpy()
+            valid = (codes >= 0) & (group_ids >= 0)
+            counts = np.bincount(group_ids[valid] * n_categories + codes[valid],
+                                 minlength=len(groups) * n_categories).reshape(len(groups), n_categories)
+            present = counts.sum(axis=1) > 0
+            index = pd.MultiIndex.from_arrays(
+                [np.full(present.sum(), column)] + [groups.get_level_values(level)[present] for level in keys],
+                names=['column'] + keys)
+            histograms.append(pd.DataFrame(counts[present].astype(np.int32), index=index))
+
+    if not histograms:
+        return pd.DataFrame(index=pd.MultiIndex.from_arrays([[]] * (len(keys) + 1), names=['column'] + keys))
+    return pd.concat(histograms)
+
+
+def category_distribution(histograms, column, selected_year, selected_continent='', by='year'):
+    """
+    Sums the precomputed histograms of a category column over a selection of the dashboard.
+
+    Args:
+        histograms (DataFrame): The result of category_histograms().
+        column (str): The category column, see aqi_standards.category_column().
+        selected_year (list): The range of years selected, either bound may be 'all'.
+        selected_continent (str): The region code selected, '' for the whole world.
+        by (str): The key column the counts are summed per, e.g. 'year' or 'country_name'.
+
+    Returns:
+        DataFrame: The counts per category code, indexed by the values of `by`.
+    """
+    if column not in histograms.index.get_level_values('column'):
+        return pd.DataFrame(columns=histograms.columns)
+    selected = histograms.xs(column, level='column')
+    years = selected.index.get_level_values('year')
+    mask = np.ones(len(selected), dtype=bool)
+    if selected_year[0] != 'all':
+        mask &= years >= int(selected_year[0])
+    if selected_year[1] != 'all':
+        mask &= years <= int(selected_year[1])
+    if selected_continent:
+        mask &= selected.index.get_level_values('who_region') == selected_continent
+    selected = selected[mask]
+    counts = selected.groupby(selected.index.get_level_values(by), observed=True).sum()
+    counts.index.name = by
+    return counts
+
+
+def create_distribution_figure(distribution, standard, title):
+    """
+    Draws the share of station-years per AQI category as stacked bars, one bar per group.
+
+    Args:
+        distribution (DataFrame): The counts per category code, see category_distribution().
+        standard (AQIStandard): The standard defining the labels and colors of the categories.
+        title (str): The title of the figure.
+
+    Returns:
+        Figure: The stacked bar chart.
+    """
+    totals = distribution.sum(axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        shares = distribution.div(totals, axis=0)
+    x = [int(value) if isinstance(value, float) and value.is_integer() else value for value in distribution.index]
+
+    fig = go.Figure()
+    for code, (label, color) in enumerate(zip(standard.labels, standard.colors)):
+        fig.add_trace(go.Bar(
+            x=x,
+            y=shares[code] if code in shares.columns else np.zeros(len(shares)),
+            name=str(label),
+            marker_color=str(color),
+            customdata=np.stack([distribution[code] if code in distribution.columns else np.zeros(len(distribution)),
+                                 totals], axis=1),
+            hovertemplate='%{y:.0%} (%{customdata[0]} of %{customdata[1]} station-years)'
+        ))
+    fig.update_layout(
+        title=title,
+        barmode='stack',
+        yaxis_title='Share of station-years',
+        yaxis_tickformat='.0%',
+        legend_title=f'{standard.index_name} category',
+        template='plotly_white'
+    )
+    return fig
@@ -0,0 +1,124 @@
+"""
+choropleth.py
+
+Country level choropleth of the pollutants. The country outlines (data/world_countries.geojson,
+Natural Earth 1:110m admin 0 countries, public domain, identified by ISO3 code) are simplified
+once per process and served as a static file, so that a figure only carries the ISO3 codes and
+values of the countries, not their geometry.
+"""
+
+import json
+from functools import lru_cache
+from pathlib import Path
+
+import numpy as np
+import plotly.graph_objects as go
+
+WORLD_GEOJSON_PATH = Path(__file__).resolve().parent / "data" / "world_countries.geojson"
+
+# URL the simplified geometry is served at (see AirQualityCallbacks.register_geometry_route)
+WORLD_GEOJSON_URL = '/geometry/world_countries.geojson'
+
+# Tolerance of the simplification in degrees
+SIMPLIFY_TOLERANCE = 0.05
+
+
+def simplify_ring(points, tolerance):
+    """
+    Simplifies a closed ring of coordinates with the Ramer-Douglas-Peucker algorithm.
+
+    Args:
+        points (np.ndarray): The coordinates of the ring, shape (n, 2), first point equal to the last.
+        tolerance (float): Maximum distance of a removed point to the simplified outline.
+
+    Returns:
+        np.ndarray: The remaining coordinates. Rings that would collapse are returned unchanged.
+    """
+    n = len(points)
+    if n <= 4:
+        return points
+    keep = np.zeros(n, dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, n - 1)]
+    while stack:
+        start, end = stack.pop()
+        if end - start < 2:
+            continue
+        inner = points[start + 1:end]
+        direction = points[end] - points[start]
+        offset = inner - points[start]
+        length = np.hypot(*direction)
+        if length == 0:
+            distance = np.hypot(offset[:, 0], offset[:, 1])
+        else:
+            distance = np.abs(direction[0] * offset[:, 1] - direction[1] * offset[:, 0]) / length
+        farthest = int(np.argmax(distance))
+        if distance[farthest] > tolerance:
+            split = start + 1 + farthest
+            keep[split] = True
+            stack.extend([(start, split), (split, end)])
+    simplified = points[keep]
+    return simplified if len(simplified) >= 4 else points
+
+
+@lru_cache(maxsize=None)
+def load_world_geometry(tolerance=SIMPLIFY_TOLERANCE):
+    """
+    Loads the bundled country outlines and simplifies them. The result is cached,
+    so the geometry is read and simplified once per process.
+
+    Args:
+        tolerance (float): Tolerance of the simplification in degrees.
+
+    Returns:
+        str: The simplified GeoJSON feature collection, serialized. The feature ids are ISO3 codes.
+    """
+    with open(WORLD_GEOJSON_PATH, 'r') as f:
+        world = json.load(f)
+    for feature in world['features']:
+        geometry = feature['geometry']
+        polygons = geometry['coordinates'] if geometry['type'] == 'MultiPolygon' else [geometry['coordinates']]
+        polygons = [[np.round(simplify_ring(np.asarray(ring, dtype=float), tolerance), 3).tolist() for ring in polygon]
+                    for polygon in polygons]
+        geometry['coordinates'] = polygons if geometry['type'] == 'MultiPolygon' else polygons[0]
+    return json.dumps(world, separators=(',', ':'))
+
+
+def create_choropleth(iso3, values, title, colorbar_title, standard=None, region_view=False):
+    """
+    Creates a choropleth of values per country. The geometry is referenced by URL and loaded once by the browser.
+
+    Args:
+        iso3 (list): ISO3 codes of the countries.
+        values (list): The values of the countries.
+        title (str): Title of the figure.
+        colorbar_title (str): Title of the color bar.
+        standard (AQIStandard, optional): If given, the values are index values colored by its categories.
+        region_view (bool): Whether to zoom to the countries shown instead of the whole world.
+
+    Returns:
+        go.Figure: The choropleth.
+    """
+    if standard is not None:
+        # Stepped color scale with one color per category of the standard
+        colorscale = []
+        bounds = [float(bound) for bound in np.minimum(standard.category_bounds / standard.max_index, 1.0)] + [1.0]
+        for i, color in enumerate(standard.colors):
+            colorscale += [[bounds[i], str(color)], [bounds[i + 1], str(color)]]
+        color_options = dict(colorscale=colorscale, zmin=0, zmax=standard.max_index)
+    else:
+        color_options = dict(colorscale='YlOrRd')
+
+    fig = go.Figure(go.Choropleth(
+        geojson=WORLD_GEOJSON_URL,
+        featureidkey='id',
+        locations=iso3,
+        z=np.round(values, 2),
+        marker_line_width=0.5,
+        colorbar_title=colorbar_title,
+        **color_options
+    ))
+    fig.update_geos(showcountries=True, showframe=False, projection_type='natural earth',
+                    fitbounds='locations' if region_view else False)
+    fig.update_layout(title=title, margin=dict(l=0, r=0, t=40, b=0), height=500)
+    return fig
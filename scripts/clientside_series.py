@@ -0,0 +1,126 @@
+"""
+clientside_series.py
+
+Compact pre-aggregated payload of the main plot for the optional client side mode (CLIENTSIDE_SERIES
+in main.py). The rows of the selected region are reduced to sums and counts per (group, year, station
+types), where the station types of a row are a bit mask over the keys of the station type checklist.
+The browser filters these cells by time span and station types and recomputes the lines itself
+(assets/clientside_series.js), so moving the time span slider or toggling a station type needs no
+request to the server. Only the aggregation modes with a fixed weight per row can be recombined from
+sums like this; the median modes need the rows and the station weights depend on the selected
+station types (see aggregation.station_weights), so these modes are left to the server.
+
+The arrays are sent as base64 encoded little-endian typed arrays, which the browser decodes into
+Float64Array, Int32Array, ... views without parsing one JSON number per cell.
+"""
+
+import base64
+
+import numpy as np
+import pandas as pd
+
+from aggregation import WEIGHT_COLUMNS
+from query_backend import selection_mask, station_type_pattern
+
+# Aggregation modes that are recombined from sums in the browser
+CLIENTSIDE_MODES = ['mean', 'population_weighted']
+
+# Type of every array of the payload, as named by the browser's typed arrays
+ARRAY_TYPES = {
+    'group': ('<u2', 'Uint16Array'),
+    'year': ('<i2', 'Int16Array'),
+    'mask': ('<u4', 'Uint32Array'),
+    'count': ('<u4', 'Uint32Array'),
+    'sum': ('<f8', 'Float64Array'),
+    'sum_squares': ('<f8', 'Float64Array'),
+    'weighted_sum': ('<f8', 'Float64Array'),
+    'weight': ('<f8', 'Float64Array')
+}
+
+
+def station_type_masks(types, station_type_keys):
+    """
+    Returns the bit mask of the checklist keys matching every station type text: bit i is set if the
+    text contains the i-th key as a whole word, as selection_mask() matches them.
+
+    Args:
+        types (Series): The station type text of every row, NaN if unknown.
+        station_type_keys (list): The keys of the checklist besides 'all', at most 32.
+
+    Returns:
+        np.ndarray: The mask of every row (uint32), 0 for rows only selected by 'all'.
+    """
+    codes, uniques = pd.factorize(types.astype(object))
+    unique_masks = np.zeros(len(uniques), dtype=np.uint32)
+    texts = pd.Series(uniques, dtype=object)
+    for bit, key in enumerate(station_type_keys):
+        matches = texts.str.contains(station_type_pattern([key]), na=False).to_numpy()
+        unique_masks[matches] |= np.uint32(1 << bit)
+    return np.where(codes >= 0, unique_masks[np.maximum(codes, 0)], 0).astype(np.uint32)
+
+
+def encode_array(values, dtype):
+    """
+    Encodes an array as base64 text of its little-endian bytes.
+    """
+    return base64.b64encode(np.ascontiguousarray(values, dtype=dtype).tobytes()).decode('ascii')
+
+
+def decode_array(text, dtype):
+    """
+    Decodes an array encoded by encode_array().
+    """
+    return np.frombuffer(base64.b64decode(text), dtype=dtype)
+
+
+def series_payload(df, value, group_column, station_type_keys, selected_continent='', selected_aggregation='mean'):
+    """
+    Reduces the rows of a region to the cells the browser draws the main plot from.
+
+    Args:
+        df (DataFrame): The air quality data.
+        value (str): The column drawn.
+        group_column (str): The column of the lines, 'who_region' or 'country_name'.
+        station_type_keys (list): The keys of the station type checklist besides 'all'.
+        selected_continent (str): The region code selected, '' for the whole world.
+        selected_aggregation (str): One of CLIENTSIDE_MODES.
+
+    Returns:
+        dict: The 'groups' (labels of the group codes), the 'station_types' (checklist key of every
+              mask bit), the 'aggregation', the number of 'cells' and the encoded 'arrays': per cell the
+              'group' code, 'year', station type 'mask', 'count' of values, their 'sum' and 'sum_squares'
+              and, for the population-weighted mode, the 'weighted_sum' and 'weight' of the values.
+    """
+    if selected_aggregation not in CLIENTSIDE_MODES:
+        raise ValueError(f"Aggregation mode '{selected_aggregation}' cannot be computed in the browser")
+    rows = df[selection_mask(df, ['all', 'all'], ['all'], selected_continent)]
+    rows = rows[rows[group_column].notna() & rows['year'].notna()]
+
+    groups = rows[group_column].astype('category').cat.remove_unused_categories()
+    values = rows[value].to_numpy(dtype=float)
+    present = ~np.isnan(values)
+    cells = pd.DataFrame({
+        'group': groups.cat.codes.to_numpy(),
+        'year': rows['year'].to_numpy(dtype=np.int64),
+        'mask': station_type_masks(rows['type_of_stations'], station_type_keys),
+        'count': present.astype(np.int64),
+        'sum': np.where(present, values, 0.0),
+        'sum_squares': np.where(present, values ** 2, 0.0)
+    })
+    names = ['group', 'year', 'mask', 'count', 'sum', 'sum_squares']
+    if selected_aggregation in WEIGHT_COLUMNS:
+        weights = np.where(present, rows[WEIGHT_COLUMNS[selected_aggregation]].to_numpy(dtype=float), 0.0)
+        weights = np.nan_to_num(weights)
+        cells['weighted_sum'] = np.where(present, values, 0.0) * weights
+        cells['weight'] = weights
+        names += ['weighted_sum', 'weight']
+    cells = cells.groupby(['group', 'year', 'mask'], sort=True).sum().reset_index()
+
+    return {
+        'groups': [str(group) for group in groups.cat.categories],
+        'station_types': list(station_type_keys),
+        'aggregation': selected_aggregation,
+        'cells': len(cells),
+        'arrays': {name: {'type': ARRAY_TYPES[name][1], 'data': encode_array(cells[name], ARRAY_TYPES[name][0])}
+                   for name in names}
+    }
@@ -0,0 +1,167 @@
+"""
+comparison.py
+
+Comparison of selected cities or countries. The rows of the compared groups are looked up in an
+index over the categorical group column, so a comparison only touches the rows of the compared
+groups. Their time series and AQI category distribution are then computed with one groupby and
+one bincount over those rows, without a loop per group, so the latency barely depends on the
+number of groups compared. Their ranking positions are looked up in the ranking of all groups,
+which is aggregated once per selection and cached by the data (see AirQualityData.group_ranking).
+"""
+
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+from plotly.subplots import make_subplots
+
+from aggregation import aggregate
+from aqi_standards import aqi_column, category_column
+from query_backend import filter_rows
+
+# Maximum number of groups compared at once
+MAX_COMPARED = 8
+
+# Columns that can be compared and their names in the dashboard
+COMPARISON_LEVELS = {
+    'city': 'City',
+    'country_name': 'Country'
+}
+
+# Line colors of the compared groups
+COMPARISON_COLORS = ['#1f77b4', '#ff7f0e', '#2ca02c', '#d62728', '#9467bd', '#8c564b', '#e377c2', '#17becf']
+
+
+class GroupIndex:
+    """
+    An index over a categorical column: the row positions sorted by category, with the start of
+    every category, so that the rows of a few categories are found without scanning the column.
+
+    Attributes:
+        categories: The categories of the column.
+        order: The row positions sorted by category code (rows with missing values first).
+        offsets: The position in `order` where the rows of every category start, with a final end offset.
+
+    Methods:
+        positions(labels):
+            Returns the row positions of the given categories.
+    """
+
+    def __init__(self, column):
+        """
+        Builds the index.
+
+        Args:
+            column (Series): A categorical column.
+        """
+        codes = column.cat.codes.to_numpy()
+        self.categories = column.cat.categories
+        self.order = np.argsort(codes, kind='stable')
+        self.offsets = np.searchsorted(codes[self.order], np.arange(len(self.categories) + 1))
+
+    def positions(self, labels):
+        """
+        Returns the row positions of the given categories, unknown labels are ignored.
+
+        Args:
+            labels (list): The categories.
+
+        Returns:
+            np.ndarray: The row positions, grouped by category.
+        """
+        codes = self.categories.get_indexer(labels)
+        codes = codes[codes >= 0]
+        if not len(codes):
+            return np.empty(0, dtype=np.int64)
+        return np.concatenate([self.order[self.offsets[code]:self.offsets[code + 1]] for code in codes])
+
+
+def compare_groups(data, level, labels, selected_pollutant, selected_year, selected_station_types,
+                   selected_data_type='Concentration', selected_standard='us_epa', selected_aggregation='mean'):
+    """
+    Computes the comparison of cities or countries. The rows of the compared groups are taken from
+    the group index of the data and filtered by time span and station types; the region selection
+    does not apply, as the groups may lie in different regions.
+
+    Args:
+        data (AirQualityData): The dataset.
+        level (str): The column compared, one of the keys of COMPARISON_LEVELS.
+        labels (list): The compared cities or countries, at most MAX_COMPARED are used.
+        selected_pollutant (str): The pollutant column, e.g. 'pm25_concentration'.
+        selected_year (list): The range of years selected.
+        selected_station_types (list): The types of stations selected.
+        selected_data_type (str): 'Concentration' or 'AQI'.
+        selected_standard (str): The key of the AQI standard of the categories (and values in 'AQI' mode).
+        selected_aggregation (str): The aggregation mode (see aggregation.py).
+
+    Returns:
+        dict: 'series' (groups x years) of the aggregated value, 'distribution' (groups x categories)
+              with the share of station-years per AQI category, and 'ranks' indexed by group with the
+              columns 'value', 'rank' and 'ranked' (the number of ranked groups).
+    """
+    labels = list(dict.fromkeys(labels))[:MAX_COMPARED]
+    value = selected_pollutant
+    if str(selected_data_type) == 'AQI':
+        value = aqi_column(selected_pollutant, selected_standard)
+    standard = data.aqi_standards[selected_standard]
+
+    rows = data.df.iloc[data.group_index(level).positions(labels)]
+    rows = filter_rows(rows, selected_year, selected_station_types)
+
+    # Time series of all compared groups in one groupby
+    series = aggregate(rows, [level, 'year'], value, selected_aggregation)[value].unstack('year')
+    series = series.reindex([label for label in labels if label in series.index])
+
+    # Share of station-years per AQI category, counted for all groups at once
+    group_positions = pd.Index(labels).get_indexer(rows[level].astype(object))
+    categories = rows[category_column(selected_pollutant, selected_standard)].to_numpy()
+    valid = (group_positions >= 0) & (categories >= 0)
+    n_categories = len(standard.labels)
+    counts = np.bincount(group_positions[valid] * n_categories + categories[valid],
+                         minlength=len(labels) * n_categories).reshape(len(labels), n_categories)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        shares = counts / counts.sum(axis=1, keepdims=True)
+    distribution = pd.DataFrame(shares, index=labels, columns=[str(label) for label in standard.labels])
+
+    # Position of every compared group in the ranking of all groups of the time span, most polluted first.
+    # The ranking covers the whole table and is cached per selection by the data, unlike the compared rows.
+    ranked = data.group_ranking(level, value, selected_year, selected_station_types, '', selected_aggregation)
+    ranks = pd.DataFrame({'value': ranked, 'rank': ranked.rank(ascending=False, method='min')}).reindex(labels)
+    ranks['ranked'] = len(ranked)
+    return {'series': series, 'distribution': distribution, 'ranks': ranks}
+
+
+def create_comparison_figure(comparison, standard, title, yaxis_title):
+    """
+    Draws a comparison: the time series on the left and the AQI category distribution on the right,
+    with the ranking position of every group in its legend entry.
+
+    Args:
+        comparison (dict): The result of compare_groups().
+        standard (AQIStandard): The standard of the categories, defining their colors.
+        title (str): Title of the figure.
+        yaxis_title (str): Title of the y axis of the time series.
+
+    Returns:
+        go.Figure: The figure.
+    """
+    fig = make_subplots(rows=1, cols=2, column_widths=[0.6, 0.4], horizontal_spacing=0.12,
+                        subplot_titles=['Time series', f'{standard.index_name} categories (share of station-years)'])
+    ranks = comparison['ranks']
+    for i, (group, line) in enumerate(comparison['series'].iterrows()):
+        line = line.dropna()
+        rank = ranks.loc[group]
+        position = f" (#{int(rank['rank'])} of {int(rank['ranked'])})" if not np.isnan(rank['rank']) else ''
+        fig.add_trace(go.Scatter(x=line.index, y=line.values, mode='lines+markers', name=f'{group}{position}',
+                                 line=dict(color=COMPARISON_COLORS[i % len(COMPARISON_COLORS)])), row=1, col=1)
+
+    distribution = comparison['distribution'].iloc[::-1]
+    for label, color in zip(distribution.columns, standard.colors):
+        fig.add_trace(go.Bar(y=distribution.index, x=distribution[label] * 100, name=label, orientation='h',
+                             marker_color=str(color), legendgroup='categories', showlegend=False,
+                             hovertemplate=f'{label}: %{{x:.0f}} %<extra>%{{y}}</extra>'), row=1, col=2)
+
+    fig.update_layout(title=title, barmode='stack', template='plotly_white', height=450)
+    fig.update_xaxes(title_text='Year', row=1, col=1)
+    fig.update_yaxes(title_text=yaxis_title, row=1, col=1)
+    fig.update_xaxes(title_text='%', range=[0, 100], row=1, col=2)
+    return fig
@@ -1,13 +1,106 @@
+import json
+import os
+import threading
+import zlib
+from collections import OrderedDict
+from functools import lru_cache
+from pathlib import Path
 import pandas as pd
 import numpy as np
-from datahandling import calculate_aqi
+from datahandling import MEASUREMENT_COLUMNS, normalize_columns, validate_data, validate_measurements
+from aqi_standards import STANDARDS_PATH, load_standards, compute_all_categories, compute_all_standards, aqi_column
+from aggregation import AGGREGATION_MODES, available_modes
+from spatial_index import StationIndex
+from map import STATION_MAP_MAX_ZOOM, compute_zoom_clusters
+from query_backend import PandasBackend, create_backend, filter_rows
+from temporal_rollups import TIMESTAMP_COLUMN, MeasurementRollups, choose_resolution
+from comparison import GroupIndex
+from anomaly_detection import detect_anomalies
+from category_distribution import category_histograms
+
+# Columns used as group keys, stored as categoricals so that groupbys reuse the precomputed codes
+GROUP_COLUMNS = ['who_region', 'iso3', 'country_name', 'city']
+
+# Bump when the cleaning changes so that stale caches next to the data files are rebuilt
+CLEAN_CACHE_VERSION = 4
+
+# Number of datasets kept in memory by a DatasetRegistry, the least recently used one is released first
+MAX_RESIDENT_DATASETS = 2
+
+# Maximum number of points per series of the main plot, about the width of the chart in pixels.
+# Timestamped data is drawn from the coarsest rollup that still fills the chart (see temporal_rollups.py).
+MAX_SERIES_POINTS = 800
+
+
+def read_source(data_path, sheet_name=None):
+    """
+    Reads a data source by its file type: Excel workbooks (one sheet), CSV or Parquet files.
+
+    Args:
+        data_path (str): The path to the data file.
+        sheet_name (str): The sheet to read from an Excel workbook, ignored for other file types.
+
+    Returns:
+        DataFrame: The raw data.
+    """
+    suffix = Path(data_path).suffix.lower()
+    if suffix == '.csv':
+        return pd.read_csv(data_path)
+    if suffix == '.parquet':
+        return pd.read_parquet(data_path)
+    return pd.read_excel(data_path, sheet_name=sheet_name if sheet_name is not None else 0)
+
+
+def clean_source(df):
+    """
+    Maps the columns of a raw source to the schema of the WHO V6.1 sheet and validates it. Timestamped
+    measurements are rolled up (see temporal_rollups.py) and the data of the dashboard is their yearly
+    rollup, one row per station and year as in the WHO sheet.
+
+    Args:
+        df (DataFrame): The raw data.
+
+    Returns:
+        tuple: The cleaned DataFrame, the validation report and the MeasurementRollups of timestamped
+               sources (None for yearly data).
+    """
+    df = normalize_columns(df)
+    if TIMESTAMP_COLUMN not in df.columns:
+        return *validate_data(df), None
+    measurements, report = validate_measurements(df)
+    rollups = MeasurementRollups(measurements, MEASUREMENT_COLUMNS)
+    return rollups.means('year').drop(columns='period'), report, rollups
+
+
+def add_derived_columns(df):
+    """
+    Adds the AQI values and categories of every standard and stores the group columns as categoricals.
+
+    Args:
+        df (DataFrame): The cleaned air quality data.
+
+    Returns:
+        DataFrame: The data with the added columns.
+    """
+    # Calculate the index values of every AQI standard in one pass and add them to the DataFrame
+    df = df.assign(**compute_all_standards(df))
+    # Store the category of every index value as int8 codes, read by the comparison and the distribution chart
+    df = df.assign(**compute_all_categories(df))
+
+    # Index the group columns, so that the groupbys of the aggregation modes reuse their codes
+    for column in GROUP_COLUMNS:
+        if column in df.columns:
+            df[column] = df[column].astype('category')
+    return df
 
 class AirQualityData:
     """
     A class to handle the loading and processing of air quality data.
 
     Attributes:
-        df: A pandas DataFrame containing the air quality data.
+        df: A pandas DataFrame containing the validated and cleaned air quality data.
+        validation_report: A dictionary summarizing the rows dropped, blanked or flagged during cleaning.
+        rollups: The MeasurementRollups of timestamped data (see temporal_rollups.py), None for yearly data.
         legend: A dictionary for mapping pollutant columns to their full names.
         continent_dict: A dictionary mapping continent codes to their names.
         reverse_continent_dict: A dictionary mapping continent names to their codes.
@@ -18,39 +111,168 @@ class AirQualityData:
         continents_options: A list of dictionaries for continent options for dropdown menus.
         pollutants_options: A list of dictionaries for pollutant options for dropdown menus.
         stations_options: A list of dictionaries for station type options for dropdown menus.
+        aqi_standards: A dictionary mapping AQI standard keys to the compiled standards.
+        standards_options: A list of dictionaries for AQI standard options for dropdown menus.
+        aggregation_options: A list of dictionaries for the aggregation modes available for the data.
+        stations: A DataFrame with the latest reading of every station (identified by its coordinates).
+        station_index: A StationIndex over the coordinates of the stations.
+        station_clusters: The stations clustered per map zoom level, as JSON (see map.compute_zoom_clusters).
+        station_clusters_version: A checksum of station_clusters, part of the URL they are served at.
         years_options: A list of dictionaries for year options for dropdown menus.
+        year_range: The first and last year of the data.
+        query: The query backend answering the filtered aggregations of the callbacks (see query_backend.py).
+        anomalies: The year-over-year anomalies and WHO guideline exceedances of every city and pollutant
+                   (see anomaly_detection.py).
+        category_histograms: The number of station-years per AQI category of every region, country and year,
+                             per pollutant and standard (see category_distribution.py).
 
     Methods:
-        __init__(data_path, sheet_name="Update 2024 (V6.1)"):
+        __init__(data_path, sheet_name="Update 2024 (V6.1)", use_cache=True, backend='pandas'):
             Initializes the AirQualityData with the given data path and sheet name.
+        from_dataframe(df, backend='pandas'):
+            Creates an AirQualityData from an already loaded DataFrame.
+        load_data(data_path, sheet_name, use_cache=True):
+            Loads, normalizes and cleans the data, reusing the cleaned cache next to the data file if it is up to date.
+        process_data():
+            Adds the AQI values and builds the mappings and dropdown options.
+        append_measurements(measurements):
+            Adds new timestamped measurements to the rollups and rebuilds the yearly data.
+        filter_data(selected_year, selected_station_types, selected_continent=''):
+            Returns the rows matching the selected time span, station types and region.
+        series_resolution(selected_year, max_points=MAX_SERIES_POINTS):
+            Returns the resolution of the time series of a time span.
+        series_query(resolution):
+            Returns the query backend answering the time series at a resolution.
+        group_index(column):
+            Returns the index of the rows of every city or country.
+        nearest_stations(latitude, longitude, k=5, radius_km=None):
+            Returns the latest readings of the stations nearest to a coordinate.
+        country_aggregates(value, selected_year, selected_station_types, selected_continent='', selected_aggregation='mean'):
+            Returns the aggregated value per country (ISO3 code) for a selection, cached per selection.
+        group_ranking(level, value, selected_year, selected_station_types, selected_continent='', selected_aggregation='mean'):
+            Returns the aggregated value of every city or country for a selection, cached per selection.
     """
 
-    def __init__(self, data_path, sheet_name="Update 2024 (V6.1)"):
+    def __init__(self, data_path, sheet_name="Update 2024 (V6.1)", use_cache=True, backend='pandas'):
         """
         Initializes the AirQualityData with the given data path and sheet name.
 
         Args:
-            data_path (str): The path to the data file.
+            data_path (str): The path to the data file (Excel, CSV or Parquet).
             sheet_name (str): The sheet name in the Excel file. Defaults to "Update 2024 (V6.1)".
+            use_cache (bool): Whether to read and write the cleaned data cache. Defaults to True.
+            backend (str): The query backend, 'pandas' or 'duckdb' (see query_backend.py). The 'duckdb'
+                           backend queries a Parquet copy of the processed data next to the data file,
+                           which is reused like the cleaned data cache.
+        """
+        self.df, self.validation_report, self.rollups = self.load_data(data_path, sheet_name, use_cache)
+        self.process_data()
+        sheet_suffix = '' if sheet_name is None else '.' + ''.join(c if c.isalnum() else '_' for c in sheet_name)
+        # The Parquet copy holds the AQI values too, so it also depends on the standards file
+        version = (f"{CLEAN_CACHE_VERSION}:{os.path.getmtime(data_path)}:{os.path.getmtime(STANDARDS_PATH)}"
+                   if use_cache else None)
+        self.query = create_backend(backend, self, f"{data_path}{sheet_suffix}.clean.parquet", version)
+
+    @classmethod
+    def from_dataframe(cls, df, backend='pandas'):
+        """
+        Creates an AirQualityData from an already loaded DataFrame, e.g. for generated test data.
+
+        Args:
+            df (DataFrame): The raw air quality data in the layout of the WHO spreadsheet or one of its aliases.
+            backend (str): The query backend, 'pandas' or 'duckdb' (in memory).
+
+        Returns:
+            AirQualityData: The validated and processed data.
+        """
+        data = cls.__new__(cls)
+        data.df, data.validation_report, data.rollups = clean_source(df)
+        data.process_data()
+        data.query = create_backend(backend, data)
+        return data
+
+    @staticmethod
+    def load_data(data_path, sheet_name, use_cache=True):
+        """
+        Loads the data, maps its columns to the schema of the WHO V6.1 sheet and validates it. The cleaned
+        result is cached as a pickle next to the data file and reused as long as the data file has not been modified.
+
+        Args:
+            data_path (str): The path to the data file (Excel, CSV or Parquet).
+            sheet_name (str): The sheet name in the Excel file, None for other file types.
+            use_cache (bool): Whether to read and write the cleaned data cache.
+
+        Returns:
+            tuple: The cleaned DataFrame, the validation report and the rollups of timestamped data, see clean_source().
+        """
+        sheet_suffix = '' if sheet_name is None else '.' + ''.join(c if c.isalnum() else '_' for c in sheet_name)
+        cache_path = f"{data_path}{sheet_suffix}.clean.pkl"
+        source_mtime = os.path.getmtime(data_path)
+
+        if use_cache and os.path.exists(cache_path):
+            cached = pd.read_pickle(cache_path)
+            if cached.get('version') == CLEAN_CACHE_VERSION and cached.get('source_mtime') == source_mtime:
+                return cached['df'], cached['report'], cached['rollups']
+
+        # Load the data, map its columns and drop or repair invalid rows
+        df, report, rollups = clean_source(read_source(data_path, sheet_name))
+
+        if use_cache:
+            try:
+                pd.to_pickle({'version': CLEAN_CACHE_VERSION, 'source_mtime': source_mtime,
+                              'df': df, 'report': report, 'rollups': rollups}, cache_path)
+            except OSError:
+                # A read only data folder only costs the cache, not the dashboard
+                pass
+        return df, report, rollups
+
+    def process_data(self):
         """
-        
-        # Load the data from the Excel file
-        self.df = pd.read_excel(data_path, sheet_name=sheet_name)
-        
-        # Calculate AQI values and add them to the DataFrame
-        self.df["pm25_aqi"] = pd.DataFrame(calculate_aqi("pm25", (self.df["pm25_concentration"]).to_numpy()))
-        self.df["pm10_aqi"] = pd.DataFrame(calculate_aqi("pm10", (self.df["pm10_concentration"]).to_numpy()))
-        self.df["no2_aqi"] = pd.DataFrame(calculate_aqi("no2", (self.df["no2_concentration"]).to_numpy()))
+        Adds the AQI values to the data and builds the mappings and options used by the dashboard.
+        """
+        # AQI values, their categories and categorical group columns
+        self.aqi_standards = load_standards()
+        self.df = add_derived_columns(self.df)
+
+        # Per country aggregates are cached per selection, as the choropleth requests them on every change
+        self._country_aggregates = lru_cache(maxsize=256)(self._compute_country_aggregates)
+        # So are the rankings of all cities or countries the comparison places the compared ones in
+        self._group_rankings = lru_cache(maxsize=256)(self._compute_group_ranking)
+
+        # Query backends of the finer rollups of timestamped data, created on first use
+        self._series_queries = {}
+
+        # Row indexes over the compared group columns, created on first use
+        self._group_indexes = {}
+
+        # Year-over-year anomalies and WHO guideline exceedances of every city, filtered by the anomaly panel
+        # Without a process pool: the data may be loaded within a request of the threaded server
+        self.anomalies = detect_anomalies(self.df, workers=1)
+
+        # Station-years per AQI category of every region, country and year, summed by the distribution chart
+        self.category_histograms = category_histograms(self.df)
+
+        # Latest reading of every station and a spatial index over their coordinates
+        station_rows = self.df.dropna(subset=['latitude', 'longitude']).sort_values('year', kind='stable')
+        self.stations = station_rows.drop_duplicates(subset=['latitude', 'longitude'], keep='last').reset_index(drop=True)
+        self.station_index = StationIndex(self.stations['latitude'], self.stations['longitude'])
+
+        # Station clusters of every map zoom level, encoded once and served to the maps, with a checksum
+        # in their URL so that the browser fetches them again only when the stations change
+        self.station_clusters = json.dumps(
+            compute_zoom_clusters(self.stations['latitude'], self.stations['longitude'], max_zoom=STATION_MAP_MAX_ZOOM),
+            separators=(',', ':'))
+        self.station_clusters_version = f'{zlib.crc32(self.station_clusters.encode()):08x}'
 
         # Define legends for pollutants
         self.legend = {
             'pm10_concentration': 'PM10 Concentration',
             'pm25_concentration': 'PM2.5 Concentration',
-            'no2_concentration': 'NO2 Concentration',
-            'pm10_aqi': 'PM10 AQI',
-            'pm25_aqi': 'PM2.5 AQI',
-            'no2_aqi': 'NO2 AQI'
+            'no2_concentration': 'NO2 Concentration'
         }
+        for key, standard in self.aqi_standards.items():
+            for pollutant, label in [('pm10', 'PM10'), ('pm25', 'PM2.5'), ('no2', 'NO2')]:
+                self.legend[aqi_column(pollutant, key)] = f'{label} {standard.index_name}'
 
         # Define continent mappings
         self.continent_dict = {
@@ -94,8 +316,343 @@ class AirQualityData:
         self.continents_options = [{'label': name, 'value': key} for key, name in self.continent_dict.items()]
         self.pollutants_options = [{'label': name, 'value': key} for key, name in self.pollutant_type.items()]
         self.stations_options = [{'label': name, 'value': key} for key, name in self.station_type.items()]
+        self.standards_options = [{'label': standard.name, 'value': key} for key, standard in self.aqi_standards.items()]
+        self.aggregation_options = [{'label': AGGREGATION_MODES[mode], 'value': mode} for mode in available_modes(self.df)]
 
         # Generate options for year dropdown menu
         all_years = np.array(((self.df["year"].dropna().unique()).astype(int)), dtype=str)
         all_years = np.append(all_years, 'all')
-        self.years_options = [{'label': name, 'value': name} for name in all_years]
\ No newline at end of file
+        self.years_options = [{'label': name, 'value': name} for name in all_years]
+        self.year_range = (int(self.df['year'].min()), int(self.df['year'].max())) if len(self.df) else (2013, 2022)
+
+    def filter_data(self, selected_year, selected_station_types, selected_continent=''):
+        """
+        Returns the rows matching the selection of the dashboard.
+
+        Args:
+            selected_year (list): The range of years selected, either bound may be 'all'.
+            selected_station_types (list): The types of stations selected, ['all'] for every station.
+            selected_continent (str): The region code selected, '' for the whole world.
+
+        Returns:
+            DataFrame: The filtered data.
+        """
+        return filter_rows(self.df, selected_year, selected_station_types, selected_continent)
+
+    def append_measurements(self, measurements):
+        """
+        Adds new timestamped measurements, e.g. the latest readings of a sensor feed. Only the new
+        readings are rolled up and added to the periods they fall into (see temporal_rollups.py); the
+        yearly data and everything derived from it are then rebuilt from the small yearly rollup.
+        The readings must not have been added before, as they would be counted twice.
+
+        Args:
+            measurements (DataFrame): The raw measurements, in the layout of the source of the data.
+
+        Returns:
+            dict: The validation report of the new measurements.
+        """
+        if self.rollups is None:
+            raise ValueError("Measurements can only be appended to data loaded from timestamped measurements")
+        measurements, report = validate_measurements(normalize_columns(measurements))
+        self.rollups.append(measurements)
+        self.df = self.rollups.means('year').drop(columns='period')
+        self.process_data()
+        self.query = create_backend(self.query.name, self, getattr(self.query, 'parquet_path', None))
+        return report
+
+    def series_resolution(self, selected_year, max_points=MAX_SERIES_POINTS):
+        """
+        Returns the resolution of the time series of a time span: yearly data has one resolution, timestamped
+        data is drawn from the coarsest rollup that still has a value for every point of the chart.
+
+        Args:
+            selected_year (list): The range of years selected, either bound may be 'all'.
+            max_points (int): The maximum number of points per series.
+
+        Returns:
+            str: 'hour', 'day', 'month' or 'year'.
+        """
+        if self.rollups is None:
+            return 'year'
+        first_year = self.year_range[0] if selected_year[0] == 'all' else int(selected_year[0])
+        last_year = self.year_range[1] if selected_year[1] == 'all' else int(selected_year[1])
+        return choose_resolution(first_year, last_year, max_points)
+
+    def series_query(self, resolution):
+        """
+        Returns the query backend answering the time series at a resolution. The yearly series are
+        answered by the backend of the dataset; the finer rollups are queried with pandas, with the
+        periods in the 'period' column.
+
+        Args:
+            resolution (str): The resolution, see series_resolution().
+
+        Returns:
+            PandasBackend or DuckDBBackend: The backend.
+        """
+        if resolution == 'year':
+            return self.query
+        if resolution not in self._series_queries:
+            frame = add_derived_columns(self.rollups.means(resolution))
+            self._series_queries[resolution] = PandasBackend(self, frame)
+        return self._series_queries[resolution]
+
+    def group_index(self, column):
+        """
+        Returns an index of the rows of every category of a group column, built on first use and
+        kept until the data changes.
+
+        Args:
+            column (str): A categorical group column, e.g. 'city' or 'country_name'.
+
+        Returns:
+            GroupIndex: The index.
+        """
+        if column not in self._group_indexes:
+            self._group_indexes[column] = GroupIndex(self.df[column])
+        return self._group_indexes[column]
+
+    def nearest_stations(self, latitude, longitude, k=5, radius_km=None):
+        """
+        Returns the latest readings of the stations nearest to a coordinate.
+
+        Args:
+            latitude (float): Latitude in degrees.
+            longitude (float): Longitude in degrees.
+            k (int): Maximum number of stations to return.
+            radius_km (float, optional): Only return stations within this great circle distance.
+
+        Returns:
+            DataFrame: The stations nearest first, with their distance in the 'distance_km' column.
+        """
+        if radius_km is None:
+            positions, distances = self.station_index.query(latitude, longitude, k)
+        else:
+            positions, distances = self.station_index.query_radius(latitude, longitude, radius_km)
+            positions, distances = positions[:k], distances[:k]
+        return self.stations.iloc[positions].assign(distance_km=distances).reset_index(drop=True)
+
+    def country_aggregates(self, value, selected_year, selected_station_types, selected_continent='',
+                           selected_aggregation='mean'):
+        """
+        Returns the aggregated value per country for a selection of the dashboard. The result is cached
+        per selection, so repeated requests only look up the small ISO3 to value mapping.
+
+        Args:
+            value (str): The column to aggregate.
+            selected_year (list): The range of years selected.
+            selected_station_types (list): The types of stations selected.
+            selected_continent (str): The region code selected, '' for the whole world.
+            selected_aggregation (str): The aggregation mode (see aggregation.py), 'percentile' uses the median.
+
+        Returns:
+            Series: The aggregated values indexed by ISO3 code.
+        """
+        return self._country_aggregates(value, tuple(selected_year), tuple(selected_station_types),
+                                        selected_continent, selected_aggregation)
+
+    def _compute_country_aggregates(self, value, selected_year, selected_station_types, selected_continent,
+                                    selected_aggregation):
+        """
+        Computes the aggregated value per country, see country_aggregates().
+        """
+        mode = 'median' if selected_aggregation == 'percentile' else selected_aggregation
+        return self.query.aggregate(list(selected_year), list(selected_station_types), selected_continent,
+                                    ['iso3'], value, mode)[value].dropna()
+
+    def group_ranking(self, level, value, selected_year, selected_station_types, selected_continent='',
+                      selected_aggregation='mean'):
+        """
+        Returns the aggregated value of every city or country for a selection of the dashboard. The
+        result is cached per selection, so that changing the compared groups does not aggregate the
+        whole table again.
+
+        Args:
+            level (str): The group column, e.g. 'city' or 'country_name'.
+            value (str): The column to aggregate.
+            selected_year (list): The range of years selected.
+            selected_station_types (list): The types of stations selected.
+            selected_continent (str): The region code selected, '' for the whole world.
+            selected_aggregation (str): The aggregation mode (see aggregation.py), 'percentile' uses the median.
+
+        Returns:
+            Series: The aggregated values of the groups with a value, indexed by group.
+        """
+        return self._group_rankings(level, value, tuple(selected_year), tuple(selected_station_types),
+                                    selected_continent, selected_aggregation)
+
+    def _compute_group_ranking(self, level, value, selected_year, selected_station_types, selected_continent,
+                               selected_aggregation):
+        """
+        Computes the aggregated value of every group, see group_ranking().
+        """
+        mode = 'median' if selected_aggregation == 'percentile' else selected_aggregation
+        ranking = self.query.aggregate(list(selected_year), list(selected_station_types), selected_continent,
+                                       [level], value, mode)[value].dropna()
+        ranking.index = ranking.index.astype(object)
+        return ranking
+
+
+class DatasetRegistry:
+    """
+    A registry of the datasets the dashboard can switch between, e.g. releases of the WHO database or
+    exports of own monitoring networks. A dataset is only loaded on first use and at most
+    `max_resident` datasets are kept in memory besides the default one; the least recently used one
+    is released first. Released datasets are reloaded from the cleaned data cache next to their file.
+    The default dataset is never released, as the dashboard keeps it for its start up state anyway.
+
+    Attributes:
+        sources: A dictionary mapping dataset keys to their label, data path and sheet name.
+        default_key: The key of the dataset shown when none is selected (the first one registered).
+        max_resident: The maximum number of loaded datasets kept in memory besides the default one.
+        use_cache: Whether the datasets read and write the cleaned data cache.
+        backend: The query backend of the loaded datasets.
+
+    Methods:
+        register(data_path, sheet_name=None, key=None, label=None):
+            Registers a data file (or a sheet of a workbook) without loading it.
+        register_config(config_path):
+            Registers the datasets listed in a JSON file.
+        add(data, key='default', label=None):
+            Adds an already loaded dataset, which is never released.
+        get(key=None):
+            Returns a dataset, loading it on first use.
+        resident():
+            Returns the keys of the datasets currently in memory.
+        options():
+            Returns the options of the dataset dropdown.
+    """
+
+    def __init__(self, max_resident=MAX_RESIDENT_DATASETS, use_cache=True, backend='pandas'):
+        """
+        Initializes an empty registry.
+
+        Args:
+            max_resident (int): The maximum number of loaded datasets kept in memory besides the default one.
+            use_cache (bool): Whether the datasets read and write the cleaned data cache.
+            backend (str): The query backend of the loaded datasets, 'pandas' or 'duckdb'.
+        """
+        self.sources = {}
+        self.default_key = None
+        self.max_resident = max_resident
+        self.use_cache = use_cache
+        self.backend = backend
+        self._loaded = OrderedDict()
+        self._pinned = {}
+        self._lock = threading.Lock()
+        self._loading = {}
+
+    def register(self, data_path, sheet_name=None, key=None, label=None):
+        """
+        Registers a data file (or a sheet of a workbook) without loading it.
+
+        Args:
+            data_path (str): The path to the data file (Excel, CSV or Parquet).
+            sheet_name (str): The sheet name in an Excel file.
+            key (str): The key of the dataset. Defaults to the label.
+            label (str): The name shown in the dashboard. Defaults to the sheet name or the file name.
+
+        Returns:
+            str: The key of the dataset.
+        """
+        label = label or sheet_name or Path(data_path).stem
+        key = key or label
+        self.sources[key] = {'label': label, 'data_path': str(data_path), 'sheet_name': sheet_name}
+        if self.default_key is None:
+            self.default_key = key
+        return key
+
+    def register_config(self, config_path):
+        """
+        Registers the datasets listed in a JSON file, a list of objects with the keys 'path' and
+        optionally 'sheet_name', 'key' and 'label'. Relative paths are resolved against the file's folder.
+
+        Args:
+            config_path (str): The path to the JSON file.
+
+        Returns:
+            list: The keys of the registered datasets.
+        """
+        with open(config_path, 'r') as f:
+            entries = json.load(f)
+        folder = Path(config_path).resolve().parent
+        return [self.register(folder / entry['path'], entry.get('sheet_name'), entry.get('key'), entry.get('label'))
+                for entry in entries]
+
+    def add(self, data, key='default', label=None):
+        """
+        Adds an already loaded dataset. It has no file to reload it from and is therefore never released.
+
+        Args:
+            data (AirQualityData): The dataset.
+            key (str): The key of the dataset.
+            label (str): The name shown in the dashboard. Defaults to the key.
+
+        Returns:
+            str: The key of the dataset.
+        """
+        self.sources[key] = {'label': label or key, 'data_path': None, 'sheet_name': None}
+        self._pinned[key] = data
+        if self.default_key is None:
+            self.default_key = key
+        return key
+
+    def get(self, key=None):
+        """
+        Returns a dataset, loading it on first use. Concurrent requests for a dataset that is being
+        loaded wait for that load instead of starting another one.
+
+        Args:
+            key (str): The key of the dataset, None for the default dataset.
+
+        Returns:
+            AirQualityData: The dataset.
+        """
+        key = key or self.default_key
+        if key in self._pinned:
+            return self._pinned[key]
+        if key not in self.sources:
+            raise KeyError(f"Unknown dataset '{key}'")
+
+        with self._lock:
+            if key in self._loaded:
+                self._loaded.move_to_end(key)
+                return self._loaded[key]
+            loading = self._loading.setdefault(key, threading.Lock())
+
+        with loading:
+            with self._lock:
+                if key in self._pinned:
+                    return self._pinned[key]
+                if key in self._loaded:
+                    self._loaded.move_to_end(key)
+                    return self._loaded[key]
+            source = self.sources[key]
+            data = None
+            try:
+                data = AirQualityData(source['data_path'], source['sheet_name'], self.use_cache, self.backend)
+            finally:
+                with self._lock:
+                    # Requests waiting for this load find the dataset loaded, later ones need no lock for it
+                    self._loading.pop(key, None)
+                    if data is not None and key == self.default_key:
+                        self._pinned[key] = data
+                    elif data is not None:
+                        self._loaded[key] = data
+                        while len(self._loaded) > self.max_resident:
+                            self._loaded.popitem(last=False)
+        return data
+
+    def resident(self):
+        """
+        Returns the keys of the datasets currently in memory, least recently used first.
+        """
+        with self._lock:
+            return list(self._pinned) + list(self._loaded)
+
+    def options(self):
+        """
+        Returns the options of the dataset dropdown.
+        """
+        return [{'label': source['label'], 'value': key} for key, source in self.sources.items()]
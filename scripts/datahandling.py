@@ -6,31 +6,76 @@ and defines aqi values.
 """
 
 import numpy as np
+import pandas as pd
+from aqi_standards import DEFAULT_STANDARD, get_standard
+from temporal_rollups import TIMESTAMP_COLUMN
 
-# Airquality is given as aqi for ease of data intepretation
-def lerp(low_aqi, high_aqi, low_conc, high_conc, conc):
-    """
-    Function that performs linear interpolation between high and low concentration for the aqi.
+# Validation rules per column of the WHO spreadsheet. Each rule may define a lower ('min') and
+# upper ('max') bound, whether a value is 'required' and what happens to rows breaking the rule:
+#   'drop' removes the row, 'nan' only blanks the offending value, 'flag' keeps the row but marks
+#   it in the 'quality_flag' column.
+VALIDATION_RULES = {
+    'year': {'required': True, 'min': 1900, 'max': 2100, 'invalid': 'drop'},
+    'latitude': {'min': -90, 'max': 90, 'invalid': 'nan'},
+    'longitude': {'min': -180, 'max': 180, 'invalid': 'nan'},
+    'pm10_concentration': {'min': 0, 'invalid': 'nan'},
+    'pm25_concentration': {'min': 0, 'invalid': 'nan'},
+    'no2_concentration': {'min': 0, 'invalid': 'nan'},
+}
 
-    Args:
-        low_aqi: lower threshold of aqi  corresponding to low conc
-        high_aqi: upper threshold of aqi corresponding to high conc
-        low_conc: low concentraition corresponding to low aqi
-        high_conc: high concentration corresponding to high aqi
-        conc: concentration that aqi is interpolated for
+# The sheet has no station identifier, a station is identified by its coordinates
+DUPLICATE_KEYS = ['city', 'year', 'latitude', 'longitude']
 
-    Returns:
-        float corrsponding to the interpolated value at concentration conc
-    """
-    return low_aqi + (conc - low_conc) * (high_aqi - low_aqi) / (high_conc - low_conc)
+# Rows without any of these values carry no information for the dashboard
+MEASUREMENT_COLUMNS = ['pm10_concentration', 'pm25_concentration', 'no2_concentration']
 
-def calculate_aqi(pollutant_type, concentrations):
+# Column names used by other releases of the WHO database and by monitoring exports, per column of
+# the V6.1 sheet. Names are matched ignoring case and surrounding whitespace.
+COLUMN_ALIASES = {
+    'who_region': ['WHO Region', 'Region'],
+    'iso3': ['ISO3', 'ISO', 'Country Code'],
+    'country_name': ['WHO Country Name', 'Country', 'Country Name'],
+    'city': ['City or Locality', 'City/Town', 'City', 'Locality'],
+    'year': ['Measurement Year', 'Year'],
+    'version': ['Version of the database', 'Version'],
+    'pm10_concentration': ['PM10 (μg/m3)', 'PM10 (ug/m3)', 'PM10'],
+    'pm25_concentration': ['PM2.5 (μg/m3)', 'PM2.5 (ug/m3)', 'PM2.5', 'PM25'],
+    'no2_concentration': ['NO2 (μg/m3)', 'NO2 (ug/m3)', 'NO2'],
+    'type_of_stations': ['Type of stations', 'Station Type', 'Type of station'],
+    'population': ['Population'],
+    'latitude': ['Latitude', 'Lat'],
+    'longitude': ['Longitude', 'Lon', 'Lng'],
+    'timestamp': ['Datetime', 'Date Time', 'Date', 'Time', 'Measurement Time'],
+}
+
+# Columns the dashboard relies on, added empty if a source does not have them
+REQUIRED_COLUMNS = ['who_region', 'iso3', 'country_name', 'city', 'year', 'pm10_concentration',
+                    'pm25_concentration', 'no2_concentration', 'type_of_stations', 'latitude', 'longitude']
+
+# Region names used instead of the region codes of the V6.1 sheet
+REGION_ALIASES = {
+    '1_Afr': ['Afr', 'Africa', 'African Region'],
+    '2_Amr': ['Amr', 'Americas', 'Region of the Americas'],
+    '3_Sear': ['Sear', 'South-East Asia', 'South-East Asia Region'],
+    '4_Eur': ['Eur', 'Europe', 'European Region'],
+    '5_Emr': ['Emr', 'Eastern Mediterranean', 'Eastern Mediterranean Region'],
+    '6_Wpr': ['Wpr', 'Western Pacific', 'Western Pacific Region'],
+    '7_NonMS': ['NonMS', 'Non-member state'],
+}
+
+# Message and color of a missing AQI value
+NO_DATA_MESSAGE = ('no data', 'lightgrey')
+
+# Airquality is given as aqi for ease of data intepretation
+def calculate_aqi(pollutant_type, concentrations, standard=DEFAULT_STANDARD):
     """
     Calculates AQIs based on the pollutant type and a list of concentrations.
+    The breakpoints are taken from the AQI standards registry (see aqi_standards.py).
 
     Args:
         pollutant_type (str): The pollutant type, either 'no2', 'pm25', or 'pm10'.
         concentrations (list or np.ndarray): List or numpy array of the concentrations for which AQI is to be calculated.
+        standard (str): The key of the AQI standard. Defaults to the US EPA AQI.
 
     Returns:
         list: List of AQI values for the given concentrations.
@@ -40,59 +85,145 @@ def calculate_aqi(pollutant_type, concentrations):
     
     if not isinstance(concentrations, (list,np.ndarray)):
         raise TypeError("concentrations has to be a list or a numpy array.")
-    
-    aqi_values = []
-    for conc in concentrations:
-        if np.isnan(conc):
-            aqi_values.append(None)
+
+    aqi_values = get_standard(standard).compute(pollutant_type, concentrations)
+    return [None if np.isnan(aqi) else int(aqi) for aqi in aqi_values]
+
+def assign_aqi_message(aqi, standard=DEFAULT_STANDARD):
+    """
+    Function to assign message and color based on AQI.
+
+    Args:
+        aqi (int): Integer representing AQI value, None or NaN if missing.
+        standard (str): The key of the AQI standard. Defaults to the US EPA AQI.
+
+    Returns:
+        tuple: Two strings, pollution hazard and color, NO_DATA_MESSAGE for a missing AQI.
+    """
+    aqi_standard = get_standard(standard)
+    category = aqi_standard.categorize([aqi])[0]
+    if category < 0:
+        return NO_DATA_MESSAGE
+    return str(aqi_standard.labels[category]), str(aqi_standard.colors[category])
+
+def normalize_columns(df, aliases=COLUMN_ALIASES, required=REQUIRED_COLUMNS, region_aliases=REGION_ALIASES):
+    """
+    Maps the columns of other releases and of monitoring exports to the schema of the V6.1 sheet.
+
+    Args:
+        df (DataFrame): The raw data of a source.
+        aliases (dict): Alternative names per column (see COLUMN_ALIASES).
+        required (list): Columns added empty if the source has no column for them.
+        region_aliases (dict): Alternative names per region code, replaced in the 'who_region' column.
+
+    Returns:
+        DataFrame: The data with renamed columns; columns without an alias are kept as they are.
+    """
+    lookup = {name.strip().lower(): column for column, names in aliases.items() for name in [column] + names}
+    renames = {}
+    for name in df.columns:
+        column = lookup.get(str(name).strip().lower())
+        # Keep the first source column per target, e.g. 'Year' next to 'Measurement Year'
+        if column is not None and column not in renames.values():
+            renames[name] = column
+    df = df.rename(columns=renames)
+
+    for column in required:
+        if column not in df.columns:
+            df[column] = pd.Series(np.nan, index=df.index, dtype=object if column == 'type_of_stations' else float)
+
+    # Map the distinct region names only, a categorical column keeps its codes
+    regions = {name.lower(): code for code, names in region_aliases.items() for name in [code] + names}
+    region_names = {name: regions.get(str(name).strip().lower(), name) for name in df['who_region'].dropna().unique()}
+    if any(name != code for name, code in region_names.items()):
+        df['who_region'] = df['who_region'].map(region_names)
+    return df
+
+def validate_data(df, rules=VALIDATION_RULES, duplicate_keys=DUPLICATE_KEYS, measurement_columns=MEASUREMENT_COLUMNS):
+    """
+    Validates and cleans the air quality data according to declarative per column rules.
+    All checks are vectorized over whole columns.
+
+    Args:
+        df (DataFrame): The raw air quality data.
+        rules (dict): Validation rules per column (see VALIDATION_RULES). Columns missing in df are skipped.
+        duplicate_keys (list): Columns identifying a measurement, later duplicates are dropped. Rows missing
+                               any of these values cannot be identified and are kept.
+        measurement_columns (list): Rows where all of these columns are missing are dropped.
+
+    Returns:
+        tuple: The cleaned DataFrame and a report (dict) counting the rows affected by every rule.
+    """
+    df = df.copy()
+    report = {'rows_in': len(df), 'columns': {}}
+    drop = np.zeros(len(df), dtype=bool)
+    flag = np.zeros(len(df), dtype=bool)
+
+    for column, rule in rules.items():
+        if column not in df.columns:
             continue
+        values = pd.to_numeric(df[column], errors='coerce')
+        missing = values.isna().to_numpy()
+        out_of_range = np.zeros(len(df), dtype=bool)
+        if 'min' in rule:
+            out_of_range |= (values < rule['min']).to_numpy()
+        if 'max' in rule:
+            out_of_range |= (values > rule['max']).to_numpy()
+        invalid = out_of_range | missing if rule.get('required', False) else out_of_range
 
-        conc = max(conc, 0)
-
-        # Define pollutant types and their thresholds
-        if pollutant_type == 'no2':
-            breakpoints = [(0, 53, 0, 50), (54, 100, 51, 100), (101, 360, 101, 150),
-                           (361, 649, 151, 200), (650, 1249, 201, 300),
-                           (1250, 1649, 301, 400), (1650, 2049, 401, 500)]
-        elif pollutant_type == 'pm25':
-            breakpoints = [(0.0, 12.0, 0, 50), (12.1, 35.4, 51, 100), (35.5, 55.4, 101, 150),
-                           (55.5, 150.4, 151, 200), (150.5, 250.4, 201, 300),
-                           (250.5, 350.4, 301, 400), (350.5, 500.4, 401, 500)]
-        elif pollutant_type == 'pm10':
-            breakpoints = [(0, 54, 0, 50), (55, 154, 51, 100), (155, 254, 101, 150),
-                           (255, 354, 151, 200), (355, 424, 201, 300),
-                           (425, 529, 301, 400), (530, 604, 401, 500)]
+        action = rule.get('invalid', 'drop')
+        if action == 'drop':
+            drop |= invalid
+        elif action == 'nan':
+            values = values.mask(invalid)
+        elif action == 'flag':
+            flag |= invalid
         else:
-            raise ValueError("Unsupported pollutant type")
+            raise ValueError(f"Unsupported action '{action}' for column '{column}'")
+        df[column] = values
+        report['columns'][column] = {'missing': int(missing.sum()), 'out_of_range': int(out_of_range.sum()),
+                                     'action': action}
+
+    report['dropped_invalid'] = int(drop.sum())
+    report['flagged'] = int(flag[~drop].sum())
+    if flag.any():
+        df['quality_flag'] = flag
+    df = df[~drop]
 
-        # Default AQI if concentration is beyond the highest range
-        aqi = 500
-        for (low_conc, high_conc, low_aqi, high_aqi) in breakpoints:
-            if low_conc <= conc <= high_conc:
-                aqi = lerp(low_aqi, high_aqi, low_conc, high_conc, conc)
-                break
-        aqi_values.append(round(aqi))
+    # Remove rows without a single measurement
+    present_measurements = [column for column in measurement_columns if column in df.columns]
+    empty = df[present_measurements].isna().all(axis=1) if present_measurements else pd.Series(False, index=df.index)
+    report['dropped_empty'] = int(empty.sum())
+    df = df[~empty]
 
-    return aqi_values
+    # Remove duplicated measurements of the same station and year. Rows without coordinates are not
+    # identified as a station, as drop_duplicates would treat their missing keys as equal.
+    present_keys = [column for column in duplicate_keys if column in df.columns]
+    duplicated = df.duplicated(subset=present_keys) & df[present_keys].notna().all(axis=1) if present_keys \
+        else pd.Series(False, index=df.index)
+    report['dropped_duplicates'] = int(duplicated.sum())
+    df = df[~duplicated].reset_index(drop=True)
 
-def assign_aqi_message(aqi):
+    report['rows_out'] = len(df)
+    return df, report
+
+def validate_measurements(df, rules=VALIDATION_RULES, duplicate_keys=DUPLICATE_KEYS):
     """
-    Function to assign message and color based on AQI.
+    Validates timestamped measurements (e.g. hourly sensor readings) like the yearly data. The year
+    is taken from the timestamp, and a reading is identified by its station and time.
 
     Args:
-        aqi (int): Integer representing AQI value.
+        df (DataFrame): The normalized measurements with a 'timestamp' column.
+        rules (dict): Validation rules per column (see VALIDATION_RULES).
+        duplicate_keys (list): Columns identifying a station and year, the timestamp is added.
 
     Returns:
-        tuple: Two strings, pollution hazard and color.
+        tuple: The cleaned measurements and the validation report, see validate_data().
     """
-    if aqi >= 250:
-        return "hazardous", "maroon"
-    if aqi >= 150:
-        return "very unhealthy", "purple"
-    if aqi >= 55:
-        return "unhealthy", "red"
-    if aqi >= 35:
-        return "unhealthy to sensitive groups", "orange"
-    if aqi >= 12:
-        return "moderate", "yellow"
-    return "good", "green"
+    timestamps = pd.to_datetime(df[TIMESTAMP_COLUMN], errors='coerce')
+    if timestamps.dt.tz is not None:
+        # Keep the local time of the station, so that days and months start at its midnight
+        timestamps = timestamps.dt.tz_localize(None)
+    # Rows without a valid timestamp have no year and are dropped by the 'year' rule
+    df = df.assign(**{TIMESTAMP_COLUMN: timestamps, 'year': timestamps.dt.year})
+    return validate_data(df, rules, duplicate_keys + [TIMESTAMP_COLUMN])
@@ -0,0 +1,324 @@
+"""
+export.py
+
+Exports the data behind the current view of the dashboard: the filtered rows, the time series of
+the main plot or the full city ranking, as CSV, Parquet or Excel file. The selection is applied by
+the same filter and query backends as the callbacks. CSV and Parquet files are written and sent
+chunk by chunk, so a large selection is never held in memory as a whole file. Excel workbooks are
+zip archives that can only be written as a whole and are therefore built in memory.
+"""
+
+import importlib.util
+import io
+import zlib
+from urllib.parse import urlencode
+
+import numpy as np
+import pandas as pd
+
+from aggregation import AGGREGATION_MODES
+from aqi_standards import aqi_column
+from query_backend import selection_mask
+
+# URL of the export route (see AirQualityCallbacks.register_export_route)
+EXPORT_URL = '/export'
+
+# Tables that can be exported and their names in the dashboard
+EXPORT_TABLES = {
+    'rows': 'Filtered rows',
+    'series': 'Time series',
+    'rankings': 'City ranking'
+}
+
+# File formats and their MIME types. CSV and Parquet are written in chunks, Excel as a whole.
+EXPORT_FORMATS = {
+    'csv': 'text/csv',
+    'parquet': 'application/vnd.apache.parquet',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+}
+
+# Number of rows written and sent per chunk
+EXPORT_CHUNK_ROWS = 50_000
+
+# Number of rows an Excel sheet holds below its header
+EXCEL_MAX_ROWS = 1_048_575
+
+
+def export_url(selected_pollutant, selected_continent, selected_year, selected_station_types, selected_data_type,
+               selected_standard, selected_aggregation, table='rows', file_format='csv', compression='',
+               selected_dataset=None):
+    """
+    Builds the URL downloading the export of a selection of the dashboard.
+
+    Args:
+        selected_pollutant (str): The pollutant column, e.g. 'pm25_concentration'.
+        selected_continent (str): The region code selected, '' for the whole world.
+        selected_year (list): The range of years selected.
+        selected_station_types (list): The types of stations selected.
+        selected_data_type (str): 'Concentration' or 'AQI'.
+        selected_standard (str): The key of the AQI standard.
+        selected_aggregation (str): The aggregation mode (see aggregation.py).
+        table (str): One of the keys of EXPORT_TABLES.
+        file_format (str): One of the keys of EXPORT_FORMATS.
+        compression (str): 'gzip' to compress the file, '' otherwise.
+        selected_dataset (str): The key of the dataset, None for the default dataset.
+
+    Returns:
+        str: The URL.
+    """
+    parameters = {
+        'table': table, 'format': file_format, 'pollutant': selected_pollutant, 'continent': selected_continent,
+        'from': selected_year[0], 'to': selected_year[1], 'types': ','.join(selected_station_types),
+        'data_type': selected_data_type, 'standard': selected_standard, 'aggregation': selected_aggregation
+    }
+    if compression:
+        parameters['compression'] = compression
+    if selected_dataset:
+        parameters['dataset'] = selected_dataset
+    return f'{EXPORT_URL}?{urlencode(parameters)}'
+
+
+def parse_export_request(args):
+    """
+    Reads the parameters of an export request, see export_url().
+
+    Args:
+        args (dict): The query parameters of the request.
+
+    Returns:
+        dict: The parameters, with defaults for those not given.
+
+    Raises:
+        ValueError: If a parameter has an invalid value.
+    """
+    parameters = {
+        'table': args.get('table', 'rows'),
+        'file_format': args.get('format', 'csv'),
+        'compression': args.get('compression', ''),
+        'selected_pollutant': args.get('pollutant', 'pm25_concentration'),
+        'selected_continent': args.get('continent', ''),
+        'selected_station_types': [value for value in args.get('types', 'all').split(',') if value],
+        'selected_data_type': args.get('data_type', 'Concentration'),
+        'selected_standard': args.get('standard', 'us_epa'),
+        'selected_aggregation': args.get('aggregation', 'mean'),
+        'selected_dataset': args.get('dataset') or None
+    }
+    if parameters['table'] not in EXPORT_TABLES:
+        raise ValueError(f"Unsupported table '{parameters['table']}'")
+    if parameters['file_format'] not in EXPORT_FORMATS:
+        raise ValueError(f"Unsupported format '{parameters['file_format']}'")
+    if parameters['compression'] not in ('', 'gzip'):
+        raise ValueError(f"Unsupported compression '{parameters['compression']}'")
+    if parameters['selected_aggregation'] not in AGGREGATION_MODES:
+        raise ValueError(f"Unsupported aggregation mode '{parameters['selected_aggregation']}'")
+
+    selected_year = [args.get('from', 'all'), args.get('to', 'all')]
+    try:
+        parameters['selected_year'] = [year if year == 'all' else int(year) for year in selected_year]
+    except ValueError:
+        raise ValueError(f"Invalid time span {selected_year}") from None
+    return parameters
+
+
+def export_frames(data, table, selected_year, selected_station_types, selected_continent, value,
+                  selected_aggregation='mean', chunk_rows=EXPORT_CHUNK_ROWS):
+    """
+    Yields the exported table in chunks of rows. The filtered rows are sliced from the data chunk
+    by chunk; the time series and rankings are small and yielded as one chunk.
+
+    Args:
+        data (AirQualityData): The dataset.
+        table (str): One of the keys of EXPORT_TABLES.
+        selected_year (list): The range of years selected.
+        selected_station_types (list): The types of stations selected.
+        selected_continent (str): The region code selected, '' for the whole world.
+        value (str): The column of the time series and rankings.
+        selected_aggregation (str): The aggregation mode of the time series and rankings.
+        chunk_rows (int): The number of rows per chunk.
+
+    Yields:
+        DataFrame: The next chunk, at least one (possibly empty) chunk.
+    """
+    selection = (selected_year, selected_station_types, selected_continent)
+    if table == 'rows':
+        positions = np.flatnonzero(selection_mask(data.df, *selection))
+        for start in range(0, max(len(positions), 1), chunk_rows):
+            yield data.df.iloc[positions[start:start + chunk_rows]]
+    elif table == 'series':
+        # The lines of the main plot: per region for the world, per country for a region
+        group_column = 'who_region' if selected_continent == '' else 'country_name'
+        resolution = data.series_resolution(selected_year)
+        time_column = 'year' if resolution == 'year' else 'period'
+        yield data.series_query(resolution).aggregate(*selection, [group_column, time_column], value,
+                                                      selected_aggregation).reset_index()
+    else:
+        # All cities ranked as in the ranking plots, most polluted first
+        mode = 'median' if selected_aggregation == 'percentile' else selected_aggregation
+        ranking = data.query.aggregate(*selection, ['city'], value, mode)[[value]].dropna()
+        ranking = ranking.sort_values(value, ascending=False).reset_index()
+        ranking.insert(0, 'rank', np.arange(1, len(ranking) + 1))
+        yield ranking
+
+
+def csv_chunks(frames):
+    """
+    Writes chunks of rows as CSV, the header with the first chunk.
+
+    Args:
+        frames (iterable): The chunks (DataFrames).
+
+    Yields:
+        bytes: The CSV text of the next chunk, UTF-8 encoded.
+    """
+    header = True
+    for frame in frames:
+        yield frame.to_csv(index=False, header=header).encode('utf-8')
+        header = False
+
+
+class _ChunkSink(io.RawIOBase):
+    """
+    A write only file collecting the written bytes until they are taken with drain().
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._chunks = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self._chunks.append(bytes(b))
+        self._position += len(b)
+        return len(b)
+
+    def tell(self):
+        return self._position
+
+    def drain(self):
+        chunk = b''.join(self._chunks)
+        self._chunks = []
+        return chunk
+
+
+def parquet_chunks(frames):
+    """
+    Writes chunks of rows as one Parquet file with a row group per chunk. Requires the pyarrow package.
+
+    Args:
+        frames (iterable): The chunks (DataFrames) with the same columns.
+
+    Yields:
+        bytes: The next part of the file.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    sink = _ChunkSink()
+    writer = None
+    for frame in frames:
+        table = pa.Table.from_pandas(frame, schema=writer.schema if writer else None, preserve_index=False)
+        if writer is None:
+            writer = pq.ParquetWriter(sink, table.schema)
+        writer.write_table(table)
+        chunk = sink.drain()
+        if chunk:
+            yield chunk
+    writer.close()
+    yield sink.drain()
+
+
+def excel_bytes(frames, sheet_name):
+    """
+    Writes the rows as an Excel workbook with one sheet.
+
+    Args:
+        frames (iterable): The chunks (DataFrames).
+        sheet_name (str): The name of the sheet.
+
+    Returns:
+        bytes: The workbook.
+
+    Raises:
+        ValueError: If the rows do not fit into one sheet.
+    """
+    frame = pd.concat(list(frames), ignore_index=True)
+    if len(frame) > EXCEL_MAX_ROWS:
+        raise ValueError(f"{len(frame)} rows do not fit into an Excel sheet, export them as CSV or Parquet")
+    buffer = io.BytesIO()
+    frame.to_excel(buffer, sheet_name=sheet_name, index=False)
+    return buffer.getvalue()
+
+
+def gzip_chunks(chunks, level=6):
+    """
+    Compresses a stream of chunks into one gzip file.
+
+    Args:
+        chunks (iterable): The chunks (bytes).
+        level (int): The compression level (1 fastest to 9 smallest).
+
+    Yields:
+        bytes: The next part of the compressed file.
+    """
+    # wbits=31 writes the gzip header and trailer around the deflate stream
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def export_file(data, table='rows', file_format='csv', compression='', selected_pollutant='pm25_concentration',
+                selected_continent='', selected_year=('all', 'all'), selected_station_types=('all',),
+                selected_data_type='Concentration', selected_standard='us_epa', selected_aggregation='mean',
+                selected_dataset=None, chunk_rows=EXPORT_CHUNK_ROWS):
+    """
+    Prepares the export of a selection. The selection is checked before anything is written, so
+    that invalid requests fail before a response is started.
+
+    Args:
+        data (AirQualityData): The dataset.
+        table, file_format, compression: See export_url().
+        selected_pollutant, selected_continent, selected_year, selected_station_types, selected_data_type,
+        selected_standard, selected_aggregation: The selection of the dashboard, see export_url().
+        selected_dataset (str): The key of the dataset, used in the file name.
+        chunk_rows (int): The number of rows per chunk.
+
+    Returns:
+        tuple: The file name, the MIME type and an iterator over the bytes of the file.
+
+    Raises:
+        ValueError: If the selection does not fit the dataset or the format is not available.
+    """
+    value = selected_pollutant
+    if str(selected_data_type) == 'AQI':
+        if selected_standard not in data.aqi_standards:
+            raise ValueError(f"Unknown AQI standard '{selected_standard}'")
+        value = aqi_column(selected_pollutant, selected_standard)
+    if value not in data.df.columns:
+        raise ValueError(f"Unknown pollutant '{selected_pollutant}'")
+    if selected_aggregation not in [option['value'] for option in data.aggregation_options]:
+        raise ValueError(f"Aggregation mode '{selected_aggregation}' is not available for this dataset")
+    if file_format == 'parquet' and importlib.util.find_spec('pyarrow') is None:
+        raise ValueError("Parquet exports require the pyarrow package (pip install pyarrow)")
+
+    frames = export_frames(data, table, list(selected_year), list(selected_station_types), selected_continent,
+                           value, selected_aggregation, chunk_rows)
+    mimetype = EXPORT_FORMATS[file_format]
+    if file_format == 'csv':
+        chunks = csv_chunks(frames)
+    elif file_format == 'parquet':
+        chunks = parquet_chunks(frames)
+    else:
+        chunks = iter([excel_bytes(frames, EXPORT_TABLES[table])])
+
+    name = '_'.join(str(part) for part in ['inspectair', selected_dataset or 'data', table, value,
+                                            selected_continent or 'world', *selected_year])
+    filename = ''.join(c if c.isalnum() or c in '-_' else '_' for c in name) + '.' + file_format
+    if compression == 'gzip':
+        return filename + '.gz', 'application/gzip', gzip_chunks(chunks)
+    return filename, mimetype, chunks
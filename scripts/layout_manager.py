@@ -1,6 +1,9 @@
 from dash import html, dcc, Input, Output, get_asset_url
 import dash_bootstrap_components as dbc
-from map import Map
+from data_manager import DatasetRegistry
+from export import EXPORT_TABLES
+from comparison import COMPARISON_LEVELS, MAX_COMPARED
+from clientside_series import CLIENTSIDE_MODES
 
 class AirQualityLayout:
     """
@@ -12,6 +15,10 @@ class AirQualityLayout:
         The Dash app instance.
     data : Data
         An object containing data and options for pollutants, continents, and station types.
+    datasets : DatasetRegistry
+        The datasets that can be selected in the dashboard.
+    clientside_series : bool
+        Whether the main plot is drawn in the browser (adds the store of its payload).
 
     Methods:
     -------
@@ -20,7 +27,7 @@ class AirQualityLayout:
     set_callbacks():
         Defines the callbacks for interactivity in the Dash app.
     """
-    def __init__(self, app, data):
+    def __init__(self, app, data, datasets=None, clientside_series=False):
         """
         Constructs all the necessary attributes for the AirQualityLayout object.
 
@@ -30,9 +37,18 @@ class AirQualityLayout:
             The Dash app instance.
         data : Data
             An object containing data and options for pollutants, continents, and station types.
+        datasets : DatasetRegistry, optional
+            The datasets that can be selected. Defaults to only `data`.
+        clientside_series : bool, optional
+            Whether the main plot is drawn in the browser from a pre-aggregated payload.
         """
         self.app = app
         self.data = data
+        self.clientside_series = clientside_series
+        if datasets is None:
+            datasets = DatasetRegistry()
+            datasets.add(data)
+        self.datasets = datasets
         self.set_layout()
         self.set_callbacks()
 
@@ -40,14 +56,10 @@ class AirQualityLayout:
         """
         Sets the layout of the Dash app including pollutant selection, region selection, time span slider,
         station type checklist, data type radio buttons, and the plots for the indicator graphic and bar graphs.
-        Creates the Folium map and save it as an HTML file
+        The Folium map is not built here: the initial page load triggers the update callback, which renders
+        the map for the default selection, so building it at start up would only delay binding the port.
+        The same holds for the station map and the time span, which are set per dataset by a callback.
         """
-        # Create the Folium map and save it as an HTML file
-        world_map = Map()
-        initial_heatmap_data = self.data.df[['latitude', 'longitude', 'pm25_concentration']].dropna().values.tolist()
-        world_map.add_heatmap(initial_heatmap_data)
-        world_map.save('map.html')
-
         self.app.layout = html.Div([
             # Pollutant selection row
             dbc.Row([
@@ -60,7 +72,7 @@ class AirQualityLayout:
                             value='pm25_concentration'
                         )
                     ], style={'margin-top': '10px'}),
-                    width=4,
+                    width=3,
                     style={'margin-left': '40px'}
                 ),
                 dbc.Col(
@@ -72,7 +84,20 @@ class AirQualityLayout:
                             value=list(self.data.continent_dict.keys())[0]
                         )
                     ], style={'margin-top': '10px'}),
-                    width=4
+                    width=3
+                ),
+                dbc.Col(
+                    html.Div([
+                        html.Label('Dataset:', style={'font-weight': 'bold'}),
+                        dcc.Dropdown(
+                            id='dataset-dropdown',
+                            options=self.datasets.options(),
+                            value=self.datasets.default_key,
+                            clearable=False,
+                            disabled=len(self.datasets.sources) < 2
+                        )
+                    ], style={'margin-top': '10px'}),
+                    width=3
                 ),
                 # Logo
                 dbc.Col(
@@ -84,7 +109,7 @@ class AirQualityLayout:
                     'align-items': 'center',
                     'height': '100%'
                     }),
-                    width={"size": 2, "order": "last", "offset": 3},
+                    width={"size": 2, "order": "last", "offset": 1},
                     style={'margin-left': '145px'}
                 ),
             ], style={'background-color': '#d3d3d3', 
@@ -97,12 +122,12 @@ class AirQualityLayout:
                 html.Label('Time Span:', style={'font-weight': 'bold','margin-left': '20px'}),
                 dcc.RangeSlider(
                     id='from-to',
-                    min=2013,
-                    max=2022,
+                    min=self.data.year_range[0],
+                    max=self.data.year_range[1],
                     step=1,
                     value=[2015, 2020],
                     allowCross=False,
-                    marks={i: str(i) for i in range(2013, 2023, 1)}
+                    marks={i: str(i) for i in range(self.data.year_range[0], self.data.year_range[1] + 1, 1)}
                 )
             ], style={'margin-top': '10px', 'margin-bottom': '10px', 'margin-left': '20px', 'margin-right': '20px'}),
             # Row for station choice and data type
@@ -117,7 +142,7 @@ class AirQualityLayout:
                             multi=True
                         )
                     ], style={'margin-top': '10px', 'margin-bottom': '10px'}),
-                    width=6, style={'margin-left': '40px'}
+                    width=4, style={'margin-left': '40px'}
                 ),
                 dbc.Col(
                     html.Div([
@@ -132,30 +157,183 @@ class AirQualityLayout:
                             inline=True
                         )
                     ], style={'margin-top': '10px', 'margin-bottom': '10px'}),
-                    width=4
+                    width=2
+                ),
+                dbc.Col(
+                    html.Div([
+                        html.Label('Aggregation:', style={'font-weight': 'bold'}),
+                        dcc.Dropdown(
+                            id='aggregation-dropdown',
+                            options=[option for option in self.data.aggregation_options
+                                     if not self.clientside_series or option['value'] in CLIENTSIDE_MODES],
+                            value='mean',
+                            clearable=False
+                        )
+                    ], style={'margin-top': '10px', 'margin-bottom': '10px'}),
+                    width=2
+                ),
+                dbc.Col(
+                    html.Div([
+                        html.Label('AQI Standard:', style={'font-weight': 'bold'}),
+                        dcc.Dropdown(
+                            id='aqi-standard-dropdown',
+                            options=self.data.standards_options,
+                            value='us_epa',
+                            clearable=False
+                        )
+                    ], style={'margin-top': '10px', 'margin-bottom': '10px'}),
+                    width=3
                 ),
             ]),
+            # Statistics overlays for the main plot
+            html.Div([
+                html.Label('Overlays:', style={'font-weight': 'bold', 'margin-right': '10px'}),
+                dcc.Checklist(
+                    id='overlay-checklist',
+                    options=[
+                        {'label': 'Standard error band', 'value': 'standard_error'},
+                        {'label': 'Year-over-year change (hover)', 'value': 'yoy_change'},
+                        {'label': 'Linear trend (* significant at p < 0.05)', 'value': 'trend'}
+                    ],
+                    value=[],
+                    inline=True,
+                    inputStyle={'margin-left': '15px', 'margin-right': '5px'},
+                    style={'display': 'inline-block'}
+                )
+            ], style={'margin-left': '40px'}),
             #Row for the plots
             dbc.Row([
                 dbc.Col(dcc.Graph(id='indicator-graphic'), width=12),
             ]),
+            # Pre-aggregated payload the main plot is drawn from in client side mode
+            *([dcc.Store(id='series-payload')] if self.clientside_series else []),
              dbc.Row([
                 dbc.Col([
                     html.Img(id='bar-graph-matplotlib', style={'max-width': '50%', 'height': 'auto'}),
                     html.Img(id='bar-graph-matplotlib_bottom', style={'max-width': '50%', 'height': 'auto'})
                 ]),
             ]),
+            # Comparison of selected cities or countries
+            html.Div([
+                html.Label('Compare:', style={'font-weight': 'bold', 'margin-right': '10px'}),
+                dcc.RadioItems(
+                    id='compare-level-radio',
+                    options=[{'label': name, 'value': key} for key, name in COMPARISON_LEVELS.items()],
+                    value='city',
+                    inline=True,
+                    inputStyle={'margin-left': '15px', 'margin-right': '5px'},
+                    style={'display': 'inline-block'}
+                ),
+                dcc.Dropdown(
+                    id='compare-dropdown',
+                    options=[],
+                    value=[],
+                    multi=True,
+                    placeholder=f'Type to search, up to {MAX_COMPARED}',
+                    style={'display': 'inline-block', 'width': '500px', 'vertical-align': 'middle',
+                           'margin-left': '15px'}
+                ),
+                html.Button(f'Compare {MAX_COMPARED} most polluted', id='compare-top-button', n_clicks=0,
+                            className='btn btn-outline-primary btn-sm', style={'margin-left': '15px'})
+            ], style={'margin-top': '20px', 'margin-left': '40px'}),
+            dbc.Row([
+                dbc.Col(dcc.Graph(id='comparison-graph'), width=12),
+            ]),
+            # Share of station-years per AQI category, from the precomputed category histograms
+            dbc.Row([
+                dbc.Col(dcc.Graph(id='distribution-graph'), width=12),
+            ]),
+            # Strongest year-over-year jumps of the selected pollutant, from the precomputed anomaly table
+            html.Div([
+                html.Label('Anomalies:', style={'font-weight': 'bold'}),
+                html.Div(id='anomaly-table')
+            ], style={'margin-top': '20px', 'margin-left': '40px', 'margin-right': '40px'}),
+            # Export of the data behind the current view
+            html.Div([
+                html.Label('Export:', style={'font-weight': 'bold', 'margin-right': '10px'}),
+                dcc.Dropdown(
+                    id='export-table-dropdown',
+                    options=[{'label': name, 'value': key} for key, name in EXPORT_TABLES.items()],
+                    value='rows',
+                    clearable=False,
+                    style={'display': 'inline-block', 'width': '180px', 'vertical-align': 'middle'}
+                ),
+                dcc.RadioItems(
+                    id='export-format-radio',
+                    options=[
+                        {'label': 'CSV', 'value': 'csv'},
+                        {'label': 'Parquet', 'value': 'parquet'},
+                        {'label': 'Excel', 'value': 'xlsx'}
+                    ],
+                    value='csv',
+                    inline=True,
+                    inputStyle={'margin-left': '15px', 'margin-right': '5px'},
+                    style={'display': 'inline-block'}
+                ),
+                dcc.Checklist(
+                    id='export-compression-checklist',
+                    options=[{'label': 'gzip', 'value': 'gzip'}],
+                    value=[],
+                    inline=True,
+                    inputStyle={'margin-left': '15px', 'margin-right': '5px'},
+                    style={'display': 'inline-block'}
+                ),
+                html.A('Download', id='export-link', className='btn btn-outline-primary btn-sm',
+                       style={'margin-left': '15px'})
+            ], style={'margin-top': '20px', 'margin-left': '40px'}),
+            # Map mode selection
+            html.Div([
+                html.Label('Map:', style={'font-weight': 'bold', 'margin-right': '10px'}),
+                dcc.RadioItems(
+                    id='map-mode-radio',
+                    options=[
+                        {'label': 'Station heatmap', 'value': 'heatmap'},
+                        {'label': 'Country choropleth', 'value': 'choropleth'}
+                    ],
+                    value='heatmap',
+                    inline=True,
+                    inputStyle={'margin-left': '15px', 'margin-right': '5px'},
+                    style={'display': 'inline-block'}
+                )
+            ], style={'margin-top': '20px', 'margin-left': '40px'}),
             # Add the Folium map 
             dbc.Row([
                 dbc.Col(
                     html.Iframe(
                         id='folium-map',
-                        srcDoc=open('map.html', 'r').read(),
                         width='100%',
                         height='600'
                     ),
                     width={"size":10, "offset":1})
-            ], style={'margin-top': '20px'}),
+            ], id='heatmap-container', style={'margin-top': '20px'}),
+            # Country choropleth, shown instead of the heatmap
+            dbc.Row([
+                dbc.Col(dcc.Graph(id='choropleth-map'), width={"size": 10, "offset": 1})
+            ], id='choropleth-container', style={'display': 'none'}),
+            # Nearest stations: click a station on the map or enter a coordinate
+            dbc.Row([
+                dbc.Col(
+                    dcc.Graph(id='station-locator'),
+                    width=6
+                ),
+                dbc.Col(
+                    html.Div([
+                        html.Label('Nearest stations to:', style={'font-weight': 'bold'}),
+                        html.Div([
+                            dcc.Input(id='nearest-latitude', type='number', placeholder='Latitude', min=-90, max=90,
+                                      value=46.95, style={'width': '110px', 'margin-right': '10px'}),
+                            dcc.Input(id='nearest-longitude', type='number', placeholder='Longitude', min=-180, max=180,
+                                      value=7.45, style={'width': '110px', 'margin-right': '10px'}),
+                            dcc.Input(id='nearest-count', type='number', placeholder='Stations', min=1, max=50, step=1,
+                                      value=5, style={'width': '90px', 'margin-right': '10px'}),
+                            dcc.Input(id='nearest-radius', type='number', placeholder='Radius (km)', min=0,
+                                      style={'width': '110px'})
+                        ], style={'margin-top': '5px', 'margin-bottom': '10px'}),
+                        html.Div(id='nearest-stations-table')
+                    ], style={'margin-top': '10px'}),
+                    width=6
+                )
+            ], style={'margin-top': '20px', 'margin-left': '20px', 'margin-right': '20px'}),
             # Disclaimer
             dbc.Row([
                 dbc.Col(
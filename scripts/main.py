@@ -12,7 +12,7 @@ Modules:
 import os
 from dash import Dash
 import dash_bootstrap_components as dbc
-from data_manager import AirQualityData
+from data_manager import DatasetRegistry
 from layout_manager import AirQualityLayout
 from callback_manager import AirQualityCallbacks
 from pathlib import Path
@@ -23,12 +23,26 @@ current_directory= os.getcwd()
 directory = os.path.join(current_directory)
 os.chdir(directory)
 
+# Define the path to the data file
+DATA_FILE_PATH = Path(__file__).resolve().parents[1] / "who_ambient_air_quality_database_version_2024_(v6.1).xlsx"
+
+# Optional list of further datasets (other releases, own monitoring exports), see README
+DATASETS_CONFIG_PATH = Path(__file__).resolve().parents[1] / "datasets.json"
+
+# Engine answering the queries of the callbacks: 'pandas' or 'duckdb' (requires the duckdb package)
+QUERY_BACKEND = 'pandas'
+
+# Draw the main plot in the browser from a pre-aggregated payload, so the time span slider and the
+# station type checklist update it without a request (mean and population-weighted mean only, see README)
+CLIENTSIDE_SERIES = False
+
 class AirQualityDashboard:
     """
     A class that defines a dashboard to visualize data.
 
     Attributes:
-        data: An instance of AirQualityData containing the air quality data.
+        datasets: A DatasetRegistry of the datasets the dashboard can switch between.
+        data: An instance of AirQualityData containing the default dataset, the only one loaded at start up.
         app: The Dash application instance.
         layout: The layout of the dashboard defining position and style of components.
         callbacks: The callbacks to handle user interactions with elements and plots.
@@ -36,11 +50,15 @@ class AirQualityDashboard:
     Methods:
         run_server(): Runs the Dash server on the specified port.
     """
-    def __init__(self, data_path, sheet_name="Update 2024 (V6.1)"):
-        self.data = AirQualityData(data_path, sheet_name)
+    def __init__(self, data_path, sheet_name="Update 2024 (V6.1)", datasets_config=None):
+        self.datasets = DatasetRegistry(backend=QUERY_BACKEND)
+        self.datasets.register(data_path, sheet_name)
+        if datasets_config is not None and os.path.exists(datasets_config):
+            self.datasets.register_config(datasets_config)
+        self.data = self.datasets.get()
         self.app = Dash(__name__, external_stylesheets=[dbc.themes.BOOTSTRAP])
-        self.layout = AirQualityLayout(self.app, self.data)
-        self.callbacks = AirQualityCallbacks(self.app, self.data)
+        self.layout = AirQualityLayout(self.app, self.data, self.datasets, clientside_series=CLIENTSIDE_SERIES)
+        self.callbacks = AirQualityCallbacks(self.app, self.data, self.datasets, clientside_series=CLIENTSIDE_SERIES)
 
 
     def run_server(self):
@@ -52,12 +70,9 @@ class AirQualityDashboard:
 
 if __name__ == '__main__':
 
-    # Define the path to the data file
-    DATA_FILE_PATH = Path(__file__).resolve().parents[1] / "who_ambient_air_quality_database_version_2024_(v6.1).xlsx"
-    
     try:
         # Try to create an instance of the AirQualityDashboard and run the server
-        DASHBOARD = AirQualityDashboard(DATA_FILE_PATH)
+        DASHBOARD = AirQualityDashboard(DATA_FILE_PATH, datasets_config=DATASETS_CONFIG_PATH)
         DASHBOARD.run_server()
     except FileNotFoundError as e:
         # Handle the case where data file does not exist
@@ -1,5 +1,123 @@
-import folium
-from folium.plugins import MarkerCluster, HeatMap
+import json
+
+import numpy as np
+
+from aqi_standards import get_standard
+
+# Deepest zoom level of the dashboard map and its station clusters
+STATION_MAP_MAX_ZOOM = 8
+
+# Size of a cluster cell in screen pixels (a power of two, so that cells of one zoom level merge into the next)
+CLUSTER_CELL_PIXELS = 64
+
+# URL the station clusters of a dataset are served at (see AirQualityCallbacks.register_cluster_route)
+STATION_CLUSTERS_URL = '/clusters/stations.json'
+
+# Script of the precomputed cluster layer: draws the clusters of the current zoom level as circle markers.
+# Clusters given as a URL are fetched when the layer is first shown.
+CLUSTER_LAYER_SCRIPT = """
+{% macro script(this, kwargs) %}
+(function() {
+    var group = {{ this._parent.get_name() }};
+    var map = {{ this._parent._parent.get_name() }};
+    var source = {{ this.source_json }};
+    var levels = null;
+    var loading = false;
+    var zooms = [];
+    var renderer = L.canvas();
+    function draw() {
+        if (levels === null || !map.hasLayer(group)) { return; }
+        var zoom = map.getZoom();
+        var level = zooms[0];
+        zooms.forEach(function(z) { if (z <= zoom) { level = z; } });
+        var clusters = levels[level];
+        // Only draw the clusters in (and slightly around) the visible part of the map
+        var bounds = map.getBounds().pad(0.2);
+        group.clearLayers();
+        for (var i = 0; i < clusters[2].length; i++) {
+            var count = clusters[2][i];
+            var position = L.latLng(clusters[0][i] / {{ this.scale }}, clusters[1][i] / {{ this.scale }});
+            if (!bounds.contains(position)) { continue; }
+            L.circleMarker(position, {
+                renderer: renderer, radius: 4 + 4 * Math.log10(count), weight: 1,
+                color: '#1f4e79', fillColor: '#1f77b4', fillOpacity: 0.6
+            }).bindTooltip(count + (count == 1 ? ' station' : ' stations')).addTo(group);
+        }
+    }
+    function load(json) {
+        levels = json;
+        zooms = Object.keys(levels).map(Number).sort(function(a, b) { return a - b; });
+        draw();
+    }
+    function show() {
+        if (levels !== null) {
+            draw();
+        } else if (typeof source !== 'string') {
+            load(source);
+        } else if (!loading) {
+            loading = true;
+            fetch(source).then(function(response) { return response.json(); }).then(load);
+        }
+    }
+    group.on('add', show);
+    map.on('moveend', draw);
+    if (map.hasLayer(group)) { show(); }
+})();
+{% endmacro %}
+"""
+
+
+def compute_zoom_clusters(latitude, longitude, min_zoom=0, max_zoom=10, cell_pixels=CLUSTER_CELL_PIXELS, scale=1000):
+    """
+    Clusters points on a grid of Web Mercator cells for every zoom level, vectorized with NumPy.
+    The clusters are hierarchical: the finest level is built from the points, every coarser level
+    by merging the four cells of the next finer level, weighted by their number of points.
+
+    Args:
+        latitude (array-like): Latitudes of the points in degrees.
+        longitude (array-like): Longitudes of the points in degrees.
+        min_zoom (int): Coarsest zoom level.
+        max_zoom (int): Finest zoom level.
+        cell_pixels (int): Size of a cluster cell in screen pixels, a power of two.
+        scale (int): Coordinates are stored as integers of degrees times scale to keep the payload small.
+
+    Returns:
+        dict: Per zoom level a list [latitudes, longitudes, counts] of integer lists. Levels that would
+              repeat the clusters of the next coarser level are left out.
+    """
+    latitude = np.asarray(latitude, dtype=float)
+    longitude = np.asarray(longitude, dtype=float)
+    valid = ~(np.isnan(latitude) | np.isnan(longitude))
+    latitude, longitude = latitude[valid], longitude[valid]
+    if not len(latitude):
+        return {}
+
+    # Web Mercator position in [0, 1) on both axes
+    x = (longitude + 180) / 360
+    sin_latitude = np.sin(np.radians(np.clip(latitude, -85.05, 85.05)))
+    y = 0.5 - np.log((1 + sin_latitude) / (1 - sin_latitude)) / (4 * np.pi)
+
+    cells = (256 // cell_pixels) * 2 ** max_zoom
+    cell_x = np.minimum((x * cells).astype(np.int64), cells - 1)
+    cell_y = np.minimum((y * cells).astype(np.int64), cells - 1)
+    count = np.ones(len(latitude))
+
+    levels = {}
+    for zoom in range(max_zoom, min_zoom - 1, -1):
+        keys, inverse = np.unique(cell_x * cells + cell_y, return_inverse=True)
+        merged_count = np.bincount(inverse, weights=count)
+        latitude = np.bincount(inverse, weights=latitude * count) / merged_count
+        longitude = np.bincount(inverse, weights=longitude * count) / merged_count
+        count = merged_count
+        cell_x, cell_y = keys // cells // 2, keys % cells // 2
+        cells //= 2
+        levels[zoom] = [np.round(latitude * scale).astype(int).tolist(),
+                        np.round(longitude * scale).astype(int).tolist(),
+                        count.astype(int).tolist()]
+
+    # Keep only the coarsest of the levels without any merging between them
+    return {zoom: clusters for zoom, clusters in levels.items()
+            if zoom == min_zoom or len(clusters[2]) != len(levels[zoom - 1][2])}
 
 class Map:
     """
@@ -18,7 +136,9 @@ class Map:
             Adds a single marker to the map.
         add_clustered_markers(locations, popups=None, tooltips=None, layer_name='Clustered Markers'):
             Adds clustered markers to the map.
-        add_heatmap(locations, radius=10, blur=15, max_zoom=2, layer_name='Heatmap'):
+        add_precomputed_clusters(clusters, layer_name='Stations', show=True, scale=1000):
+            Adds a layer drawing clusters precomputed per zoom level.
+        add_heatmap(locations, radius=10, blur=15, max_zoom=2, layer_name='Heatmap', standard=None):
             Adds a heatmap layer to the map.
         update_layer_control():
             Updates the LayerControl to reflect the current layers on the map.
@@ -28,6 +148,8 @@ class Map:
             Determines if the map should be displayed based on station type selection.
         save(file_path='map.html'):
             Saves the map to an HTML file. If no layers are added, displays a logo instead of the map.
+        render():
+            Returns the HTML of the map as a string without writing it to disk.
         get_map():
             Returns the current map object if layers are added, otherwise returns None.
     """
@@ -41,6 +163,8 @@ class Map:
         zoom_start (int): Initial zoom level for the map.
         max_zoom (int): Maximum zoom level for the map.
         """
+        # Folium is imported on first use to keep the dashboard start up fast
+        import folium
         self.map = folium.Map(location=start_coords, zoom_start=zoom_start, max_zoom=max_zoom)
         # Keep track of layers for the layer control
         self.layers = []
@@ -56,6 +180,7 @@ class Map:
         tooltip (str, optional): Tooltip text for the marker.
         layer_name (str): Name of the layer in the LayerControl.
         """
+        import folium
         feature_group = folium.FeatureGroup(name=layer_name)
         marker = folium.Marker(location=location, popup=popup, tooltip=tooltip)
         marker.add_to(feature_group)
@@ -64,7 +189,8 @@ class Map:
 
     def add_clustered_markers(self, locations, popups=None, tooltips=None, layer_name='Clustered Markers'):
         """
-        Add clustered markers to the map.
+        Add clustered markers to the map. Every marker is serialized into the HTML, which suits a few
+        markers with popups; use add_precomputed_clusters for large numbers of stations.
 
         Parameters:
         locations (list): List of coordinates for the markers [[lat1, lon1], [lat2, lon2], ...].
@@ -72,6 +198,8 @@ class Map:
         tooltips (list, optional): List of tooltip texts corresponding to the markers.
         layer_name (str): Name of the layer in the LayerControl.
         """
+        import folium
+        from folium.plugins import MarkerCluster
         marker_cluster = MarkerCluster(name=layer_name)
         for i, location in enumerate(locations):
             popup = popups[i] if popups else None
@@ -80,7 +208,32 @@ class Map:
         marker_cluster.add_to(self.map)
         self.layers.append(marker_cluster)
 
-    def add_heatmap(self, locations, radius=10, blur=15, max_zoom=2, layer_name='Heatmap'):
+    def add_precomputed_clusters(self, clusters, layer_name='Stations', show=True, scale=1000):
+        """
+        Add a layer drawing clusters precomputed per zoom level (see compute_zoom_clusters).
+        The compact cluster arrays are drawn on a canvas for the current zoom level, unlike
+        add_clustered_markers which serializes one marker per location. Given as a URL, the clusters
+        are not embedded in the HTML at all but fetched once the layer is shown, so that maps redrawn
+        on every update can share the clusters cached by the browser.
+
+        Parameters:
+        clusters (dict or str): Output of compute_zoom_clusters, or the URL it is served at as JSON.
+        layer_name (str): Name of the layer in the LayerControl.
+        show (bool): Whether the layer is shown when the map opens.
+        scale (int): The scale the coordinates of the clusters were stored with.
+        """
+        import folium
+        from jinja2 import Template
+        feature_group = folium.FeatureGroup(name=layer_name, show=show)
+        cluster_script = folium.MacroElement()
+        cluster_script._template = Template(CLUSTER_LAYER_SCRIPT)
+        cluster_script.source_json = json.dumps(clusters, separators=(',', ':'))
+        cluster_script.scale = scale
+        cluster_script.add_to(feature_group)
+        feature_group.add_to(self.map)
+        self.layers.append(feature_group)
+
+    def add_heatmap(self, locations, radius=10, blur=15, max_zoom=2, layer_name='Heatmap', standard=None):
         """
         Add a heatmap layer to the map.
 
@@ -90,15 +243,13 @@ class Map:
         blur (int): Amount of blur for the heatmap points.
         max_zoom (int): Maximum zoom level for the heatmap.
         layer_name (str): Name of the layer in the LayerControl.
+        standard (AQIStandard, optional): The AQI standard defining gradient and legend. Defaults to the US EPA AQI.
         """
-        gradient = {
-            1.0: "maroon",
-            0.75: "purple",
-            0.5: "red",
-            0.35: "orange",
-            0.24: "yellow",
-            0.0: "green"
-        }
+        import folium
+        from folium.plugins import HeatMap
+        if standard is None:
+            standard = get_standard()
+        gradient = standard.gradient()
         heatmap = HeatMap(locations, radius=radius, blur=blur, max_zoom=max_zoom, gradient=gradient, name=layer_name)
         # Add heatmap as a raster layer to the map
         heatmap.add_to(self.map) 
@@ -106,19 +257,17 @@ class Map:
         self.layers.append(heatmap) 
 
         # Add custom legend to map in html as there is no native tool in folium
-        legend_html = '''
+        legend_rows = ''.join(
+            f'<i style="background:{color}; width: 20px; height: 20px; display: inline-block;"></i> {text}<br>'
+            for text, _, color in standard.legend_entries())
+        legend_html = f'''
         <div style="position: fixed;
-                    bottom: 50px; left: 50px; width: 100px; height: 190px; 
+                    bottom: 50px; left: 50px; width: 130px;
                     border:2px solid grey; z-index:9999; font-size:14px;
                     padding: 10px;">
-        <p style="margin: 0; font-weight: bold;">AQI index<br></p>
+        <p style="margin: 0; font-weight: bold;">{standard.index_name} index<br></p>
         <p style="margin: 0;">
-            <i style="background:green; width: 20px; height: 20px; display: inline-block;"></i> 0-50<br>
-            <i style="background:yellow; width: 20px; height: 20px; display: inline-block;"></i> 51-100<br>
-            <i style="background:orange; width: 20px; height: 20px; display: inline-block;"></i> 101-150<br>
-            <i style="background:red; width: 20px; height: 20px; display: inline-block;"></i> 151-200<br>
-            <i style="background:purple; width: 20px; height: 20px; display: inline-block;"></i> 201-300<br>
-            <i style="background:maroon; width: 20px; height: 20px; display: inline-block;"></i> 301-500
+            {legend_rows}
         </p>
         </div>
         '''
@@ -128,6 +277,7 @@ class Map:
         """
         Update the LayerControl to reflect the current layers on the map.
         """
+        import folium
         # Remove any existing LayerControl
         for child in self.map._children:
             if isinstance(self.map._children[child], folium.LayerControl):
@@ -171,6 +321,19 @@ class Map:
             with open(gif_path, "w") as f:
                 f.write('<img src="no_data.html">') 
                 
+    def render(self):
+        """
+        Render the map to an HTML string without writing it to disk.
+
+        Returns:
+        str: The HTML document of the map, or None if no station type is selected.
+        """
+        if not self.should_display_map():
+            return None
+        # Ensure Layer control is updated before rendering
+        self.update_layer_control()
+        return self.map.get_root().render()
+
     def get_map(self):
         """
         Get the current map object.
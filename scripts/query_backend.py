@@ -0,0 +1,415 @@
+"""
+query_backend.py
+
+Query backends answering the selections of the dashboard (time span, station types, region) with
+aggregated results only. The callbacks never touch the rows themselves, so the same callback code
+runs on the in-memory pandas frame or on an embedded DuckDB database that pushes the filter and the
+groupby down to a columnar table or a Parquet file.
+
+The DuckDB backend is optional and requires the duckdb package (pip install duckdb).
+"""
+
+import os
+import re
+
+import numpy as np
+import pandas as pd
+
+from aggregation import AGGREGATION_MODES, PERCENTILE_BAND, WEIGHT_COLUMNS, aggregate, period_column
+
+# Statistics per group returned by moments(), as used by series_statistics.py
+MOMENTS = ['mean', 'std', 'count']
+
+# Column added by the DuckDB backend with an integer code per station type, compared instead of the texts
+STATION_TYPE_CODE = 'station_type_code'
+
+# Largest station type code matched with a bit mask instead of an IN list (bits of a BIGINT)
+MAX_MASK_CODE = 62
+
+# Order of the rows stored by the DuckDB backend. Sorted by region and year, every block of rows
+# covers few regions and years, so DuckDB skips the blocks outside a selection by their min/max.
+SORT_ORDER = 'who_region, year'
+
+# Key of the Parquet metadata recording the version of the data a Parquet copy was written from
+PARQUET_VERSION_KEY = 'inspectair_version'
+
+
+def station_type_pattern(selected_station_types):
+    """
+    Builds the regular expression matching any of the selected station types as a whole word.
+
+    Args:
+        selected_station_types (list): The types of stations selected.
+
+    Returns:
+        str: The pattern, e.g. r'\\bUrban\\b|\\bRural\\b'.
+    """
+    return '|'.join(r'\b{}\b'.format(re.escape(word)) for word in selected_station_types)
+
+
+def selection_mask(df, selected_year, selected_station_types, selected_continent=''):
+    """
+    Returns which rows of the air quality data match a selection of the dashboard.
+
+    Args:
+        df (DataFrame): The air quality data.
+        selected_year (list): The range of years selected, either bound may be 'all'.
+        selected_station_types (list): The types of stations selected, ['all'] for every station.
+        selected_continent (str): The region code selected, '' for the whole world.
+
+    Returns:
+        np.ndarray: A boolean mask over the rows.
+    """
+    mask = np.ones(len(df), dtype=bool)
+
+    # Filter data based on selected station types
+    if selected_station_types.count('all') == 0:
+        pattern = station_type_pattern(selected_station_types)
+        mask &= df['type_of_stations'].str.contains(pattern, na=False).to_numpy()
+
+    # Filter data based on selected year range
+    selected_from_year, selected_to_year = selected_year
+    if selected_from_year != 'all':
+        mask &= (df['year'] >= int(selected_from_year)).to_numpy()
+    if selected_to_year != 'all':
+        mask &= (df['year'] <= int(selected_to_year)).to_numpy()
+
+    # Filter data based on selected region
+    if selected_continent != '':
+        mask &= (df['who_region'] == selected_continent).to_numpy()
+
+    return mask
+
+
+def filter_rows(df, selected_year, selected_station_types, selected_continent=''):
+    """
+    Returns the rows of the air quality data matching a selection of the dashboard, see selection_mask().
+
+    Returns:
+        DataFrame: The filtered data.
+    """
+    return df[selection_mask(df, selected_year, selected_station_types, selected_continent)]
+
+
+class PandasBackend:
+    """
+    Answers the queries of the dashboard with pandas on the in-memory data.
+
+    Attributes:
+        data: The AirQualityData whose frame is queried.
+        df: The frame queried instead of the frame of `data`, e.g. a rollup of timestamped data.
+
+    The rows of the last selection are kept, as one callback runs several queries on the same selection.
+
+    Methods:
+        aggregate(selected_year, selected_station_types, selected_continent, by, value, mode='mean'):
+            Returns the aggregated value per group for a selection.
+        moments(selected_year, selected_station_types, selected_continent, by, value):
+            Returns mean, standard deviation and number of values per group for a selection.
+    """
+    name = 'pandas'
+
+    def __init__(self, data, df=None):
+        """
+        Args:
+            data (AirQualityData): The data to query.
+            df (DataFrame, optional): A frame with the columns of the data queried instead of data.df.
+        """
+        self.data = data
+        self.df = df
+        self._last_selection = (None, None)
+
+    def _filter(self, selected_year, selected_station_types, selected_continent):
+        """
+        Returns the rows of a selection, reusing the rows of the previous query if the selection is the same.
+        """
+        key = (tuple(selected_year), tuple(selected_station_types), selected_continent)
+        last_key, last_rows = self._last_selection
+        if key != last_key:
+            df = self.data.df if self.df is None else self.df
+            last_rows = filter_rows(df, list(selected_year), list(selected_station_types), selected_continent)
+            self._last_selection = (key, last_rows)
+        return last_rows
+
+    def aggregate(self, selected_year, selected_station_types, selected_continent, by, value, mode='mean'):
+        """
+        Returns the aggregated value per group for a selection of the dashboard.
+
+        Args:
+            selected_year (list): The range of years selected, either bound may be 'all'.
+            selected_station_types (list): The types of stations selected, ['all'] for every station.
+            selected_continent (str): The region code selected, '' for the whole world.
+            by (list): The columns to group by.
+            value (str): The column to aggregate.
+            mode (str): One of the keys of AGGREGATION_MODES.
+
+        Returns:
+            DataFrame: As aggregation.aggregate(), indexed by the group columns.
+        """
+        filtered_df = self._filter(selected_year, selected_station_types, selected_continent)
+        return aggregate(filtered_df, by, value, mode)
+
+    def moments(self, selected_year, selected_station_types, selected_continent, by, value):
+        """
+        Returns the mean, standard deviation and number of values per group for a selection of the dashboard.
+
+        Args:
+            selected_year (list): The range of years selected.
+            selected_station_types (list): The types of stations selected.
+            selected_continent (str): The region code selected, '' for the whole world.
+            by (list): The columns to group by.
+            value (str): The column to describe.
+
+        Returns:
+            DataFrame: Indexed by the group columns with the columns 'mean', 'std' and 'count'.
+        """
+        filtered_df = self._filter(selected_year, selected_station_types, selected_continent)
+        return filtered_df.groupby(by, observed=True)[value].agg(MOMENTS)
+
+
+class DuckDBBackend:
+    """
+    Answers the queries of the dashboard with DuckDB. The filter and the groupby run inside the
+    engine and only the aggregated rows are returned. The data is either copied into an in-memory
+    columnar table or, for data larger than the memory, read from a Parquet file on every query.
+
+    Attributes:
+        connection: The DuckDB connection holding the 'air_quality' table or view.
+        parquet_path: The Parquet file queried, None for an in-memory table.
+        columns: The columns that can be queried.
+        station_types: A dictionary mapping the distinct station types to their codes (1, 2, ...) in the 'station_type_code' column.
+
+    Methods:
+        from_dataframe(df, parquet_path=None, version=None):
+            Creates the backend from a DataFrame, optionally storing it as Parquet first.
+        stored_version(parquet_path):
+            Returns the version of the data a Parquet file was written from.
+        aggregate(selected_year, selected_station_types, selected_continent, by, value, mode='mean'):
+            Returns the aggregated value per group for a selection.
+        moments(selected_year, selected_station_types, selected_continent, by, value):
+            Returns mean, standard deviation and number of values per group for a selection.
+    """
+    name = 'duckdb'
+
+    def __init__(self, parquet_path=None, df=None):
+        """
+        Connects an in-memory DuckDB database to the data.
+
+        Args:
+            parquet_path (str): A Parquet file queried in place.
+            df (DataFrame): A DataFrame copied into a DuckDB table, used if no Parquet file is given.
+                            The Parquet file must have been written by from_dataframe().
+        """
+        try:
+            import duckdb
+        except ImportError as error:
+            raise ImportError("The 'duckdb' query backend requires the duckdb package (pip install duckdb)") from error
+
+        self.connection = duckdb.connect()
+        self.parquet_path = parquet_path
+        if parquet_path is not None:
+            path = str(parquet_path).replace("'", "''")
+            self.connection.execute(f"CREATE VIEW air_quality AS SELECT * FROM read_parquet('{path}')")
+        else:
+            self.connection.register('source_frame', self.with_station_type_codes(df))
+            self.connection.execute(f'CREATE TABLE air_quality AS SELECT * FROM source_frame ORDER BY {SORT_ORDER}')
+            self.connection.unregister('source_frame')
+        self.columns = {row[0] for row in self.connection.execute('DESCRIBE air_quality').fetchall()}
+        # The station types are few distinct texts: matching them once turns the filter into a test of codes
+        self.station_types = dict(self.connection.execute(
+            f'SELECT DISTINCT CAST(type_of_stations AS VARCHAR), {STATION_TYPE_CODE} FROM air_quality '
+            f'WHERE {STATION_TYPE_CODE} > 0').fetchall())
+
+    @staticmethod
+    def with_station_type_codes(df):
+        """
+        Adds the code of the station type to every row, starting at 1, and 0 where the station type is missing.
+        """
+        codes, _ = pd.factorize(df['type_of_stations'])
+        return df.assign(**{STATION_TYPE_CODE: (codes + 1).astype(np.int16)})
+
+    @classmethod
+    def from_dataframe(cls, df, parquet_path=None, version=None):
+        """
+        Creates the backend from a DataFrame. With a Parquet path the frame is written to the file
+        and queried from there, so it is not kept in the memory of DuckDB. A file written from the
+        same version of the data is reused instead of being written again.
+
+        Args:
+            df (DataFrame): The processed air quality data.
+            parquet_path (str, optional): Where to store the data as Parquet.
+            version (str, optional): Identifies the data, e.g. the cache version and the modification time
+                                     of its source. Without a version the file is always written.
+
+        Returns:
+            DuckDBBackend: The backend.
+        """
+        if parquet_path is None:
+            return cls(df=df)
+        if version is not None and cls.stored_version(parquet_path) == version:
+            return cls(parquet_path=parquet_path)
+        import duckdb
+        connection = duckdb.connect()
+        connection.register('source_frame', cls.with_station_type_codes(df))
+        path = str(parquet_path).replace("'", "''")
+        options = 'FORMAT parquet'
+        if version is not None:
+            # The version is stored in the metadata of the file, to be compared by the next load
+            literal = str(version).replace("'", "''")
+            options += f", KV_METADATA {{{PARQUET_VERSION_KEY}: '{literal}'}}"
+        connection.execute(f"COPY (SELECT * FROM source_frame ORDER BY {SORT_ORDER}) TO '{path}' ({options})")
+        connection.close()
+        return cls(parquet_path=parquet_path)
+
+    @staticmethod
+    def stored_version(parquet_path):
+        """
+        Returns the version of the data a Parquet file was written from (see from_dataframe()),
+        None if the file does not exist, cannot be read or has no version.
+        """
+        if not os.path.exists(parquet_path):
+            return None
+        import duckdb
+        try:
+            with duckdb.connect() as connection:
+                rows = connection.execute('SELECT value FROM parquet_kv_metadata(?) WHERE key = ?',
+                                          [str(parquet_path), PARQUET_VERSION_KEY]).fetchall()
+        except duckdb.Error:
+            return None
+        return rows[0][0].decode() if rows else None
+
+    def _check_columns(self, columns):
+        """
+        Raises a ValueError for columns the data does not have, as they are used as SQL identifiers.
+        """
+        unknown = [column for column in columns if column not in self.columns]
+        if unknown:
+            raise ValueError(f"Unknown column(s) {unknown}")
+
+    def _where(self, selected_year, selected_station_types, selected_continent, by):
+        """
+        Builds the WHERE clause of a selection and its parameters. Rows with a missing group key
+        are left out, as pandas does not group them either.
+        """
+        conditions, parameters = [], []
+        if 'all' not in selected_station_types:
+            pattern = re.compile(station_type_pattern(selected_station_types))
+            matching = [code for station_type, code in self.station_types.items() if pattern.search(station_type)]
+            if not matching:
+                conditions.append('FALSE')
+            elif max(matching) <= MAX_MASK_CODE:
+                # Testing one bit of a mask is about three times faster than an IN list in DuckDB
+                conditions.append(f'((1::BIGINT << {STATION_TYPE_CODE}) & ?) != 0')
+                parameters.append(sum(1 << code for code in matching))
+            else:
+                conditions.append(f"{STATION_TYPE_CODE} IN ({', '.join('?' * len(matching))})")
+                parameters += matching
+        selected_from_year, selected_to_year = selected_year
+        if selected_from_year != 'all':
+            conditions.append('year >= ?')
+            parameters.append(int(selected_from_year))
+        if selected_to_year != 'all':
+            conditions.append('year <= ?')
+            parameters.append(int(selected_to_year))
+        if selected_continent != '':
+            conditions.append('who_region = ?')
+            parameters.append(selected_continent)
+        conditions += [f'"{column}" IS NOT NULL' for column in by]
+        return ('WHERE ' + ' AND '.join(conditions)) if conditions else '', parameters
+
+    def _query(self, selections, selected_year, selected_station_types, selected_continent, by, window=None):
+        """
+        Runs a grouped query and returns the result indexed by the group columns, sorted like a pandas groupby.
+        A window column (e.g. 'count(x) OVER (...) AS w') is computed over the selected rows before they are
+        grouped, including the rows with a missing group key, as pandas does.
+        """
+        keys = ', '.join(f'"{column}"' for column in by)
+        if window is None:
+            where, parameters = self._where(selected_year, selected_station_types, selected_continent, by)
+            source = 'air_quality'
+        else:
+            where, parameters = self._where(selected_year, selected_station_types, selected_continent, [])
+            source = f'(SELECT *, {window} FROM air_quality {where})'
+            where = ('WHERE ' + ' AND '.join(f'"{column}" IS NOT NULL' for column in by)) if by else ''
+        sql = f'SELECT {keys}, {", ".join(selections)} FROM {source} {where} GROUP BY {keys}'
+        # A cursor per query, so that concurrent callbacks do not share a connection
+        result = self.connection.cursor().execute(sql, parameters).df()
+        # Sorting the few aggregated rows in pandas is much cheaper than an ORDER BY in the query
+        return result.set_index(by).sort_index()
+
+    def aggregate(self, selected_year, selected_station_types, selected_continent, by, value, mode='mean'):
+        """
+        Returns the aggregated value per group for a selection of the dashboard, see PandasBackend.aggregate().
+        """
+        if mode not in AGGREGATION_MODES:
+            raise ValueError(f"Unsupported aggregation mode '{mode}'")
+        self._check_columns(by + [value])
+        column = f'"{value}"'
+        window = None
+
+        if mode == 'mean':
+            selections = [f'avg({column}) AS {column}']
+        elif mode == 'median':
+            selections = [f'quantile_cont({column}, 0.5) AS {column}']
+        elif mode == 'percentile':
+            lower, upper = PERCENTILE_BAND
+            selections = [f'quantile_cont({column}, 0.5) AS {column}',
+                          f'quantile_cont({column}, {lower}) AS lower',
+                          f'quantile_cont({column}, {upper}) AS upper']
+        else:
+            # Weighted mean: sum(w * x) / sum(w), ignoring the weight of missing values
+            if mode == 'station_weighted':
+                # Every city counts once per period: the inverse number of its selected rows with a value
+                weight = 'selection_weight'
+                period = period_column(self.columns)
+                window = (f'1.0 / nullif(count({column}) OVER (PARTITION BY city, "{period}"), 0) '
+                          f'AS {weight}')
+            else:
+                weight = WEIGHT_COLUMNS[mode]
+                if weight not in self.columns:
+                    raise ValueError(f"Aggregation mode '{mode}' requires a '{weight}' column")
+            present = f'{column} IS NOT NULL AND "{weight}" IS NOT NULL'
+            selections = [f'sum({column} * "{weight}") FILTER (WHERE {present}) '
+                          f'/ nullif(sum("{weight}") FILTER (WHERE {present}), 0) AS {column}']
+
+        result = self._query(selections, selected_year, selected_station_types, selected_continent, by, window)
+        return result.astype(float)
+
+    def moments(self, selected_year, selected_station_types, selected_continent, by, value):
+        """
+        Returns the mean, standard deviation and number of values per group for a selection of the
+        dashboard, see PandasBackend.moments().
+        """
+        self._check_columns(by + [value])
+        column = f'"{value}"'
+        selections = [f'avg({column}) AS mean', f'stddev_samp({column}) AS std', f'count({column}) AS count']
+        result = self._query(selections, selected_year, selected_station_types, selected_continent, by)
+        return result.astype({'mean': float, 'std': float, 'count': np.int64})
+
+
+# Query backends by the name used in AirQualityData(backend=...)
+QUERY_BACKENDS = {
+    'pandas': PandasBackend,
+    'duckdb': DuckDBBackend
+}
+
+
+def create_backend(name, data, parquet_path=None, version=None):
+    """
+    Creates the query backend of a dataset.
+
+    Args:
+        name (str): One of the keys of QUERY_BACKENDS.
+        data (AirQualityData): The processed data.
+        parquet_path (str, optional): For the 'duckdb' backend, where the data is stored as Parquet.
+                                      Without a path the data is copied into an in-memory DuckDB table.
+        version (str, optional): Identifies the data, so that a Parquet file written from it is reused.
+
+    Returns:
+        PandasBackend or DuckDBBackend: The backend.
+    """
+    if name not in QUERY_BACKENDS:
+        raise ValueError(f"Unsupported query backend '{name}'")
+    if name == 'pandas':
+        return PandasBackend(data)
+    return DuckDBBackend.from_dataframe(data.df, parquet_path, version)
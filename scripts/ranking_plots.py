@@ -1,15 +1,27 @@
 import base64
-import regex as re
 import numpy as np
 import pandas as pd
 from math import floor
 from datahandling import *
+from aqi_standards import get_standard
+from aggregation import aggregate
 from io import BytesIO
-import matplotlib
-import matplotlib.pyplot as plt
-matplotlib.use('agg')
 
-def get_rank_10(df, selected_pollutant, selected_data_type):
+def _pyplot():
+    """
+    Imports matplotlib on first use instead of at module import, as it is by far the slowest
+    import of the dashboard and only needed once the first ranking plot is drawn.
+
+    Returns:
+        module: matplotlib.pyplot configured with the non-interactive 'agg' backend.
+    """
+    import matplotlib
+    matplotlib.use('agg')
+    import matplotlib.pyplot as plt
+    return plt
+
+def get_rank_10(df, selected_pollutant, selected_data_type, selected_standard='us_epa', selected_aggregation='mean',
+                city_aggregates=None):
     """
     Function which gets the top 10 values (both highest and lowest) for a selected 
     pollutant per city, as well as the corresponding AQI colour palettes.
@@ -18,6 +30,10 @@ def get_rank_10(df, selected_pollutant, selected_data_type):
         df (DataFrame): A dataframe prefiltered with the correct timespan, containing the relevant data for the ranking.
         selected_pollutant (str): A string indicating which pollutant is selected (e.g. 'no2').
         selected_data_type (str): A string indicating data type ['Concentration', 'AQI'].
+        selected_standard (str): The key of the AQI standard defining the colour palette.
+        selected_aggregation (str): The aggregation mode per city (see aggregation.py), 'percentile' ranks by median.
+        city_aggregates (DataFrame, optional): The aggregated pollutant per city if already computed,
+            e.g. by a query backend. df is then not used.
 
     Returns: 
         tuple: 
@@ -26,8 +42,11 @@ def get_rank_10(df, selected_pollutant, selected_data_type):
             - List of color palette for top 10 values
             - List of color palette for bottom 10 values
     """
-    # Get mean pollutant per city in prefiltered timeframe
-    mean_pollution_city = pd.pivot_table(data=df, index=['city'], aggfunc='mean', values=selected_pollutant)
+    # Get aggregated pollutant per city in prefiltered timeframe
+    if city_aggregates is None:
+        ranking_mode = 'median' if selected_aggregation == 'percentile' else selected_aggregation
+        city_aggregates = aggregate(df, ['city'], selected_pollutant, ranking_mode)
+    mean_pollution_city = city_aggregates[[selected_pollutant]].dropna()
     # Extract top 10 (=most polluted) and bottom 10 (=least polluted) cites
     top_ranked_10 = mean_pollution_city.sort_values(by=selected_pollutant, ascending=False)[0:10]
     bottom_ranked_10 = mean_pollution_city.sort_values(by=selected_pollutant, ascending=False)[-9:]
@@ -38,15 +57,16 @@ def get_rank_10(df, selected_pollutant, selected_data_type):
     # Define different colour palettes for selected data type AQI and concentration
     if str(selected_data_type)=='AQI':
                 # Assign color palette to AQI values
-                color_top = [assign_aqi_message(value)[1] for value in top_ranked_10[selected_pollutant].values]
-                color_bottom = [assign_aqi_message(value)[1] for value in bottom_ranked_10[selected_pollutant].values]
+                standard = get_standard(selected_standard)
+                color_top = list(standard.colors[standard.categorize(top_ranked_10[selected_pollutant].values)])
+                color_bottom = list(standard.colors[standard.categorize(bottom_ranked_10[selected_pollutant].values)])
     else:
          # Use red and green for concentration plots
          color_top = 10*['#cb4154']
          color_bottom = 10*['#a3e77f']
     return top_ranked_10, bottom_ranked_10, color_top, color_bottom
 
-def create_ranking_plot(selected_data_type, x, y, ranking_type, text=None, xlabel=None, color=None, title=None):
+def create_ranking_plot(selected_data_type, x, y, ranking_type, text=None, xlabel=None, color=None, title=None, standard=None):
     """
     Function which creates a ranking plot using matplotlib (horizontal barplot).
     The plot is saved to a temporary buffer and embedded into HTML as an image. 
@@ -60,10 +80,16 @@ def create_ranking_plot(selected_data_type, x, y, ranking_type, text=None, xlabe
         xlabel (str, optional): String containing labelling for x-axis.
         color (list, optional): List of 10 string color values for the bars.
         title (str, optional): String indicating plot title.
+        standard (AQIStandard, optional): The AQI standard for axis range and legend. Defaults to the US EPA AQI.
 
     Returns:
         str: Graph as img embedded into HTML.
     """
+    import regex as re
+    plt = _pyplot()
+    if standard is None:
+        standard = get_standard()
+
     # Format the city names - introduce line breaks for long names
     y_formatted = len(y)*[0]
     for i, city_name in enumerate(y):
@@ -80,7 +106,7 @@ def create_ranking_plot(selected_data_type, x, y, ranking_type, text=None, xlabe
             y_formatted[i] = city_name
     
     # Separate plots depening on the selected data type (AQI or concentration)
-    if str(selected_data_type == 'Concentration'):
+    if str(selected_data_type) == 'Concentration':
         fig, ax = plt.subplots(figsize = (14,6))
         # Create horizontal barplot
         plt.barh(y_formatted, np.log10(x), color=color, edgecolor='black')
@@ -118,13 +144,12 @@ def create_ranking_plot(selected_data_type, x, y, ranking_type, text=None, xlabe
         plt.barh(y_formatted, x, color=color, edgecolor='black')
         plt.xlabel(xlabel)
         plt.title(title)   
-        plt.xlim([0,500])
+        plt.xlim([0, standard.max_index])
         if ranking_type == 'top':
             # Add explanation for the AQI values as label
-            legend_labels = {'good': 'green', 'moderate': 'yellow', 'unhealthy to sens. groups': 'orange',
-                            'unhealthy': 'orange', 'very unhealthy': 'purple', 'hazardous': 'maroon'}
+            legend_labels = {label: color for _, label, color in standard.legend_entries()}
             legend_handles = [plt.Line2D([0], [0], color=color, linewidth=3, linestyle='-') for label, color in legend_labels.items()]
-            plt.legend(legend_handles, legend_labels.keys(), title='AQI color scheme')
+            plt.legend(legend_handles, legend_labels.keys(), title=f'{standard.index_name} color scheme')
         plt.gca().spines['top'].set_visible(False) 
         plt.gca().spines['right'].set_visible(False) 
 
@@ -135,6 +160,8 @@ def create_ranking_plot(selected_data_type, x, y, ranking_type, text=None, xlabe
     # Save the plot to temporary buffer
     buf = BytesIO()
     fig.savefig(buf, format="png")
+    # Release the figure, pyplot keeps every open figure alive otherwise
+    plt.close(fig)
     # Embed the result in the html output.
     fig_data = base64.b64encode(buf.getbuffer()).decode("ascii")
     final_graph = f'data:image/png;base64,{fig_data}'
@@ -0,0 +1,176 @@
+"""
+series_statistics.py
+
+Batched statistics for the pollutant time series of the main plot. Every statistic is computed
+with NumPy over the whole (group, year) matrix at once instead of per trace, so the overlays cost
+about the same whether one or fifty series are drawn.
+"""
+
+import numpy as np
+import pandas as pd
+
+from temporal_rollups import decimal_years
+
+# Two sided p-value below which a trend is marked as significant
+SIGNIFICANCE_LEVEL = 0.05
+
+
+def t_test_p_value(t, dof):
+    """
+    Two sided p-value of Student's t distribution for integer degrees of freedom, using the
+    closed form series of Abramowitz and Stegun (26.7.3 and 26.7.4), vectorized over both arguments.
+
+    Args:
+        t (array-like): The t statistics.
+        dof (array-like): The degrees of freedom (integers >= 1).
+
+    Returns:
+        np.ndarray: The p-values, NaN where t is NaN or dof < 1.
+    """
+    t = np.abs(np.asarray(t, dtype=float))
+    dof = np.asarray(dof, dtype=float)
+    t, dof = np.broadcast_arrays(t, dof)
+    valid = ~np.isnan(t) & (dof >= 1)
+    nu = np.where(valid, dof, 1.0)
+
+    theta = np.arctan(np.where(valid, t, 0.0) / np.sqrt(nu))
+    cos2 = np.cos(theta) ** 2
+    odd = nu % 2 == 1
+
+    # Sum the series term by term; each element stops at its own number of terms
+    series = np.ones_like(theta)
+    term = np.ones_like(theta)
+    n_terms = np.where(odd, (nu - 3) // 2, (nu - 2) // 2)
+    for j in range(1, int(n_terms.max(initial=0)) + 1):
+        factor = np.where(odd, (2 * j) / (2 * j + 1), (2 * j - 1) / (2 * j))
+        term = term * factor * cos2
+        series += np.where(j <= n_terms, term, 0.0)
+
+    odd_probability = 2 / np.pi * (theta + np.where(nu > 1, np.sin(theta) * np.cos(theta) * series, 0.0))
+    even_probability = np.sin(theta) * series
+    probability_inside = np.where(odd, odd_probability, even_probability)
+    return np.where(valid, np.clip(1 - probability_inside, 0.0, 1.0), np.nan)
+
+
+def group_year_matrix(df, group_column, value, moments=None, time_column='year'):
+    """
+    Reduces the data to (group, year) matrices of mean, standard deviation and number of values.
+
+    Args:
+        df (DataFrame): The filtered air quality data.
+        group_column (str): The column defining the series (e.g. 'who_region').
+        value (str): The column with the values.
+        moments (DataFrame, optional): The columns 'mean', 'std' and 'count' per (group, year) if
+                                       already computed, e.g. by a query backend. df is then not used.
+        time_column (str): 'year', or 'period' for the period starts of a rollup of timestamped data.
+
+    Returns:
+        tuple: The group labels, the years (consecutive, so that gaps stay NaN) or the sorted periods
+               and the mean, standard deviation and count matrices of shape (groups, years).
+    """
+    if moments is not None:
+        reduced = moments
+    else:
+        reduced = df.groupby([group_column, time_column], observed=True)[value].agg(['mean', 'std', 'count'])
+    if reduced.empty:
+        empty = np.empty((0, 0))
+        return [], np.empty(0), empty, empty, empty
+    time_values = reduced.index.get_level_values(time_column)
+    if time_column == 'year':
+        years = np.arange(int(time_values.min()), int(time_values.max()) + 1, dtype=float)
+    else:
+        years = time_values.unique().sort_values()
+    matrices = [reduced[statistic].unstack(time_column).reindex(columns=years)
+                for statistic in ['mean', 'std', 'count']]
+    groups = list(matrices[0].index)
+    return groups, years, *(matrix.to_numpy(dtype=float) for matrix in matrices)
+
+
+def trend_statistics(years, matrix):
+    """
+    Fits a least squares line through every row of a (group, year) matrix, ignoring missing values.
+
+    Args:
+        years (np.ndarray): The years of the matrix columns.
+        matrix (np.ndarray): The values, shape (groups, years), NaN where missing.
+
+    Returns:
+        dict: Arrays of length groups with 'slope' (per year), 'intercept', 'slope_se',
+              'p_value' (two sided t-test of slope = 0) and 'n_years'.
+    """
+    valid = ~np.isnan(matrix)
+    n = valid.sum(axis=1)
+    x = np.where(valid, years, 0.0)
+    y = np.where(valid, matrix, 0.0)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        x_mean = x.sum(axis=1) / n
+        y_mean = y.sum(axis=1) / n
+        dx = np.where(valid, years - x_mean[:, None], 0.0)
+        dy = np.where(valid, matrix - y_mean[:, None], 0.0)
+        sxx = (dx ** 2).sum(axis=1)
+        slope = (dx * dy).sum(axis=1) / sxx
+        intercept = y_mean - slope * x_mean
+
+        residuals = np.where(valid, dy - slope[:, None] * dx, 0.0)
+        dof = n - 2
+        residual_variance = (residuals ** 2).sum(axis=1) / dof
+        slope_se = np.sqrt(residual_variance / sxx)
+        t = slope / slope_se
+
+    enough = dof >= 1
+    p_value = t_test_p_value(np.where(enough, t, np.nan), np.where(enough, dof, 0))
+    # A perfect fit has no residual error: any slope is significant, a flat line is not
+    p_value = np.where(enough & (slope_se == 0), np.where(slope != 0, 0.0, 1.0), p_value)
+    return {
+        'slope': np.where(n >= 2, slope, np.nan),
+        'intercept': np.where(n >= 2, intercept, np.nan),
+        'slope_se': np.where(enough, slope_se, np.nan),
+        'p_value': p_value,
+        'n_years': n
+    }
+
+
+def series_statistics(df, group_column, value, line=None, moments=None, time_column='year'):
+    """
+    Computes the overlay statistics of every series of the main plot in one vectorized pass.
+
+    Args:
+        df (DataFrame): The filtered air quality data.
+        group_column (str): The column defining the series (e.g. 'who_region' or 'country_name').
+        value (str): The column with the values.
+        line (DataFrame, optional): The plotted values (groups x years) if they are not plain means,
+                                    trend and year-over-year change are then computed from them.
+        moments (DataFrame, optional): Mean, standard deviation and count per (group, year), see group_year_matrix().
+        time_column (str): 'year', or 'period' for a rollup of timestamped data. Trends are then
+                           fitted per year and the change is taken to the same period of the previous year.
+
+    Returns:
+        dict: 'standard_error' and 'yoy_change' as DataFrames (groups x years) and 'trend' as a
+              DataFrame indexed by group with the columns of trend_statistics() and 'significant'.
+    """
+    groups, years, mean, std, count = group_year_matrix(df, group_column, value, moments, time_column)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        standard_error = std / np.sqrt(count)
+
+    if line is not None:
+        mean = line.reindex(index=groups, columns=years).to_numpy(dtype=float)
+
+    # Change to the previous calendar year (or the same period of it), NaN if either is missing
+    if time_column == 'year':
+        x, previous = years, years - 1
+    else:
+        x, previous = decimal_years(years), (years - pd.DateOffset(years=1)).to_numpy()
+    position = np.searchsorted(np.asarray(years), previous)
+    found = position < len(years)
+    found[found] = np.asarray(years)[position[found]] == previous[found]
+    yoy_change = np.full_like(mean, np.nan)
+    yoy_change[:, found] = mean[:, found] - mean[:, position[found]]
+
+    trend = pd.DataFrame(trend_statistics(x, mean), index=groups)
+    trend['significant'] = trend['p_value'] < SIGNIFICANCE_LEVEL
+    return {
+        'standard_error': pd.DataFrame(standard_error, index=groups, columns=years),
+        'yoy_change': pd.DataFrame(yoy_change, index=groups, columns=years),
+        'trend': trend
+    }
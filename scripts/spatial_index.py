@@ -0,0 +1,201 @@
+"""
+spatial_index.py
+
+Spatial index over the station coordinates for nearest station and radius queries.
+The stations are stored as unit vectors on the sphere in a static KD-tree built with NumPy:
+the straight line (chord) distance between unit vectors grows monotonically with the great
+circle distance, so nearest neighbours in 3D are nearest neighbours on the earth, and the
+haversine distance in km follows directly from the chord length.
+"""
+
+import heapq
+
+import numpy as np
+
+EARTH_RADIUS_KM = 6371.0088
+
+
+def to_unit_vectors(latitude, longitude):
+    """
+    Converts coordinates in degrees to unit vectors on the sphere.
+
+    Args:
+        latitude (array-like): Latitudes in degrees.
+        longitude (array-like): Longitudes in degrees.
+
+    Returns:
+        np.ndarray: Array of shape (n, 3).
+    """
+    lat = np.radians(np.asarray(latitude, dtype=float))
+    lon = np.radians(np.asarray(longitude, dtype=float))
+    return np.column_stack([np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)])
+
+
+def chord_to_km(chord):
+    """
+    Converts chord lengths between unit vectors to great circle distances in km.
+    """
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.clip(np.asarray(chord) / 2, 0.0, 1.0))
+
+
+def km_to_chord(distance_km):
+    """
+    Converts great circle distances in km to chord lengths between unit vectors.
+    """
+    return 2 * np.sin(np.minimum(np.asarray(distance_km, dtype=float) / EARTH_RADIUS_KM, np.pi) / 2)
+
+
+class StationIndex:
+    """
+    A static KD-tree over station coordinates supporting k-nearest and radius queries
+    with great circle (haversine) distances.
+
+    Attributes:
+        points (np.ndarray): The stations as unit vectors, reordered so that every node covers a contiguous range.
+        order (np.ndarray): Position of every reordered point in the input arrays.
+        leaf_size (int): Maximum number of points in a leaf.
+
+    Methods:
+        query(latitude, longitude, k=5):
+            Returns the positions and distances of the k nearest stations.
+        query_radius(latitude, longitude, radius_km):
+            Returns the positions and distances of all stations within a radius.
+    """
+
+    def __init__(self, latitude, longitude, leaf_size=32):
+        """
+        Builds the tree. Stations with missing coordinates are left out.
+
+        Args:
+            latitude (array-like): Latitudes of the stations in degrees.
+            longitude (array-like): Longitudes of the stations in degrees.
+            leaf_size (int): Maximum number of points in a leaf.
+        """
+        points = to_unit_vectors(latitude, longitude)
+        valid = ~np.isnan(points).any(axis=1)
+        self.order = np.flatnonzero(valid)
+        self.points = points[valid]
+        self.leaf_size = leaf_size
+
+        # Nodes as parallel lists: point range, bounding box and children (-1 for leaves)
+        self._start, self._end, self._low, self._high, self._left, self._right = [], [], [], [], [], []
+        if len(self.points):
+            self._build(0, len(self.points))
+        self._low = np.array(self._low)
+        self._high = np.array(self._high)
+
+    def _build(self, start, end):
+        """
+        Recursively splits the points in [start, end) at the median of the widest dimension.
+
+        Returns:
+            int: The id of the created node.
+        """
+        node = len(self._start)
+        block = self.points[start:end]
+        low, high = block.min(axis=0), block.max(axis=0)
+        for values, item in ((self._start, start), (self._end, end), (self._low, low), (self._high, high),
+                             (self._left, -1), (self._right, -1)):
+            values.append(item)
+
+        if end - start > self.leaf_size:
+            dimension = int(np.argmax(high - low))
+            middle = (end - start) // 2
+            partition = np.argpartition(block[:, dimension], middle)
+            self.points[start:end] = block[partition]
+            self.order[start:end] = self.order[start:end][partition]
+            self._left[node] = self._build(start, start + middle)
+            self._right[node] = self._build(start + middle, end)
+        return node
+
+    def _box_distance(self, node, point):
+        """
+        Returns the squared distance from a point to the bounding box of a node (0 inside the box).
+        """
+        gap = np.maximum(self._low[node] - point, 0) + np.maximum(point - self._high[node], 0)
+        return float(gap @ gap)
+
+    def query(self, latitude, longitude, k=5):
+        """
+        Finds the k nearest stations of a coordinate.
+
+        Args:
+            latitude (float): Latitude in degrees.
+            longitude (float): Longitude in degrees.
+            k (int): Number of stations to return.
+
+        Returns:
+            tuple: Positions of the stations in the input arrays and their distances in km, nearest first.
+        """
+        if not len(self.points) or k < 1:
+            return np.empty(0, dtype=int), np.empty(0)
+        point = to_unit_vectors([latitude], [longitude])[0]
+        best_distance = np.empty(0)
+        best_index = np.empty(0, dtype=int)
+        bound = np.inf
+
+        # Best first traversal: visit nodes by the distance of their bounding box
+        heap = [(0.0, 0)]
+        while heap:
+            box_distance, node = heapq.heappop(heap)
+            if box_distance > bound:
+                break
+            if self._left[node] == -1:
+                start, end = self._start[node], self._end[node]
+                difference = self.points[start:end] - point
+                distance = np.einsum('ij,ij->i', difference, difference)
+                best_distance = np.concatenate([best_distance, distance])
+                best_index = np.concatenate([best_index, np.arange(start, end)])
+                if len(best_distance) > k:
+                    keep = np.argpartition(best_distance, k - 1)[:k]
+                    best_distance, best_index = best_distance[keep], best_index[keep]
+                if len(best_distance) == k:
+                    bound = best_distance.max()
+            else:
+                for child in (self._left[node], self._right[node]):
+                    child_distance = self._box_distance(child, point)
+                    if child_distance <= bound:
+                        heapq.heappush(heap, (child_distance, child))
+
+        nearest = np.argsort(best_distance)
+        return self.order[best_index[nearest]], chord_to_km(np.sqrt(best_distance[nearest]))
+
+    def query_radius(self, latitude, longitude, radius_km):
+        """
+        Finds all stations within a great circle distance of a coordinate.
+
+        Args:
+            latitude (float): Latitude in degrees.
+            longitude (float): Longitude in degrees.
+            radius_km (float): The radius in km.
+
+        Returns:
+            tuple: Positions of the stations in the input arrays and their distances in km, nearest first.
+        """
+        if not len(self.points):
+            return np.empty(0, dtype=int), np.empty(0)
+        point = to_unit_vectors([latitude], [longitude])[0]
+        limit = float(km_to_chord(radius_km)) ** 2
+        found_distance, found_index = [], []
+
+        stack = [0]
+        while stack:
+            node = stack.pop()
+            if self._box_distance(node, point) > limit:
+                continue
+            if self._left[node] == -1:
+                start, end = self._start[node], self._end[node]
+                difference = self.points[start:end] - point
+                distance = np.einsum('ij,ij->i', difference, difference)
+                inside = distance <= limit
+                found_distance.append(distance[inside])
+                found_index.append(np.arange(start, end)[inside])
+            else:
+                stack.extend((self._left[node], self._right[node]))
+
+        if not found_distance:
+            return np.empty(0, dtype=int), np.empty(0)
+        distance = np.concatenate(found_distance)
+        index = np.concatenate(found_index)
+        nearest = np.argsort(distance)
+        return self.order[index[nearest]], chord_to_km(np.sqrt(distance[nearest]))
@@ -0,0 +1,170 @@
+"""
+startup_report.py
+
+Measures how long the dashboard takes from a cold start until it can answer the first request.
+The report is split into an import time breakdown (collected with ``python -X importtime``)
+and the timings of the individual start up stages: loading the data, building the Dash app
+and serving the first page and the first callback.
+
+Usage:
+    python startup_report.py [--data PATH] [--sheet NAME] [--top N] [--json FILE]
+
+The JSON output can be stored per commit to track the time-to-first-request over time.
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+SCRIPT_DIRECTORY = Path(__file__).resolve().parent
+
+
+def import_time_breakdown(module='main'):
+    """
+    Imports a module in a fresh interpreter with ``-X importtime`` and parses the result.
+
+    Args:
+        module (str): The module to import, resolved relative to the scripts folder.
+
+    Returns:
+        list: One dictionary per imported module with the keys 'module', 'self_us',
+              'cumulative_us' and 'depth' (nesting level of the import), in import order.
+    """
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                            cwd=SCRIPT_DIRECTORY, capture_output=True, text=True, check=False)
+    entries = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        entries.append({
+            'module': name.strip(),
+            'self_us': int(self_us),
+            'cumulative_us': int(cumulative_us),
+            # importtime indents nested imports by two spaces per level
+            'depth': (len(name) - len(name.lstrip()) - 1) // 2
+        })
+    return entries
+
+
+def top_level_imports(entries, top=15):
+    """
+    Returns the most expensive top level imports (the packages the dashboard imports itself
+    or that are pulled in first), sorted by cumulative import time.
+
+    Args:
+        entries (list): Output of import_time_breakdown().
+        top (int): Number of entries to return.
+
+    Returns:
+        list: The `top` slowest entries with depth 0 or 1.
+    """
+    shallow = [entry for entry in entries if entry['depth'] <= 1]
+    return sorted(shallow, key=lambda entry: entry['cumulative_us'], reverse=True)[:top]
+
+
+def time_startup_stages(data_path, sheet_name):
+    """
+    Runs the start up of the dashboard in process and times each stage.
+
+    Args:
+        data_path (str): The path to the data file.
+        sheet_name (str): The sheet name in the Excel file.
+
+    Returns:
+        dict: Seconds spent per stage, in the order they run.
+    """
+    stages = {}
+    sys.path.insert(0, str(SCRIPT_DIRECTORY))
+
+    start = time.perf_counter()
+    import main
+    from data_manager import AirQualityData
+    from layout_manager import AirQualityLayout
+    from callback_manager import AirQualityCallbacks
+    from dash import Dash
+    import dash_bootstrap_components as dbc
+    stages['import_modules'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    data = AirQualityData(data_path, sheet_name)
+    stages['load_data'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    app = Dash(main.__name__, external_stylesheets=[dbc.themes.BOOTSTRAP])
+    AirQualityLayout(app, data)
+    callbacks = AirQualityCallbacks(app, data)
+    stages['build_app'] = time.perf_counter() - start
+
+    client = app.server.test_client()
+    start = time.perf_counter()
+    for url in ('/', '/_dash-layout', '/_dash-dependencies'):
+        client.get(url)
+    stages['first_page'] = time.perf_counter() - start
+
+    # The initial page load triggers the update callback with the layout defaults
+    start = time.perf_counter()
+    callbacks.update_graph('pm25_concentration', '', [2015, 2020], ['all'], 'Concentration')
+    stages['first_callback'] = time.perf_counter() - start
+
+    stages['time_to_first_request'] = sum(stages.values())
+    return stages
+
+
+def print_report(report):
+    """
+    Prints the start up report in a human readable form.
+
+    Args:
+        report (dict): The report created in main().
+    """
+    print(f"Cold import of main: {report['import_total_us'] / 1e6:.3f} s")
+    print(f"{'cumulative [ms]':>16} {'self [ms]':>10}  module")
+    for entry in report['slowest_imports']:
+        indent = '  ' * entry['depth']
+        print(f"{entry['cumulative_us'] / 1e3:16.1f} {entry['self_us'] / 1e3:10.1f}  {indent}{entry['module']}")
+    print()
+    for stage, seconds in report['stages'].items():
+        print(f"{stage:>22}: {seconds:8.3f} s")
+
+
+def main():
+    """
+    Parses the command line arguments, collects the report and prints or stores it.
+    """
+    parser = argparse.ArgumentParser(description='Report the start up time of the dashboard.')
+    parser.add_argument('--data', default=None, help='Path to the data file (defaults to the path used by main.py).')
+    parser.add_argument('--sheet', default='Update 2024 (V6.1)', help='Sheet name in the Excel file.')
+    parser.add_argument('--top', type=int, default=15, help='Number of slowest imports to list.')
+    parser.add_argument('--json', default=None, help='Write the report as JSON to this file.')
+    args = parser.parse_args()
+
+    entries = import_time_breakdown()
+    report = {
+        'python': platform.python_version(),
+        'import_total_us': sum(entry['self_us'] for entry in entries),
+        'slowest_imports': top_level_imports(entries, args.top),
+    }
+
+    sys.path.insert(0, str(SCRIPT_DIRECTORY))
+    data_path = args.data
+    if data_path is None:
+        cwd = os.getcwd()
+        from main import DATA_FILE_PATH
+        os.chdir(cwd)
+        data_path = DATA_FILE_PATH
+    report['stages'] = time_startup_stages(data_path, args.sheet)
+
+    print_report(report)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,215 @@
+"""
+temporal_rollups.py
+
+Multi-resolution rollups of timestamped measurements, e.g. the hourly readings of own sensor feeds.
+The readings are reduced to sums and counts per station and hour, and each coarser resolution
+(day, month, year) is rolled up from the one below. Sums and counts add up, so appending new
+readings only rolls up the new readings and adds them to the existing periods; the raw readings
+are never reread. The chart picks the coarsest rollup that still fills its width, so long time
+spans are drawn from a few monthly values instead of millions of hourly ones.
+"""
+
+import numpy as np
+import pandas as pd
+
+# Column of the time of a measurement in timestamped sources
+TIMESTAMP_COLUMN = 'timestamp'
+
+# Resolutions from the finest to the coarsest, with the NumPy datetime unit periods are floored to
+RESOLUTIONS = {
+    'hour': 'h',
+    'day': 'D',
+    'month': 'M',
+    'year': 'Y'
+}
+
+# Names of the resolutions in the dashboard
+RESOLUTION_LABELS = {
+    'hour': 'Hourly',
+    'day': 'Daily',
+    'month': 'Monthly',
+    'year': 'Yearly'
+}
+
+# Maximum number of periods per year of every resolution
+PERIODS_PER_YEAR = {
+    'hour': 8784,
+    'day': 366,
+    'month': 12,
+    'year': 1
+}
+
+# A station is identified by its coordinates (see datahandling.DUPLICATE_KEYS)
+STATION_KEYS = ['city', 'latitude', 'longitude']
+
+
+def floor_periods(timestamps, resolution):
+    """
+    Floors timestamps to the start of their period.
+
+    Args:
+        timestamps (array-like): The timestamps (datetime64).
+        resolution (str): One of the keys of RESOLUTIONS.
+
+    Returns:
+        np.ndarray: The period starts as datetime64[ns].
+    """
+    values = np.asarray(timestamps, dtype='datetime64[ns]')
+    return values.astype(f'datetime64[{RESOLUTIONS[resolution]}]').astype('datetime64[ns]')
+
+
+def decimal_years(periods):
+    """
+    Converts period starts to fractional years, e.g. 1 July 2020 to about 2020.5, so that trends
+    over periods are fitted per year.
+
+    Args:
+        periods (array-like): The period starts (datetime64).
+
+    Returns:
+        np.ndarray: The fractional years.
+    """
+    periods = pd.DatetimeIndex(periods)
+    start = pd.to_datetime(periods.year.astype(str), format='%Y')
+    seconds_in_year = np.where(periods.is_leap_year, 366.0, 365.0) * 86400
+    return periods.year.to_numpy(dtype=float) + (periods - start).total_seconds().to_numpy() / seconds_in_year
+
+
+def choose_resolution(first_year, last_year, max_points):
+    """
+    Picks the finest resolution whose number of periods in a span of years does not exceed
+    max_points, i.e. the coarsest rollup that still has a value for every point of the chart.
+
+    Args:
+        first_year (int): The first year of the span.
+        last_year (int): The last year of the span.
+        max_points (int): The maximum number of points per series.
+
+    Returns:
+        str: One of the keys of RESOLUTIONS, 'year' if even the yearly series is longer.
+    """
+    n_years = max(int(last_year) - int(first_year) + 1, 1)
+    for resolution in RESOLUTIONS:
+        if n_years * PERIODS_PER_YEAR[resolution] <= max_points:
+            return resolution
+    return 'year'
+
+
+class MeasurementRollups:
+    """
+    Sums and counts of timestamped measurements per station and period at every resolution.
+
+    Attributes:
+        values: The measurement columns rolled up.
+        stations: A DataFrame with the attributes (region, country, city, station type, ...) of every
+                  station, indexed by the station id used in the rollups.
+        levels: A dictionary mapping every resolution to its sums and counts, two DataFrames indexed
+                by (station, period) with one column per measurement.
+
+    Methods:
+        append(measurements):
+            Adds new measurements to every resolution.
+        means(resolution):
+            Returns the mean of every measurement per station and period, with the station attributes.
+    """
+
+    def __init__(self, measurements, values):
+        """
+        Rolls up measurements to every resolution.
+
+        Args:
+            measurements (DataFrame): Validated measurements with a 'timestamp' column, the station
+                                      attributes and the measurement columns.
+            values (list): The measurement columns to roll up.
+        """
+        self.values = [value for value in values if value in measurements.columns]
+        attributes = [column for column in measurements.columns
+                      if column not in self.values + [TIMESTAMP_COLUMN, 'year', 'quality_flag']]
+        self.stations = pd.DataFrame(columns=attributes)
+        empty = pd.DataFrame({value: pd.Series(dtype=float) for value in self.values},
+                             index=pd.MultiIndex.from_arrays([pd.Index([], dtype=np.int64),
+                                                              pd.DatetimeIndex([])], names=['station', 'period']))
+        self.levels = {resolution: (empty, empty.astype(np.int64)) for resolution in RESOLUTIONS}
+        self._means = {}
+        self.append(measurements)
+
+    def _station_ids(self, measurements):
+        """
+        Returns the station id of every measurement, registering stations not seen before.
+        """
+        keys = [key for key in STATION_KEYS if key in measurements.columns]
+        known = self.stations[keys]
+        # Known stations come first, so with sort=False they keep their ids and new stations get the next ones
+        ids = pd.concat([known, measurements[keys]], ignore_index=True).groupby(
+            keys, dropna=False, sort=False, observed=True).ngroup().to_numpy()
+        station_ids = ids[len(known):]
+
+        new = station_ids >= len(known)
+        if new.any():
+            first_rows = pd.Series(np.flatnonzero(new)).groupby(station_ids[new]).first()
+            added = measurements.iloc[first_rows.to_numpy()][self.stations.columns]
+            added.index = first_rows.index
+            self.stations = pd.concat([self.stations, added]) if len(self.stations) else added
+        return station_ids
+
+    def _roll_up(self, sums, counts, resolution):
+        """
+        Reduces sums and counts per (station, period) to the periods of a coarser resolution.
+        """
+        periods = floor_periods(sums.index.get_level_values('period'), resolution)
+        keys = [sums.index.get_level_values('station'), pd.DatetimeIndex(periods, name='period')]
+        return sums.groupby(keys).sum(), counts.groupby(keys).sum()
+
+    def append(self, measurements):
+        """
+        Adds new measurements to every resolution. Only the new measurements are rolled up; their
+        sums and counts are then added to the periods they fall into.
+
+        Args:
+            measurements (DataFrame): Validated measurements, see __init__().
+        """
+        if measurements.empty:
+            return
+        station_ids = self._station_ids(measurements)
+        present = measurements[self.values].notna()
+        keys = [pd.Index(station_ids, name='station'),
+                pd.DatetimeIndex(floor_periods(measurements[TIMESTAMP_COLUMN], 'hour'), name='period')]
+        sums = measurements[self.values].fillna(0.0).groupby(keys).sum()
+        counts = present.astype(np.int64).groupby(keys).sum()
+
+        for resolution in RESOLUTIONS:
+            if resolution != 'hour':
+                sums, counts = self._roll_up(sums, counts, resolution)
+            level_sums, level_counts = self.levels[resolution]
+            if len(level_sums):
+                sums_total = level_sums.add(sums, fill_value=0.0)
+                counts_total = level_counts.add(counts, fill_value=0).astype(np.int64)
+            else:
+                sums_total, counts_total = sums, counts
+            self.levels[resolution] = (sums_total, counts_total)
+        self._means = {}
+
+    def means(self, resolution):
+        """
+        Returns the mean of every measurement per station and period, in the layout of the WHO
+        spreadsheet with an added 'period' column. The result is cached until new measurements are appended.
+
+        Args:
+            resolution (str): One of the keys of RESOLUTIONS.
+
+        Returns:
+            DataFrame: One row per station and period with the station attributes, 'year', 'period'
+                       and the means, NaN for measurements without readings in the period.
+        """
+        if resolution not in self._means:
+            sums, counts = self.levels[resolution]
+            with np.errstate(invalid='ignore', divide='ignore'):
+                means = sums / counts.where(counts > 0)
+            station_ids = means.index.get_level_values('station')
+            periods = means.index.get_level_values('period')
+            frame = self.stations.loc[station_ids].reset_index(drop=True)
+            frame['year'] = periods.year.to_numpy(dtype=float)
+            frame['period'] = periods.to_numpy()
+            frame[self.values] = means.to_numpy()
+            self._means[resolution] = frame
+        return self._means[resolution]
@@ -0,0 +1,62 @@
+import os
+import sys
+import unittest
+
+import numpy as np
+import pandas as pd
+
+script_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'scripts'))
+sys.path.append(script_path)
+
+from aggregation import aggregate, available_modes
+from query_backend import filter_rows
+
+class TestAggregation(unittest.TestCase):
+    def setUp(self):
+        # Bern has three stations in 2020, Basel one
+        self.df = pd.DataFrame({
+            'country_name': ['CH', 'CH', 'CH', 'CH'],
+            'city': ['Bern', 'Bern', 'Bern', 'Basel'],
+            'year': [2020, 2020, 2020, 2020],
+            'population': [100.0, 100.0, 100.0, 300.0],
+            'pm25_concentration': [10.0, 10.0, 10.0, 30.0],
+        })
+
+    def test_modes(self):
+        by = ['country_name', 'year']
+        self.assertEqual(aggregate(self.df, by, 'pm25_concentration', 'mean').iloc[0, 0], 15.0)
+        self.assertEqual(aggregate(self.df, by, 'pm25_concentration', 'station_weighted').iloc[0, 0], 20.0)
+        self.assertEqual(aggregate(self.df, by, 'pm25_concentration', 'population_weighted').iloc[0, 0], 20.0)
+        self.assertEqual(aggregate(self.df, by, 'pm25_concentration', 'median').iloc[0, 0], 10.0)
+        band = aggregate(self.df, by, 'pm25_concentration', 'percentile')
+        self.assertEqual(list(band.columns), ['pm25_concentration', 'lower', 'upper'])
+        self.assertEqual(band['upper'].iloc[0], 15.0)
+
+    def test_station_weights_of_selection(self):
+        # Bern has an urban and a rural station in 2020, Basel an urban one
+        df = pd.DataFrame({
+            'who_region': ['4_Eur'] * 3,
+            'city': ['Bern', 'Bern', 'Basel'],
+            'year': [2020, 2020, 2020],
+            'type_of_stations': ['Urban', 'Rural', 'Urban'],
+            'pm25_concentration': [10.0, 30.0, 20.0],
+        })
+        by = ['who_region', 'year']
+        self.assertEqual(aggregate(df, by, 'pm25_concentration', 'station_weighted').iloc[0, 0], 20.0)
+        # Only the urban station of Bern is selected, so it counts fully
+        urban = filter_rows(df, [2020, 2020], ['Urban'])
+        self.assertEqual(aggregate(urban, by, 'pm25_concentration', 'station_weighted').iloc[0, 0], 15.0)
+        # A station without a value does not take a share of its city's weight
+        df.loc[1, 'pm25_concentration'] = np.nan
+        self.assertEqual(aggregate(df, by, 'pm25_concentration', 'station_weighted').iloc[0, 0], 15.0)
+
+    def test_missing_values_and_modes(self):
+        df = self.df.copy()
+        df.loc[3, 'pm25_concentration'] = np.nan
+        result = aggregate(df, ['city'], 'pm25_concentration', 'station_weighted')
+        self.assertTrue(np.isnan(result.loc['Basel', 'pm25_concentration']))
+        self.assertNotIn('population_weighted', available_modes(df.drop(columns='population')))
+        self.assertRaises(ValueError, aggregate, df, ['city'], 'pm25_concentration', 'mode')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+import os
+import sys
+import unittest
+
+import numpy as np
+import pandas as pd
+
+script_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'scripts'))
+sys.path.append(script_path)
+
+from anomaly_detection import detect_anomalies, robust_z_scores, top_anomalies
+
+def sample_data():
+    years = np.arange(2010, 2020)
+    # Bern drifts slowly and jumps in 2016, Lima has too few years to be scored
+    wiggle = np.array([0.0, 0.3, -0.2, 0.4, -0.1, 0.2, 0.0, -0.3, 0.1, 0.2])
+    bern = 10 + 0.5 * (years - 2010) + wiggle + np.where(years == 2016, 20.0, 0.0)
+    rows = [('4_Eur', 'Switzerland', 'Bern', year, value) for year, value in zip(years, bern)]
+    rows += [('4_Eur', 'Switzerland', 'Bern', year, value + 2) for year, value in zip(years, bern)]
+    rows += [('2_Amr', 'Peru', 'Lima', year, 30.0 + year % 2) for year in [2015, 2016, 2018]]
+    df = pd.DataFrame(rows, columns=['who_region', 'country_name', 'city', 'year', 'pm25_concentration'])
+    df['year'] = df['year'].astype(float)
+    return df
+
+class TestAnomalyDetection(unittest.TestCase):
+    def test_robust_z_scores(self):
+        matrix = np.array([[1.0, 2.0, 3.0, 4.0, 5.0, 15.0], [1.0, 2.0, np.nan, 4.0, 5.0, 6.0]])
+        changes, scores = robust_z_scores(matrix)
+        self.assertTrue(np.isnan(changes[0, 0]))
+        self.assertEqual(changes[0, 5], 10.0)
+        # Constant changes besides the jump have no spread: no score
+        self.assertTrue(np.isnan(scores[0]).all())
+        # Too few changes next to the missing year
+        self.assertTrue(np.isnan(scores[1]).all())
+
+        matrix = np.array([[0.0, 1.0, 3.0, 4.0, 6.0, 7.0, 30.0]])
+        changes, scores = robust_z_scores(matrix)
+        self.assertEqual(np.nanargmax(scores[0]), 6)
+        self.assertGreater(scores[0, 6], 3.5)
+
+    def test_detect_anomalies(self):
+        table = detect_anomalies(sample_data(), workers=1)
+        bern = table[table['city'] == 'Bern'].set_index('year')
+        self.assertEqual(len(bern), 10)
+        self.assertEqual(bern.loc[2016, 'value'], 34.0)
+        self.assertEqual(bern.loc[2016, 'records'], 2)
+        # WHO 2021 guideline of PM2.5: 5 ug/m3
+        self.assertEqual(bern.loc[2016, 'records_above_guideline'], 2)
+        self.assertAlmostEqual(bern.loc[2016, 'guideline_ratio'], 34.0 / 5)
+        self.assertTrue(table.loc[table['city'] == 'Lima', 'robust_z'].isna().all())
+
+        top = top_anomalies(table, 'pm25_concentration', ['all', 'all'], n=5, threshold=3.5)
+        self.assertEqual(list(top['year']), [2017.0, 2016.0])
+        self.assertEqual(len(top_anomalies(table, 'pm25_concentration', [2010, 2015])), 0)
+        self.assertEqual(len(top_anomalies(table, 'pm25_concentration', ['all', 'all'], '2_Amr')), 0)
+
+    def test_process_pool_matches(self):
+        df = sample_data()
+        expected = detect_anomalies(df, workers=1)
+        result = detect_anomalies(df, workers=2, parallel_min_rows=1)
+        order = ['pollutant', 'city', 'year']
+        pd.testing.assert_frame_equal(result.sort_values(order).reset_index(drop=True),
+                                      expected.sort_values(order).reset_index(drop=True))
+
+if __name__ == '__main__':
+    unittest.main()
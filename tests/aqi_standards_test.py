@@ -0,0 +1,34 @@
+import os
+import sys
+import unittest
+
+import numpy as np
+
+script_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'scripts'))
+sys.path.append(script_path)
+
+from aqi_standards import load_standards, get_standard, aqi_column
+
+class TestAqiStandards(unittest.TestCase):
+    def test_registry(self):
+        self.assertEqual(set(load_standards()), {'us_epa', 'eu_caqi', 'in_naqi', 'who_2021'})
+        self.assertRaises(ValueError, get_standard, 'unknown')
+
+    def test_compute(self):
+        standard = get_standard('eu_caqi')
+        np.testing.assert_array_equal(standard.compute('pm10', [10, 50, 1000, np.nan]), [10, 50, 100, np.nan])
+        self.assertRaises(ValueError, standard.compute, 'o3', [1.0])
+
+    def test_categorize(self):
+        standard = get_standard('us_epa')
+        codes = standard.categorize([0, 50, 51, 250, 500, np.nan])
+        self.assertEqual(codes.dtype, np.int8)
+        self.assertEqual(codes.tolist(), [0, 0, 1, 4, 5, -1])
+        self.assertEqual(list(standard.colors[codes[:-1]]), ['green', 'green', 'yellow', 'purple', 'maroon'])
+
+    def test_aqi_column(self):
+        self.assertEqual(aqi_column('pm25_concentration'), 'pm25_aqi')
+        self.assertEqual(aqi_column('no2', 'who_2021'), 'no2_aqi_who_2021')
+
+if __name__ == '__main__':
+    unittest.main()
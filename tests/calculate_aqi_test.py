@@ -5,7 +5,7 @@ import unittest
 script_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'scripts'))
 sys.path.append(script_path)
 
-from datahandling import calculate_aqi
+from datahandling import NO_DATA_MESSAGE, assign_aqi_message, calculate_aqi
 
 class TestAqi(unittest.TestCase):
     def test_calculate_aqi(self):
@@ -14,6 +14,11 @@ class TestAqi(unittest.TestCase):
         self.assertEqual(calculate_aqi("pm25",[-22]),[0],"Should be [0]")
         self.assertEqual(calculate_aqi("pm10",[177]),[112],"Should be [112]")
 
+    def test_assign_aqi_message(self):
+        self.assertEqual(assign_aqi_message(42), ('good', 'green'))
+        self.assertEqual(assign_aqi_message(float('nan')), NO_DATA_MESSAGE)
+        self.assertEqual(assign_aqi_message(None), NO_DATA_MESSAGE)
+
     def test_input_value(self):
         self.assertRaises(TypeError,calculate_aqi,222,[78,217])
         self.assertRaises(TypeError,calculate_aqi,"pm25",78)
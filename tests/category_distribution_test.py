@@ -0,0 +1,70 @@
+import os
+import sys
+import unittest
+
+import numpy as np
+import pandas as pd
+
+script_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'scripts'))
+sys.path.append(script_path)
+
+from aqi_standards import category_column
+from category_distribution import category_distribution, category_histograms, create_distribution_figure
+from data_manager import AirQualityData
+
+def sample_data():
+    rows = [
+        # who_region, country_name, city, year, pm25
+        ('4_Eur', 'Switzerland', 'Bern', 2019, 5.0),
+        ('4_Eur', 'Switzerland', 'Bern', 2019, 20.0),
+        ('4_Eur', 'Switzerland', 'Basel', 2020, 40.0),
+        ('4_Eur', 'Germany', 'Berlin', 2020, 5.0),
+        ('2_Amr', 'Peru', 'Lima', 2019, np.nan),
+        ('2_Amr', 'Peru', 'Lima', 2020, 300.0),
+    ]
+    df = pd.DataFrame(rows, columns=['who_region', 'country_name', 'city', 'year', 'pm25_concentration'])
+    df['iso3'] = df['country_name'].str[:3].str.upper()
+    df['type_of_stations'] = 'Urban'
+    # Every row is another station
+    df['latitude'] = np.arange(len(df), dtype=float)
+    df['longitude'] = 0.0
+    for column in ['pm10_concentration', 'no2_concentration']:
+        df[column] = df['pm25_concentration']
+    # Lima 2019 only measured NO2
+    df.loc[4, 'no2_concentration'] = 10.0
+    return AirQualityData.from_dataframe(df)
+
+class TestCategoryDistribution(unittest.TestCase):
+    def setUp(self):
+        self.data = sample_data()
+        self.column = category_column('pm25', 'us_epa')
+
+    def test_category_columns(self):
+        self.assertEqual(self.data.df[self.column].dtype, np.int8)
+        # US EPA AQI of PM2.5: 5 -> Good, 20 -> Moderate, 40 -> Unhealthy for sensitive groups, 300 -> Hazardous
+        self.assertEqual(self.data.df.sort_values('pm25_concentration')[self.column].tolist(), [0, 0, 1, 2, 5, -1])
+
+    def test_histograms(self):
+        histograms = category_histograms(self.data.df)
+        self.assertEqual(histograms.values.dtype, np.int32)
+        bern = histograms.loc[(self.column, '4_Eur', 'Switzerland', 2019)]
+        self.assertEqual(bern.tolist(), [1, 1, 0, 0, 0, 0])
+        # Groups without a value are left out
+        self.assertNotIn((self.column, '2_Amr', 'Peru', 2019), histograms.index)
+        self.assertEqual(histograms.xs(self.column, level='column').values.sum(), 5)
+
+    def test_distribution(self):
+        histograms = self.data.category_histograms
+        europe = category_distribution(histograms, self.column, ['all', 'all'], '4_Eur')
+        self.assertEqual(europe.loc[2020].tolist(), [1, 0, 1, 0, 0, 0])
+        countries = category_distribution(histograms, self.column, [2020, 2020], '', by='country_name')
+        self.assertEqual(countries.loc['Peru'].tolist(), [0, 0, 0, 0, 0, 1])
+        self.assertTrue(category_distribution(histograms, 'o3_aqi_category', ['all', 'all']).empty)
+
+        figure = create_distribution_figure(europe, self.data.aqi_standards['us_epa'], 'Distribution')
+        self.assertEqual(len(figure.data), 6)
+        self.assertEqual(list(figure.data[0].x), [2019, 2020])
+        np.testing.assert_allclose(figure.data[0].y, [0.5, 0.5])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+import os
+import sys
+import unittest
+
+import numpy as np
+import pandas as pd
+
+script_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'scripts'))
+sys.path.append(script_path)
+
+from choropleth import simplify_ring
+from data_manager import AirQualityData
+from query_backend import filter_rows
+
+def segment_distance(points, start, end):
+    """
+    Distance of every point to the segment from start to end.
+    """
+    direction = end - start
+    length = np.dot(direction, direction)
+    t = np.zeros(len(points)) if length == 0 else np.clip((points - start) @ direction / length, 0, 1)
+    return np.hypot(*(points - (start + t[:, None] * direction)).T)
+
+class TestSimplifyRing(unittest.TestCase):
+    def setUp(self):
+        # A closed, slightly noisy circle
+        rng = np.random.default_rng(0)
+        angles = np.linspace(0, 2 * np.pi, 200)
+        radius = 10 + rng.uniform(-0.01, 0.01, len(angles))
+        self.ring = np.column_stack([radius * np.cos(angles), radius * np.sin(angles)])
+        self.ring[-1] = self.ring[0]
+
+    def test_endpoints_kept(self):
+        simplified = simplify_ring(self.ring, 0.1)
+        self.assertLess(len(simplified), len(self.ring))
+        np.testing.assert_array_equal(simplified[0], self.ring[0])
+        np.testing.assert_array_equal(simplified[-1], self.ring[-1])
+
+    def test_tolerance(self):
+        for tolerance in [0.01, 0.1, 1.0]:
+            simplified = simplify_ring(self.ring, tolerance)
+            # Every point of the ring lies within the tolerance of the simplified outline
+            distances = np.min([segment_distance(self.ring, start, end)
+                                for start, end in zip(simplified[:-1], simplified[1:])], axis=0)
+            self.assertLessEqual(distances.max(), tolerance + 1e-12)
+
+    def test_small_rings_unchanged(self):
+        triangle = np.array([[0.0, 0.0], [1.0, 0.0], [0.0, 1.0], [0.0, 0.0]])
+        np.testing.assert_array_equal(simplify_ring(triangle, 10.0), triangle)
+        np.testing.assert_array_equal(simplify_ring(triangle[:3], 10.0), triangle[:3])
+        # A ring that would collapse to fewer than 4 points is kept as it is
+        sliver = np.array([[0.0, 0.0], [1.0, 0.001], [2.0, 0.0], [1.0, -0.001], [0.0, 0.0]])
+        np.testing.assert_array_equal(simplify_ring(sliver, 0.1), sliver)
+
+class TestCountryAggregates(unittest.TestCase):
+    def setUp(self):
+        rows = [
+            # country_name, iso3, city, year, type_of_stations, pm25, latitude
+            ('Switzerland', 'CHE', 'Bern', 2019, 'Urban', 10.0, 46.95),
+            ('Switzerland', 'CHE', 'Bern', 2020, 'Urban', 12.0, 46.95),
+            ('Switzerland', 'CHE', 'Basel', 2020, 'Traffic', 20.0, 47.56),
+            ('Germany', 'DEU', 'Berlin', 2020, 'Traffic', 30.0, 52.52),
+            ('Germany', 'DEU', 'Berlin', 2021, 'Traffic', np.nan, 52.52),
+            ('Peru', 'PER', 'Lima', 2021, 'Rural', 40.0, -12.05),
+        ]
+        df = pd.DataFrame(rows, columns=['country_name', 'iso3', 'city', 'year', 'type_of_stations',
+                                         'pm25_concentration', 'latitude'])
+        df['who_region'] = np.where(df['iso3'] == 'PER', '2_Amr', '4_Eur')
+        df['longitude'] = 0.0
+        df['pm10_concentration'] = df['pm25_concentration']
+        df['no2_concentration'] = df['pm25_concentration']
+        self.data = AirQualityData.from_dataframe(df)
+
+    def test_matches_groupby(self):
+        for selection in [(['all', 'all'], ['all'], ''), ([2020, 2020], ['Traffic'], ''), ([2019, 2021], ['all'], '4_Eur')]:
+            expected = filter_rows(self.data.df, *selection).groupby('iso3', observed=True)['pm25_concentration'].mean()
+            result = self.data.country_aggregates('pm25_concentration', *selection)
+            pd.testing.assert_series_equal(result, expected.dropna(), check_names=False, check_index_type=False,
+                                           check_categorical=False)
+
+    def test_memoised_per_selection(self):
+        first = self.data.country_aggregates('pm25_concentration', [2020, 2020], ['all'])
+        self.assertIs(self.data.country_aggregates('pm25_concentration', [2020, 2020], ['all']), first)
+        self.assertEqual(self.data._country_aggregates.cache_info().hits, 1)
+        other = self.data.country_aggregates('pm25_concentration', [2019, 2020], ['all'])
+        self.assertIsNot(other, first)
+        self.assertEqual(self.data._country_aggregates.cache_info().misses, 2)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+import os
+import sys
+import unittest
+
+import numpy as np
+import pandas as pd
+
+script_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'scripts'))
+sys.path.append(script_path)
+
+from clientside_series import ARRAY_TYPES, decode_array, series_payload, station_type_masks
+from data_manager import AirQualityData
+
+def sample_data():
+    rows = [
+        # who_region, country_name, city, year, type_of_stations, pm25, population
+        ('4_Eur', 'Switzerland', 'Bern', 2019, 'Urban', 10.0, 100.0),
+        ('4_Eur', 'Switzerland', 'Bern', 2019, 'Urban, Traffic', 16.0, 100.0),
+        ('4_Eur', 'Switzerland', 'Bern', 2020, 'Urban', 40.0, 100.0),
+        ('4_Eur', 'Switzerland', 'Basel', 2020, 'Suburban', 20.0, 300.0),
+        ('4_Eur', 'Germany', 'Berlin', 2020, 'Traffic', 30.0, 500.0),
+        ('4_Eur', 'Germany', 'Berlin', 2021, np.nan, 25.0, 500.0),
+        ('2_Amr', 'Peru', 'Lima', 2020, 'Rural', np.nan, 900.0),
+        ('2_Amr', 'Peru', 'Lima', 2021, 'Rural', 60.0, 900.0),
+    ]
+    df = pd.DataFrame(rows, columns=['who_region', 'country_name', 'city', 'year', 'type_of_stations',
+                                     'pm25_concentration', 'population'])
+    df['iso3'] = df['country_name'].str[:3].str.upper()
+    df['latitude'] = 0.0
+    df['longitude'] = 0.0
+    for column in ['pm10_concentration', 'no2_concentration']:
+        df[column] = df['pm25_concentration']
+    return AirQualityData.from_dataframe(df)
+
+def recombine(payload, selected_year, selected_station_types):
+    """
+    Sums the cells of a payload the way the browser does and returns the value per (group, year).
+    """
+    cells = pd.DataFrame({name: decode_array(array['data'], ARRAY_TYPES[name][0])
+                          for name, array in payload['arrays'].items()})
+    selected = cells['year'].between(*selected_year)
+    if 'all' not in selected_station_types:
+        bits = sum(1 << payload['station_types'].index(key) for key in selected_station_types)
+        selected &= (cells['mask'] & bits) != 0
+    sums = cells[selected].groupby(['group', 'year']).sum()
+    sums = sums[sums['count'] > 0]
+    if payload['aggregation'] == 'mean':
+        values = sums['sum'] / sums['count']
+    else:
+        values = sums['weighted_sum'] / sums['weight']
+    return {(payload['groups'][group], int(year)): value for (group, year), value in values.items()}
+
+class TestClientsideSeries(unittest.TestCase):
+    def setUp(self):
+        self.data = sample_data()
+        self.keys = [key for key in self.data.station_type if key != 'all']
+
+    def test_station_type_masks(self):
+        masks = station_type_masks(pd.Series(['Urban', 'Urban, Traffic', np.nan]), ['Urban', 'Traffic'])
+        self.assertEqual(list(masks), [1, 3, 0])
+
+    def test_matches_server_aggregation(self):
+        for mode in ['mean', 'population_weighted']:
+            for types in [['all'], ['Urban'], ['Traffic', 'Rural']]:
+                for continent, group_column in [('', 'who_region'), ('4_Eur', 'country_name')]:
+                    payload = series_payload(self.data.df, 'pm25_concentration', group_column, self.keys,
+                                             continent, mode)
+                    expected = self.data.query.aggregate([2019, 2021], types, continent, [group_column, 'year'],
+                                                         'pm25_concentration', mode)['pm25_concentration'].dropna()
+                    result = recombine(payload, [2019, 2021], types)
+                    self.assertEqual(set(result), {(group, int(year)) for group, year in expected.index})
+                    for (group, year), value in expected.items():
+                        self.assertAlmostEqual(result[(group, int(year))], value)
+
+    def test_unsupported_mode(self):
+        with self.assertRaises(ValueError):
+            series_payload(self.data.df, 'pm25_concentration', 'who_region', self.keys, '', 'median')
+        with self.assertRaises(ValueError):
+            series_payload(self.data.df, 'pm25_concentration', 'who_region', self.keys, '', 'station_weighted')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+import os
+import sys
+import unittest
+
+import numpy as np
+import pandas as pd
+
+script_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'scripts'))
+sys.path.append(script_path)
+
+from comparison import GroupIndex, compare_groups, create_comparison_figure
+from data_manager import AirQualityData
+
+def sample_data():
+    rows = [
+        # who_region, country_name, city, year, type_of_stations, pm25, latitude, longitude
+        ('4_Eur', 'Switzerland', 'Bern', 2019, 'Urban', 10.0, 46.95, 7.45),
+        ('4_Eur', 'Switzerland', 'Bern', 2020, 'Urban', 40.0, 46.95, 7.45),
+        ('4_Eur', 'Switzerland', 'Basel', 2020, 'Suburban', 20.0, 47.56, 7.59),
+        ('4_Eur', 'Germany', 'Berlin', 2020, 'Traffic', 30.0, 52.52, 13.40),
+        ('4_Eur', 'Germany', 'Berlin', 2021, 'Traffic', 25.0, 52.52, 13.40),
+        ('2_Amr', 'Peru', 'Lima', 2020, 'Rural', np.nan, -12.05, -77.04),
+        ('2_Amr', 'Peru', 'Lima', 2021, 'Rural', 60.0, -12.05, -77.04),
+    ]
+    df = pd.DataFrame(rows, columns=['who_region', 'country_name', 'city', 'year', 'type_of_stations',
+                                     'pm25_concentration', 'latitude', 'longitude'])
+    df['iso3'] = df['country_name'].str[:3].str.upper()
+    for column in ['pm10_concentration', 'no2_concentration']:
+        df[column] = df['pm25_concentration']
+    return AirQualityData.from_dataframe(df)
+
+class TestComparison(unittest.TestCase):
+    def setUp(self):
+        self.data = sample_data()
+
+    def test_group_index(self):
+        index = GroupIndex(self.data.df['city'])
+        positions = index.positions(['Lima', 'Atlantis', 'Bern'])
+        self.assertEqual(list(self.data.df['city'].iloc[positions]), ['Lima', 'Bern', 'Bern'])
+        self.assertEqual(len(index.positions(['Atlantis'])), 0)
+
+    def test_compare_cities(self):
+        comparison = compare_groups(self.data, 'city', ['Lima', 'Bern', 'Lima'], 'pm25_concentration',
+                                    ['all', 'all'], ['all'])
+        self.assertEqual(list(comparison['series'].index), ['Lima', 'Bern'])
+        self.assertEqual(comparison['series'].loc['Bern', 2020], 40.0)
+        # Ranked worldwide: Lima (60), Berlin (27.5), Bern (25), Basel (20)
+        self.assertEqual(list(comparison['ranks']['rank']), [1.0, 3.0])
+        self.assertEqual(comparison['ranks']['ranked'].iloc[0], 4)
+        # Every compared city has one category share per station-year with a value
+        np.testing.assert_allclose(comparison['distribution'].sum(axis=1), [1.0, 1.0])
+        self.assertEqual(comparison['distribution'].loc['Bern'].max(), 0.5)
+
+        figure = create_comparison_figure(comparison, self.data.aqi_standards['us_epa'], 'Comparison', 'PM2.5')
+        self.assertEqual(figure.data[0].name, 'Lima (#1 of 4)')
+
+    def test_ranking_cached_per_selection(self):
+        compare_groups(self.data, 'city', ['Lima'], 'pm25_concentration', ['all', 'all'], ['all'])
+        comparison = compare_groups(self.data, 'city', ['Basel', 'Berlin'], 'pm25_concentration', ['all', 'all'], ['all'])
+        # Other compared cities of the same selection reuse the ranking of all cities
+        self.assertEqual(self.data._group_rankings.cache_info().hits, 1)
+        self.assertEqual(list(comparison['ranks']['rank']), [4.0, 2.0])
+        compare_groups(self.data, 'city', ['Basel'], 'pm25_concentration', [2020, 2020], ['all'])
+        self.assertEqual(self.data._group_rankings.cache_info().misses, 2)
+
+    def test_compare_countries_with_filters(self):
+        comparison = compare_groups(self.data, 'country_name', ['Switzerland', 'Peru'], 'pm25_concentration',
+                                    [2020, 2020], ['Urban', 'Rural'], 'AQI')
+        self.assertEqual(list(comparison['series'].columns), [2020])
+        # Peru has no value in 2020 and is not ranked
+        self.assertTrue(np.isnan(comparison['ranks'].loc['Peru', 'rank']))
+        self.assertTrue(comparison['distribution'].loc['Peru'].isna().all())
+        self.assertEqual(comparison['ranks'].loc['Switzerland', 'rank'], 1.0)
+
+if __name__ == '__main__':
+    unittest.main()
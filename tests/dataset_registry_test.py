@@ -0,0 +1,75 @@
+import os
+import sys
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+script_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'scripts'))
+sys.path.append(script_path)
+
+from datahandling import normalize_columns
+from data_manager import DatasetRegistry
+
+def monitoring_export(offset):
+    """
+    A small export with human readable column names instead of the columns of the WHO sheet.
+    """
+    return pd.DataFrame({
+        'WHO Region': ['Europe', 'European Region', '4_Eur'],
+        'Country': ['Switzerland'] * 3,
+        'ISO3': ['CHE'] * 3,
+        'City': ['Bern', 'Basel', 'Zurich'],
+        'Measurement Year': [2020, 2021, 2022],
+        'PM2.5 (μg/m3)': np.array([10.0, 12.0, 8.0]) + offset,
+        'Latitude': [46.95, 47.56, 47.37],
+        'Longitude': [7.45, 7.59, 8.54],
+    })
+
+class TestNormalizeColumns(unittest.TestCase):
+    def test_aliases(self):
+        df = normalize_columns(monitoring_export(0))
+        self.assertIn('pm25_concentration', df.columns)
+        self.assertIn('country_name', df.columns)
+        self.assertEqual(df['who_region'].tolist(), ['4_Eur'] * 3)
+        # Columns the source does not have are added empty
+        self.assertTrue(df['no2_concentration'].isna().all())
+        self.assertTrue(df['type_of_stations'].isna().all())
+
+class TestDatasetRegistry(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.registry = DatasetRegistry(max_resident=1, use_cache=False)
+        for offset in range(3):
+            path = os.path.join(self.folder.name, f'export_{offset}.csv')
+            monitoring_export(offset).to_csv(path, index=False)
+            self.registry.register(path, key=f'export_{offset}')
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    def test_lazy_loading_and_eviction(self):
+        self.assertEqual(self.registry.resident(), [])
+        first = self.registry.get()
+        self.assertEqual(self.registry.resident(), ['export_0'])
+        self.assertAlmostEqual(first.df['pm25_concentration'].mean(), 10.0)
+        self.assertIs(self.registry.get('export_0'), first)
+
+        second = self.registry.get('export_2')
+        self.assertEqual(self.registry.resident(), ['export_0', 'export_2'])
+        self.assertAlmostEqual(second.df['pm25_concentration'].mean(), 12.0)
+        self.assertEqual(len(second.filter_data(['all', 'all'], ['all'], '4_Eur')), 3)
+
+        # Only the datasets besides the default one are released, and finished loads leave no lock behind
+        self.registry.get('export_1')
+        self.assertEqual(self.registry.resident(), ['export_0', 'export_1'])
+        self.assertIs(self.registry.get(), first)
+        self.assertEqual(self.registry._loading, {})
+
+    def test_unknown_dataset(self):
+        with self.assertRaises(KeyError):
+            self.registry.get('missing')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+import gzip
+import importlib.util
+import io
+import os
+import sys
+import unittest
+from urllib.parse import parse_qsl, urlsplit
+
+import numpy as np
+import pandas as pd
+
+script_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'scripts'))
+sys.path.append(script_path)
+
+from data_manager import AirQualityData
+from export import export_file, export_url, parse_export_request
+
+def sample_data():
+    rng = np.random.default_rng(0)
+    n = 120
+    df = pd.DataFrame({
+        'who_region': np.where(np.arange(n) % 3 == 0, '2_Amr', '4_Eur'),
+        'iso3': 'CHE',
+        'country_name': 'Switzerland',
+        'city': [f'City {i % 15}' for i in range(n)],
+        'year': 2010 + np.arange(n) % 8,
+        'type_of_stations': np.where(np.arange(n) % 2 == 0, 'Urban', 'Rural'),
+        'pm25_concentration': rng.uniform(5, 40, n),
+        'pm10_concentration': rng.uniform(5, 60, n),
+        'no2_concentration': rng.uniform(5, 50, n),
+        'latitude': rng.uniform(45, 48, n),
+        'longitude': rng.uniform(6, 10, n),
+    })
+    return AirQualityData.from_dataframe(df)
+
+def read(data, **parameters):
+    filename, mimetype, chunks = export_file(data, **parameters)
+    return filename, mimetype, list(chunks)
+
+class TestExport(unittest.TestCase):
+    def setUp(self):
+        self.data = sample_data()
+        self.selection = dict(selected_continent='4_Eur', selected_year=[2012, 2015], selected_station_types=['Urban'])
+
+    def test_rows_in_chunks(self):
+        expected = self.data.filter_data([2012, 2015], ['Urban'], '4_Eur')
+        filename, mimetype, chunks = read(self.data, chunk_rows=7, **self.selection)
+        self.assertGreater(len(chunks), 1)
+        self.assertTrue(filename.endswith('.csv'))
+        exported = pd.read_csv(io.BytesIO(b''.join(chunks)))
+        self.assertEqual(len(exported), len(expected))
+        np.testing.assert_allclose(exported['pm25_concentration'], expected['pm25_concentration'])
+
+        filename, mimetype, chunks = read(self.data, compression='gzip', chunk_rows=7, **self.selection)
+        self.assertEqual(mimetype, 'application/gzip')
+        self.assertEqual(len(pd.read_csv(io.BytesIO(gzip.decompress(b''.join(chunks))))), len(expected))
+
+    @unittest.skipIf(importlib.util.find_spec('pyarrow') is None, 'pyarrow is not installed')
+    def test_parquet(self):
+        expected = self.data.filter_data([2012, 2015], ['Urban'], '4_Eur')
+        _, _, chunks = read(self.data, file_format='parquet', chunk_rows=7, **self.selection)
+        exported = pd.read_parquet(io.BytesIO(b''.join(chunks)))
+        self.assertEqual(len(exported), len(expected))
+
+    def test_series_and_rankings(self):
+        _, _, chunks = read(self.data, table='rankings', selected_aggregation='median', **self.selection)
+        ranking = pd.read_csv(io.BytesIO(b''.join(chunks)))
+        self.assertEqual(list(ranking.columns), ['rank', 'city', 'pm25_concentration'])
+        self.assertTrue(ranking['pm25_concentration'].is_monotonic_decreasing)
+
+        _, _, chunks = read(self.data, table='series', selected_data_type='AQI', selected_standard='eu_caqi',
+                            **self.selection)
+        series = pd.read_csv(io.BytesIO(b''.join(chunks)))
+        self.assertEqual(list(series.columns), ['country_name', 'year', 'pm25_aqi_eu_caqi'])
+        # Urban stations only report in even years
+        self.assertEqual(sorted(series['year']), [2012, 2014])
+
+    def test_request_parameters(self):
+        url = export_url('pm10_concentration', '4_Eur', [2012, 2015], ['Urban', 'Rural'], 'AQI', 'us_epa', 'mean',
+                         'series', 'xlsx', 'gzip')
+        parameters = parse_export_request(dict(parse_qsl(urlsplit(url).query)))
+        self.assertEqual(parameters['selected_year'], [2012, 2015])
+        self.assertEqual(parameters['selected_station_types'], ['Urban', 'Rural'])
+        self.assertEqual(parameters['compression'], 'gzip')
+        self.assertRaises(ValueError, parse_export_request, {'format': 'pdf'})
+        self.assertRaises(ValueError, parse_export_request, {'from': 'last year'})
+        self.assertRaises(ValueError, export_file, self.data, selected_pollutant='o3_concentration')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,114 @@
+import importlib.util
+import os
+import sys
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+script_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'scripts'))
+sys.path.append(script_path)
+
+from data_manager import AirQualityData
+from query_backend import DuckDBBackend, create_backend
+
+def sample_data():
+    rows = [
+        # who_region, country_name, city, year, type_of_stations, pm25, latitude, longitude
+        ('4_Eur', 'Switzerland', 'Bern', 2019, 'Urban', 10.0, 46.95, 7.45),
+        ('4_Eur', 'Switzerland', 'Bern', 2020, 'Urban, Traffic', 12.0, 46.95, 7.45),
+        ('4_Eur', 'Switzerland', 'Basel', 2020, 'Suburban', 20.0, 47.56, 7.59),
+        ('4_Eur', 'Germany', 'Berlin', 2020, 'Traffic', 30.0, 52.52, 13.40),
+        ('4_Eur', 'Germany', 'Berlin', 2021, np.nan, 25.0, 52.52, 13.40),
+        ('2_Amr', 'Peru', 'Lima', 2020, 'Rural', np.nan, -12.05, -77.04),
+        ('2_Amr', 'Peru', 'Lima', 2021, 'Rural', 40.0, -12.05, -77.04),
+    ]
+    df = pd.DataFrame(rows, columns=['who_region', 'country_name', 'city', 'year', 'type_of_stations',
+                                     'pm25_concentration', 'latitude', 'longitude'])
+    df['iso3'] = df['country_name'].str[:3].str.upper()
+    for column in ['pm10_concentration', 'no2_concentration']:
+        df[column] = df['pm25_concentration']
+    return AirQualityData.from_dataframe(df)
+
+class TestQueryBackend(unittest.TestCase):
+    def setUp(self):
+        self.data = sample_data()
+
+    def test_pandas_backend(self):
+        result = self.data.query.aggregate([2020, 2020], ['all'], '4_Eur', ['country_name'], 'pm25_concentration')
+        self.assertEqual(result.loc['Switzerland', 'pm25_concentration'], 16.0)
+        # 'Urban' must not match 'Suburban'
+        result = self.data.query.aggregate(['all', 'all'], ['Urban'], '', ['city'], 'pm25_concentration')
+        self.assertEqual(list(result.index), ['Bern'])
+        moments = self.data.query.moments(['all', 'all'], ['all'], '', ['city'], 'pm25_concentration')
+        self.assertEqual(moments.loc['Lima', 'count'], 1)
+
+    def test_station_weights_of_selection(self):
+        # Bern has an urban, a rural and a traffic station without PM2.5 in 2020, Basel an urban one
+        df = pd.DataFrame({
+            'who_region': ['4_Eur'] * 4,
+            'country_name': ['Switzerland'] * 4,
+            'city': ['Bern', 'Bern', 'Bern', 'Basel'],
+            'year': [2020, 2020, 2020, 2020],
+            'type_of_stations': ['Urban', 'Rural', 'Traffic', 'Urban'],
+            'pm25_concentration': [10.0, 30.0, np.nan, 20.0],
+            'pm10_concentration': [10.0, 30.0, 50.0, 20.0],
+            'latitude': [46.95, 46.96, 46.97, 47.56],
+            'longitude': [7.45, 7.46, 7.47, 7.59],
+        })
+        df['no2_concentration'] = df['pm25_concentration']
+        data = AirQualityData.from_dataframe(df)
+        backends = [data.query]
+        if importlib.util.find_spec('duckdb') is not None:
+            backends.append(DuckDBBackend.from_dataframe(data.df))
+        for backend in backends:
+            for station_types, expected in [(['all'], 20.0), (['Urban'], 15.0), (['Urban', 'Traffic'], 15.0)]:
+                result = backend.aggregate([2020, 2020], station_types, '', ['who_region', 'year'],
+                                           'pm25_concentration', 'station_weighted')
+                self.assertAlmostEqual(result['pm25_concentration'].iloc[0], expected)
+            # Every station of Bern has PM10, so they share its weight
+            result = backend.aggregate([2020, 2020], ['all'], '', ['who_region', 'year'], 'pm10_concentration',
+                                       'station_weighted')
+            self.assertAlmostEqual(result['pm10_concentration'].iloc[0], 25.0)
+
+    def test_unknown_backend(self):
+        self.assertRaises(ValueError, create_backend, 'spreadsheet', self.data)
+
+    @unittest.skipIf(importlib.util.find_spec('duckdb') is None, 'duckdb is not installed')
+    def test_duckdb_matches_pandas(self):
+        duckdb_backend = DuckDBBackend.from_dataframe(self.data.df)
+        selections = [(['all', 'all'], ['all'], ''), ([2020, 2021], ['Urban', 'Traffic'], '4_Eur'),
+                      ([2019, 'all'], ['Rural'], '2_Amr'), (['all', 'all'], ['Industrial'], '')]
+        for selection in selections:
+            for by in [['who_region', 'year'], ['city'], ['latitude', 'longitude']]:
+                for mode in ['mean', 'median', 'percentile', 'station_weighted']:
+                    expected = self.data.query.aggregate(*selection, by, 'pm25_concentration', mode)
+                    result = duckdb_backend.aggregate(*selection, by, 'pm25_concentration', mode)
+                    pd.testing.assert_frame_equal(result.reset_index(drop=True), expected.reset_index(drop=True),
+                                                  check_dtype=False)
+                expected = self.data.query.moments(*selection, by, 'pm25_concentration')
+                result = duckdb_backend.moments(*selection, by, 'pm25_concentration')
+                pd.testing.assert_frame_equal(result.reset_index(drop=True), expected.reset_index(drop=True),
+                                              check_dtype=False)
+        self.assertRaises(ValueError, duckdb_backend.aggregate, ['all', 'all'], ['all'], '', ['city; --'],
+                          'pm25_concentration')
+
+    @unittest.skipIf(importlib.util.find_spec('duckdb') is None, 'duckdb is not installed')
+    def test_parquet_reused_for_same_version(self):
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, 'air_quality.parquet')
+            DuckDBBackend.from_dataframe(self.data.df, path, version="4:1.5")
+            self.assertEqual(DuckDBBackend.stored_version(path), "4:1.5")
+            # The same version queries the file as it is, another one writes it again
+            backend = DuckDBBackend.from_dataframe(self.data.df.head(2), path, version="4:1.5")
+            self.assertEqual(backend.aggregate(['all', 'all'], ['all'], '', ['city'], 'pm25_concentration')
+                             ['pm25_concentration'].count(), 4)
+            backend = DuckDBBackend.from_dataframe(self.data.df.head(2), path, version="4:2.5")
+            self.assertEqual(backend.aggregate(['all', 'all'], ['all'], '', ['city'], 'pm25_concentration')
+                             ['pm25_concentration'].count(), 1)
+            self.assertEqual(DuckDBBackend.stored_version(path), "4:2.5")
+            self.assertIsNone(DuckDBBackend.stored_version(os.path.join(folder, 'missing.parquet')))
+
+if __name__ == '__main__':
+    unittest.main()
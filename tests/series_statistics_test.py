@@ -0,0 +1,42 @@
+import os
+import sys
+import unittest
+
+import numpy as np
+import pandas as pd
+
+script_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'scripts'))
+sys.path.append(script_path)
+
+from series_statistics import t_test_p_value, trend_statistics, series_statistics
+
+class TestSeriesStatistics(unittest.TestCase):
+    def test_t_test_p_value(self):
+        # Reference values of the two sided t-test (scipy.stats.t.sf(t, dof) * 2)
+        p = t_test_p_value([1.0, 2.5, 4.0, 3.0], [2, 3, 4, 9])
+        np.testing.assert_allclose(p, [0.4226497, 0.0877066, 0.0161301, 0.0149564], rtol=1e-5)
+        self.assertTrue(np.isnan(t_test_p_value([np.nan], [3])[0]))
+
+    def test_trend(self):
+        years = np.arange(2010, 2016, dtype=float)
+        matrix = np.array([[1, 2, np.nan, 4.2, 5, 5.9],
+                           [3, 3, 3, 3, 3, 3],
+                           [np.nan] * 6])
+        trend = trend_statistics(years, matrix)
+        np.testing.assert_allclose(trend['slope'][:2], [0.9906977, 0.0], rtol=1e-6)
+        np.testing.assert_allclose(trend['p_value'][:2], [6.1176e-05, 1.0], rtol=1e-4)
+        self.assertEqual(trend['n_years'].tolist(), [5, 6, 0])
+        self.assertTrue(np.isnan(trend['slope'][2]))
+
+    def test_series_statistics(self):
+        df = pd.DataFrame({'country_name': ['A', 'A', 'A', 'A', 'B'],
+                           'year': [2020.0, 2020.0, 2021.0, 2021.0, 2021.0],
+                           'pm25_concentration': [10.0, 12.0, 14.0, 18.0, 5.0]})
+        statistics = series_statistics(df, 'country_name', 'pm25_concentration')
+        self.assertAlmostEqual(statistics['standard_error'].loc['A', 2020.0], 1.0)
+        self.assertAlmostEqual(statistics['yoy_change'].loc['A', 2021.0], 5.0)
+        self.assertTrue(np.isnan(statistics['yoy_change'].loc['B', 2021.0]))
+        self.assertAlmostEqual(statistics['trend'].loc['A', 'slope'], 5.0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,40 @@
+import os
+import sys
+import unittest
+
+import numpy as np
+
+script_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'scripts'))
+sys.path.append(script_path)
+
+from spatial_index import StationIndex, EARTH_RADIUS_KM
+
+def haversine(latitude, longitude, latitudes, longitudes):
+    lat1, lon1, lat2, lon2 = map(np.radians, (latitude, longitude, latitudes, longitudes))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+
+class TestStationIndex(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.latitude = rng.uniform(-90, 90, 2000)
+        self.longitude = rng.uniform(-180, 180, 2000)
+        self.latitude[3] = np.nan
+        self.index = StationIndex(self.latitude, self.longitude, leaf_size=16)
+
+    def test_query(self):
+        # Includes a query across the antimeridian
+        for latitude, longitude in [(46.9, 7.4), (-10.0, 179.9), (89.0, 0.0)]:
+            distances = np.nan_to_num(haversine(latitude, longitude, self.latitude, self.longitude), nan=np.inf)
+            positions, km = self.index.query(latitude, longitude, k=5)
+            self.assertEqual(positions.tolist(), np.argsort(distances)[:5].tolist())
+            np.testing.assert_allclose(km, np.sort(distances)[:5])
+
+    def test_query_radius(self):
+        distances = haversine(46.9, 7.4, self.latitude, self.longitude)
+        positions, km = self.index.query_radius(46.9, 7.4, 1000)
+        self.assertEqual(sorted(positions.tolist()), np.flatnonzero(distances <= 1000).tolist())
+        self.assertTrue(np.all(np.diff(km) >= 0))
+
+if __name__ == '__main__':
+    unittest.main()
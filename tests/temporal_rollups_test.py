@@ -0,0 +1,70 @@
+import os
+import sys
+import unittest
+
+import numpy as np
+import pandas as pd
+
+script_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'scripts'))
+sys.path.append(script_path)
+
+from data_manager import AirQualityData
+from temporal_rollups import choose_resolution, decimal_years
+
+def hourly_readings(start, periods, city='Bern', latitude=46.95, value=10.0):
+    timestamps = pd.date_range(start, periods=periods, freq='h')
+    return pd.DataFrame({
+        'Timestamp': timestamps,
+        'City': city,
+        'Country': 'Switzerland',
+        'ISO3': 'CHE',
+        'Region': 'Europe',
+        'Station Type': 'Urban',
+        'Latitude': latitude,
+        'Longitude': 7.45,
+        'PM2.5': value + np.arange(periods) % 2,
+    })
+
+class TestTemporalRollups(unittest.TestCase):
+    def setUp(self):
+        # Two days of hourly readings in 2020 and one in 2021, alternating between value and value + 1
+        self.readings = pd.concat([hourly_readings('2020-12-30', 48), hourly_readings('2021-06-01', 24, value=20.0),
+                                   hourly_readings('2020-12-30', 24, city='Basel', latitude=47.56)],
+                                  ignore_index=True)
+
+    def test_rollups(self):
+        data = AirQualityData.from_dataframe(self.readings)
+        # The yearly data has one row per station and year, like the WHO spreadsheet
+        yearly = data.df.set_index(['city', 'year'])['pm25_concentration']
+        self.assertEqual(len(yearly), 3)
+        self.assertEqual(yearly[('Bern', 2020.0)], 10.5)
+        self.assertEqual(yearly[('Bern', 2021.0)], 20.5)
+        self.assertEqual(data.df['who_region'].iloc[0], '4_Eur')
+
+        sums, counts = data.rollups.levels['day']
+        self.assertEqual(int(counts['pm25_concentration'].sum()), 96)
+        self.assertEqual(sums['pm25_concentration'].sum(), self.readings['PM2.5'].sum())
+        monthly = data.series_query('month').aggregate(['all', 'all'], ['all'], '', ['city', 'period'],
+                                                       'pm25_concentration')
+        self.assertEqual(len(monthly), 3)
+
+    def test_append_measurements(self):
+        data = AirQualityData.from_dataframe(self.readings.iloc[:50])
+        report = data.append_measurements(self.readings.iloc[50:])
+        self.assertEqual(report['rows_out'], len(self.readings) - 50)
+        full = AirQualityData.from_dataframe(self.readings)
+        pd.testing.assert_frame_equal(data.df, full.df)
+        for resolution in ['hour', 'day', 'month', 'year']:
+            pd.testing.assert_frame_equal(data.rollups.means(resolution), full.rollups.means(resolution))
+        yearly = AirQualityData.from_dataframe(full.df)
+        self.assertRaises(ValueError, yearly.append_measurements, self.readings)
+
+    def test_resolution(self):
+        self.assertEqual(choose_resolution(2022, 2022, 800), 'day')
+        self.assertEqual(choose_resolution(2013, 2022, 800), 'month')
+        self.assertEqual(choose_resolution(1900, 2022, 800), 'year')
+        self.assertEqual(AirQualityData.from_dataframe(self.readings).series_resolution([2020, 2021]), 'day')
+        np.testing.assert_allclose(decimal_years(pd.to_datetime(['2021-01-01 00:00', '2021-07-02 12:00'])), [2021.0, 2021.5])
+
+if __name__ == '__main__':
+    unittest.main()
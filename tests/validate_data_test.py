@@ -0,0 +1,64 @@
+import os
+import sys
+import unittest
+
+import numpy as np
+import pandas as pd
+
+script_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'scripts'))
+sys.path.append(script_path)
+
+from datahandling import validate_data
+
+class TestValidateData(unittest.TestCase):
+    def setUp(self):
+        self.df = pd.DataFrame({
+            'city': ['Bern', 'Bern', 'Basel', 'Zurich', 'Geneva', 'Lugano'],
+            'year': [2020, 2020, np.nan, 2021, 2021, 2021],
+            'latitude': [46.9, 46.9, 47.5, 95.0, 46.2, 46.0],
+            'longitude': [7.4, 7.4, 7.6, 8.5, 6.1, 8.9],
+            'pm10_concentration': [20.0, 20.0, 18.0, 15.0, np.nan, np.nan],
+            'pm25_concentration': [10.0, 10.0, 9.0, -3.0, 8.0, np.nan],
+            'no2_concentration': [25.0, 25.0, 30.0, 22.0, 19.0, np.nan],
+        })
+
+    def test_cleaning(self):
+        cleaned, report = validate_data(self.df)
+        # Duplicate Bern, Basel without year and Lugano without measurements are removed
+        self.assertEqual(cleaned['city'].tolist(), ['Bern', 'Zurich', 'Geneva'])
+        # Out of range latitude and negative concentration are blanked, not dropped
+        zurich = cleaned[cleaned['city'] == 'Zurich'].iloc[0]
+        self.assertTrue(np.isnan(zurich['latitude']))
+        self.assertTrue(np.isnan(zurich['pm25_concentration']))
+        self.assertEqual(zurich['pm10_concentration'], 15.0)
+
+    def test_report(self):
+        _, report = validate_data(self.df)
+        self.assertEqual(report['rows_in'], 6)
+        self.assertEqual(report['rows_out'], 3)
+        self.assertEqual(report['dropped_invalid'], 1)
+        self.assertEqual(report['dropped_empty'], 1)
+        self.assertEqual(report['dropped_duplicates'], 1)
+        self.assertEqual(report['columns']['pm25_concentration']['out_of_range'], 1)
+
+    def test_duplicates_without_coordinates(self):
+        df = pd.DataFrame({
+            'city': ['Bern', 'Bern', 'Bern'],
+            'year': [2020, 2020, 2020],
+            'latitude': [np.nan, np.nan, 46.9],
+            'longitude': [np.nan, np.nan, 7.4],
+            'pm25_concentration': [10.0, 12.0, 10.0],
+        })
+        cleaned, report = validate_data(df)
+        # Stations without coordinates cannot be told apart and are all kept
+        self.assertEqual(len(cleaned), 3)
+        self.assertEqual(report['dropped_duplicates'], 0)
+
+    def test_flag_and_unknown_action(self):
+        cleaned, report = validate_data(self.df, rules={'latitude': {'max': 90, 'invalid': 'flag'}})
+        self.assertEqual(report['flagged'], 1)
+        self.assertEqual(cleaned['quality_flag'].sum(), 1)
+        self.assertRaises(ValueError, validate_data, self.df, {'year': {'invalid': 'ignore'}})
+
+if __name__ == '__main__':
+    unittest.main()
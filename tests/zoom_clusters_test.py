@@ -0,0 +1,43 @@
+import os
+import sys
+import unittest
+
+import numpy as np
+
+script_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'scripts'))
+sys.path.append(script_path)
+
+from map import Map, compute_zoom_clusters
+
+class TestZoomClusters(unittest.TestCase):
+    def test_hierarchy(self):
+        rng = np.random.default_rng(0)
+        latitude = rng.uniform(-60, 70, 5000)
+        longitude = rng.uniform(-180, 180, 5000)
+        latitude[0] = np.nan
+        clusters = compute_zoom_clusters(latitude, longitude, max_zoom=8)
+        sizes = [len(clusters[zoom][2]) for zoom in sorted(clusters)]
+        # Every level keeps all stations and coarser levels have fewer clusters
+        for zoom in clusters:
+            self.assertEqual(sum(clusters[zoom][2]), 4999)
+        self.assertEqual(sizes, sorted(sizes))
+        self.assertEqual(len(set(sizes)), len(sizes))
+
+    def test_centroid(self):
+        clusters = compute_zoom_clusters([46.9, 47.1, -33.9], [7.4, 7.6, 18.4], max_zoom=4)
+        # The two nearby stations share a cell on every level, so only the coarsest level is kept
+        self.assertEqual(clusters, {0: [[47000, -33900], [7500, 18400], [2, 1]]})
+
+    def test_clusters_from_url(self):
+        # Clusters given as a URL are fetched by the layer instead of being embedded in the map
+        world_map = Map()
+        world_map.add_precomputed_clusters('/clusters/stations.json?dataset=default', show=False)
+        html = world_map.render()
+        self.assertIn('"/clusters/stations.json?dataset=default"', html)
+        self.assertNotIn('47000', html)
+        world_map = Map()
+        world_map.add_precomputed_clusters({0: [[47000], [7500], [2]]})
+        self.assertIn('{"0":[[47000],[7500],[2]]}', world_map.render())
+
+if __name__ == '__main__':
+    unittest.main()